@@ -0,0 +1,290 @@
+import concurrent.futures
+import importlib.util
+import itertools
+import os
+import time
+
+import plotly.graph_objects as go
+
+
+def start_renderer():
+    """ Start and warm up the image renderer of a worker process
+
+    Start the Kaleido renderer once in the worker process: with Kaleido >= 1.1, a persistent browser server (see
+    `kaleido.start_sync_server()`), then render a blank figure to pay the start-up cost before the first export. The
+    next images exported by the process reuse the same renderer.
+    """
+    import kaleido
+    import plotly.io as pio
+    start_server = getattr(kaleido, "start_sync_server", None)
+    if start_server is not None:
+        start_server()
+    pio.to_image(go.Figure(), format="png", width=10, height=10)
+
+
+def render_image(fig_json, file, format=None, width=None, height=None, scale=None):
+    """ Write a static image of a figure
+
+    Write the static image of a figure serialized in JSON in the file `file` with `plotly.io.write_image()`.
+
+    :parameter fig_json: Figure serialized in JSON
+    :type fig_json: str
+    :parameter file: Path of the output file
+    :type file: str
+    :parameter format: Image format ("png", "jpg", "webp", "svg", "pdf"), by default `None` (inferred from `file`)
+    :type format: str | None
+    :parameter width: Width of the image in pixels, by default `None` (figure layout or plotly default)
+    :type width: int | None
+    :parameter height: Height of the image in pixels, by default `None` (figure layout or plotly default)
+    :type height: int | None
+    :parameter scale: Scale factor of the image, by default `None` (1)
+    :type scale: int | float | None
+    """
+    import plotly.io as pio
+    pio.write_image(pio.from_json(fig_json, skip_invalid=True), file, format=format, width=width, height=height,
+                    scale=scale, validate=False)
+
+
+def timed_render(render_function, fig_json, file, param):
+    """ Render an image and measure the rendering time
+
+    :parameter render_function: Function writing the image, called with the parameters `fig_json`, `file` and
+        `param`
+    :type render_function: collections.abc.Callable
+    :parameter fig_json: Figure serialized in JSON
+    :type fig_json: str
+    :parameter file: Path of the output file
+    :type file: str
+    :parameter param: Dictionary of the image parameters (format, width, height, scale)
+    :type param: dict
+    :return: a dictionary with the rendering time in seconds ("render_time") and the worker process id ("worker")
+    """
+    start = time.perf_counter()
+    render_function(fig_json, file, **param)
+    return {"render_time": time.perf_counter() - start, "worker": os.getpid()}
+
+
+def match_length(figures, file):
+    """ Pair the figures and the output files
+
+    Same as `zip(figures, file)` but raises a ValueError if `figures` and `file` do not have the same length.
+
+    :parameter figures: List or iterable of figures
+    :type figures: list | collections.abc.Iterable
+    :parameter file: List or iterable of the output file paths
+    :type file: list | collections.abc.Iterable
+    :return: a generator of tuples (figure, file path)
+    """
+    missing = object()
+    for fig, file_path in itertools.zip_longest(figures, file, fillvalue=missing):
+        if fig is missing or file_path is missing:
+            raise ValueError("`figures` and `file` should have the same length")
+        yield fig, file_path
+
+
+class ImageExporter:
+    """ Batch static image exporter
+
+    Export the static images (PNG, SVG, etc.) of many figures with a pool of long-lived renderer processes:
+
+    - each worker process starts the renderer once (see `start_renderer()`) and exports all its images with it
+    - the figures are consumed from the input list or generator and serialized only when a worker is available
+      (at most `max_pending` figures waiting or rendering), the memory is bounded for any number of figures
+    - each worker writes its images directly in the output files, in parallel
+    - a failed image is rendered again up to `retry` times; if a worker process crashes, the pool is restarted and
+      the images in progress are rendered again (counted as a failed attempt). If the restarted pool is already
+      broken at the submission of an image (for example, the renderer cannot start), it is also counted as a failed
+      attempt of the image
+
+    Example:
+
+    ```
+        with ImageExporter(n_worker=4) as exporter:
+            report = exporter.export(figure_list, [f"thumbnail_{i}.png" for i in range(len(figure_list))],
+                                     width=400, height=300)
+    ```
+
+    :parameter n_worker: Number of renderer processes, by default `2`
+    :type n_worker: int
+    :parameter max_pending: Maximum number of figures waiting or rendering, by default `None` (`2 * n_worker`)
+    :type max_pending: int | None
+    :parameter retry: Number of new attempts for a failed image, by default `1`
+    :type retry: int
+    :parameter render_function: Function writing an image, called with the parameters: figure serialized in JSON,
+        file path, format, width, height and scale. By default, `None`: `render_image()` (Kaleido). Should be
+        importable by the worker processes (defined at the top level of a module)
+    :type render_function: collections.abc.Callable | None
+    :parameter warm_up: Boolean to start the renderer of each worker process at the pool start (see
+        `start_renderer()`), by default `None`: `True` if `render_function` is `None`
+    :type warm_up: bool | None
+    """
+
+    def __init__(self, n_worker=2, max_pending=None, retry=1, render_function=None, warm_up=None):
+        if render_function is None:
+            if importlib.util.find_spec("kaleido") is None:
+                raise ValueError("Static image export requires the `kaleido` package")
+            render_function = render_image
+        if warm_up is None:
+            warm_up = render_function is render_image
+        self.n_worker = n_worker
+        self.max_pending = 2 * n_worker if max_pending is None else max(max_pending, 1)
+        self.retry = retry
+        self.render_function = render_function
+        self.initializer = start_renderer if warm_up is True else None
+        self.executor = self.start_pool()
+
+    def start_pool(self):
+        """ Start the pool of renderer processes """
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.n_worker, initializer=self.initializer)
+
+    def export(self, figures, file, format=None, width=None, height=None, scale=None):
+        """ Export the static images of multiple figures
+
+        :parameter figures: List or iterable (for example a generator) of figures: plotly.graph_objs.Figure objects,
+            dictionaries or JSON strings
+        :type figures: list | collections.abc.Iterable
+        :parameter file: List or iterable of the output file paths, same order and length as `figures`
+        :type file: list | collections.abc.Iterable
+        :parameter format: Image format ("png", "jpg", "webp", "svg", "pdf"), by default `None` (inferred from the
+            file extension)
+        :type format: str | None
+        :parameter width: Width of the images in pixels, by default `None`
+        :type width: int | None
+        :parameter height: Height of the images in pixels, by default `None`
+        :type height: int | None
+        :parameter scale: Scale factor of the images, by default `None`
+        :type scale: int | float | None
+        :return: a list of dictionaries, one per figure in the input order, with the keys: "index", "file",
+            "attempt" (number of attempts), "render_time" (rendering time of the last attempt, in seconds),
+            "total_time" (time from the first submission to the end, in seconds), "worker" (process id) and
+            "error" (error message of the last attempt or `None`)
+        """
+        if hasattr(figures, "__len__") and hasattr(file, "__len__") and len(figures) != len(file):
+            raise ValueError("`figures` and `file` should have the same length")
+        param = dict(format=format, width=width, height=height, scale=scale)
+        report = dict()
+        pending = dict()
+        queue = list()
+        job_iter = enumerate(match_length(figures, file))
+        job_end = False
+        # Number of pool restarts since the last completed image
+        n_restart = 0
+
+        def restart():
+            # Worker process crash: restart the pool, the images in progress are lost
+            nonlocal n_restart
+            n_restart += 1
+            for future in pending:
+                future.cancel()
+            self.executor.shutdown(wait=False)
+            self.executor = self.start_pool()
+            for job in pending.values():
+                report[job[0]]["error"] = "BrokenProcessPool"
+                queue.append(job)
+            pending.clear()
+
+        def submit(job):
+            index, fig_json, file_path = job
+            try:
+                future = self.executor.submit(timed_render, self.render_function, fig_json, file_path, param)
+            except concurrent.futures.process.BrokenProcessPool:
+                # Crash detected at submission: the job was not started. Failed attempt if the pool was already
+                # restarted without completing any image
+                if n_restart > 0:
+                    report[index]["attempt"] += 1
+                report[index]["error"] = "BrokenProcessPool"
+                restart()
+                queue.append(job)
+                return
+            report[index]["attempt"] += 1
+            pending[future] = job
+
+        while pending or queue or not job_end:
+            # Retry
+            while queue and len(pending) < self.max_pending:
+                job = queue.pop(0)
+                if report[job[0]]["attempt"] <= self.retry:
+                    submit(job)
+                else:
+                    report[job[0]]["total_time"] = time.perf_counter() - report[job[0]]["start"]
+            # Fill the queue
+            while not job_end and not queue and len(pending) < self.max_pending:
+                next_job = next(job_iter, None)
+                if next_job is None:
+                    job_end = True
+                    break
+                index, (fig, file_path) = next_job
+                if isinstance(fig, go.Figure):
+                    fig_json = fig.to_json()
+                elif isinstance(fig, dict):
+                    fig_json = go.Figure(fig).to_json()
+                else:
+                    fig_json = fig
+                report[index] = {"index": index, "file": str(file_path), "attempt": 0, "render_time": None,
+                                 "total_time": None, "worker": None, "error": None, "start": time.perf_counter()}
+                submit((index, fig_json, file_path))
+            if not pending:
+                continue
+            done = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)[0]
+            broken = False
+            for future in done:
+                job = pending.pop(future)
+                try:
+                    report[job[0]].update(future.result(), error=None)
+                except concurrent.futures.process.BrokenProcessPool as error:
+                    broken = True
+                    report[job[0]]["error"] = repr(error)
+                    queue.append(job)
+                except Exception as error:
+                    n_restart = 0
+                    report[job[0]]["error"] = repr(error)
+                    queue.append(job)
+                else:
+                    n_restart = 0
+                    report[job[0]]["total_time"] = time.perf_counter() - report[job[0]]["start"]
+            if broken is True:
+                restart()
+        for index in report:
+            del report[index]["start"]
+        return [report[index] for index in sorted(report)]
+
+    def close(self, wait=True):
+        """ Shutdown the renderer processes
+
+        :parameter wait: Boolean to wait for the images in progress, by default `True`
+        :type wait: bool
+        """
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def export_images(figures, file, n_worker=2, retry=1, format=None, width=None, height=None, scale=None):
+    """ Export the static images of multiple figures
+
+    Export the images with a temporary `ImageExporter` (see for more information).
+
+    :parameter figures: List or iterable of figures: plotly.graph_objs.Figure objects, dictionaries or JSON strings
+    :type figures: list | collections.abc.Iterable
+    :parameter file: List or iterable of the output file paths, same order as `figures`
+    :type file: list | collections.abc.Iterable
+    :parameter n_worker: Number of renderer processes, by default `2`
+    :type n_worker: int
+    :parameter retry: Number of new attempts for a failed image, by default `1`
+    :type retry: int
+    :parameter format: Image format, by default `None` (inferred from the file extension)
+    :type format: str | None
+    :parameter width: Width of the images in pixels, by default `None`
+    :type width: int | None
+    :parameter height: Height of the images in pixels, by default `None`
+    :type height: int | None
+    :parameter scale: Scale factor of the images, by default `None`
+    :type scale: int | float | None
+    :return: a list of dictionaries, one per figure, see `ImageExporter.export()`
+    """
+    with ImageExporter(n_worker=n_worker, retry=retry) as exporter:
+        return exporter.export(figures, file, format=format, width=width, height=height, scale=scale)
@@ -1,14 +1,19 @@
+import re
 from datetime import timedelta
 
 import numpy as np
 import pandas as pd
+import plotly.graph_objects as go
 
-from SMHviz_plot.utils import *
+from SMHviz_plot.utils import add_facet_traces, color_line_trace, decimate_ratio_meta, fig_error_message, \
+    fill_hover_text, make_ens_button, make_palette_sequential, prep_subplot, ribbon_hover_template, \
+    subplot_fig_output, subplot_row_col
+from SMHviz_plot.utils_data import decimate_df, flatten_list, prep_heatmap_matrix
 
 
 def add_scatter_trace(fig, data, legend_name, x_col="time_value", y_col="value", width=2, connect_gaps=None,
                       mode="lines+markers", color="rgb(110, 110, 110)", show_legend=True, subplot_coord=None,
-                      hover_text="", line_width=0.0001, visible=True, dash=None, custom_data=None):
+                      hover_text="", line_width=0.0001, visible=True, dash=None, custom_data=None, meta=None):
     """ Add scatter trace to a Figure
 
     Add scatter trace on Figure object. By default, the hover text will be:
@@ -55,6 +60,9 @@ def add_scatter_trace(fig, data, legend_name, x_col="time_value", y_col="value",
     :type dash: str | None
     :parameter custom_data: Add custom data
     :type dash: str | None | pandas.DataFrame
+    :parameter meta: Trace meta information, for example the number of retained and input points of a decimated
+        trace (see `decimate_ratio_meta()`); by default `None`
+    :type meta: dict | None
     :return: a plotly.graph_objs.Figure object with an added trace
     """
     if subplot_coord is None:
@@ -69,11 +77,11 @@ def add_scatter_trace(fig, data, legend_name, x_col="time_value", y_col="value",
                              visible=visible,
                              showlegend=show_legend,
                              customdata=custom_data,
+                             connectgaps=connect_gaps,
+                             meta=meta,
                              hovertemplate=hover_text +
                              "Value: %{y:,.2f}<br>Epiweek: %{x|%Y-%m-%d}<extra></extra>"),
                   row=subplot_coord[0], col=subplot_coord[1])
-    if connect_gaps is not None:
-        fig.update_traces(connectgaps=connect_gaps)
     return fig
 
 
@@ -82,10 +90,11 @@ def add_bar_trace(fig, data, legend_name, x_col="time_value", y_col_max="max", y
                   subplot_coord=None, hover_text=""):
     """ Add scatter trace to a Figure
 
-    Add scatter trace on Figure object. By default, the hover text will be:
+    Add scatter trace on Figure object, with one vertical line from `y_col_min` to `y_col_max` per `x_col` value
+    (first row of each `x_col` value). By default, the hover text will be:
 
     ```
-        "Value: {value}"
+        "95% Interval: {min} - {max}"
 
         "Epiweek: {time_value}"
     ```
@@ -121,31 +130,30 @@ def add_bar_trace(fig, data, legend_name, x_col="time_value", y_col_max="max", y
     """
     if subplot_coord is None:
         subplot_coord = [None, None]
-    for x_date in data[x_col].unique():
-        if x_date == data[x_col].unique()[0]:
-            show_leg = show_legend
-        else:
-            show_leg = False
-        plot_data = data[data[x_col] == x_date]
-        fig.add_trace(go.Scatter(x=[x_date, x_date],
-                                 y=[plot_data[y_col_min][0], plot_data[y_col_max][0]],
-                                 name=legend_name,
-                                 mode=mode,
-                                 legendgroup=legend_name,
-                                 line=dict(width=width, color=color),
-                                 showlegend=show_leg,
-                                 hovertemplate=hover_text +
-                                 "95% Interval: " + str(plot_data[y_col_min][0]) + " - " +
-                                 str(plot_data[y_col_max][0]) + "<br>Epiweek: %{x|%Y-%m-%d}<extra></extra>"
-                                 ),
-                      row=subplot_coord[0], col=subplot_coord[1])
-    fig.update_traces(connectgaps=False)
+    # One vertical line per date in one trace (separated by missing values), with one hover template
+    plot_data = data.drop_duplicates(x_col)
+    y_min = plot_data[y_col_min].to_numpy(dtype=float)
+    y_max = plot_data[y_col_max].to_numpy(dtype=float)
+    hover_value = np.array([[str(i), str(j)] for i, j in zip(plot_data[y_col_min].tolist(),
+                                                            plot_data[y_col_max].tolist())], dtype=object)
+    fig.add_trace(go.Scatter(x=np.repeat(plot_data[x_col].to_numpy(), 3),
+                             y=np.stack([y_min, y_max, np.full(len(plot_data), np.nan)], axis=1).ravel(),
+                             customdata=np.repeat(hover_value, 3, axis=0).reshape(-1, 2),
+                             name=legend_name,
+                             mode=mode,
+                             legendgroup=legend_name,
+                             line=dict(width=width, color=color),
+                             showlegend=show_legend,
+                             connectgaps=False,
+                             hovertemplate=hover_text + "95% Interval: %{customdata[0]} - %{customdata[1]}"
+                                                        "<br>Epiweek: %{x|%Y-%m-%d}<extra></extra>"),
+                  row=subplot_coord[0], col=subplot_coord[1])
     return fig
 
 
 def ui_ribbons(fig, df_plot, quant_sel, legend_name, x_col="target_end_date", y_col="value", color=None,
                opacity=0.1, subplot_coord=None, hover_text="", line_width=0.001, rm_second_hover=False,
-               show_legend=False, special_hover=None):
+               show_legend=False, special_hover=None, connect_gaps=None):
     """ Add Intervals (ribbons) on Figure
 
     Add intervals information on Figure object. By default, the hover text will be:
@@ -191,6 +199,8 @@ def ui_ribbons(fig, df_plot, quant_sel, legend_name, x_col="target_end_date", y_
      and "second" indication the bottom and the top hover text of the ribbon, respectively. If not None will ignore
      all others "hover" parameters
     :type special_hover: dict | None
+    :parameter connect_gaps: Boolean to connect the gaps of the intervals, by default `None`
+    :type connect_gaps: bool | None
     :return: a plotly.graph_objs.Figure object with an added trace displaying intervals
     """
     # Prerequisite
@@ -200,39 +210,40 @@ def ui_ribbons(fig, df_plot, quant_sel, legend_name, x_col="target_end_date", y_
         color = "rgba(0, 0, 255, 1)"
     # Hover text
     if special_hover is None:
-        second_hover_text = "<extra></extra>"
-        if rm_second_hover is False:
-            second_hover_text = hover_text + str(round((quant_sel[1] - quant_sel[0]) * 100)) + \
-                                " % Interval: %{customdata:,.2f} - %{y:,.2f}<br>Epiweek: %{x|%Y-%m-%d}<extra></extra>"
-        first_hover_text = (hover_text + str(round((quant_sel[1] - quant_sel[0]) * 100)) +
-                            " % Interval: %{y:,.2f} - %{customdata:,.2f}<br>Epiweek: %{x|%Y-%m-%d}<extra></extra>")
+        first_hover_text, second_hover_text = ribbon_hover_template(hover_text, quant_sel[0], quant_sel[1],
+                                                                    rm_second_hover=rm_second_hover)
     else:
         second_hover_text = special_hover["second"]
         first_hover_text = special_hover["first"]
     # Intervals
-    fig.add_trace(go.Scatter(x=df_plot[df_plot["type_id"] == quant_sel[1]][x_col],
-                             y=df_plot[df_plot["type_id"] == quant_sel[1]][y_col],
-                             customdata=df_plot[df_plot["type_id"] == quant_sel[0]][y_col],
+    color_opacity = re.sub(", 1\)", ", " + str(opacity) + ")", color)
+    df_low = df_plot[df_plot["type_id"] == quant_sel[0]]
+    df_up = df_plot[df_plot["type_id"] == quant_sel[1]]
+    fig.add_trace(go.Scatter(x=df_up[x_col],
+                             y=df_up[y_col],
+                             customdata=df_low[y_col],
                              name=legend_name,
                              mode='lines',
                              line=dict(width=line_width),
-                             marker=dict(color=re.sub(", 1\)", ", " + str(opacity) + ")", color)),
+                             marker=dict(color=color_opacity),
                              legendgroup=legend_name,
                              showlegend=show_legend,
+                             connectgaps=connect_gaps,
                              hovertemplate=second_hover_text),
                   row=subplot_coord[0], col=subplot_coord[1])
     fig.add_trace(
-        go.Scatter(x=df_plot[df_plot["type_id"] == quant_sel[0]][x_col],
-                   y=df_plot[df_plot["type_id"] == quant_sel[0]][y_col],
-                   customdata=df_plot[df_plot["type_id"] == quant_sel[1]][y_col],
+        go.Scatter(x=df_low[x_col],
+                   y=df_low[y_col],
+                   customdata=df_up[y_col],
                    name=legend_name,
                    line=dict(width=line_width),
                    mode='lines',
-                   marker=dict(color=re.sub(", 1\)", ", " + str(opacity) + ")", color)),
+                   marker=dict(color=color_opacity),
                    legendgroup=legend_name,
                    showlegend=False,
-                   fillcolor=re.sub(", 1\)", ", " + str(opacity) + ")", color),
+                   fillcolor=color_opacity,
                    fill='tonexty',
+                   connectgaps=connect_gaps,
                    hovertemplate=first_hover_text),
         row=subplot_coord[0], col=subplot_coord[1])
     return fig
@@ -241,7 +252,7 @@ def ui_ribbons(fig, df_plot, quant_sel, legend_name, x_col="target_end_date", y_
 def make_proj_plot(fig_plot, proj_data, intervals=None, intervals_dict=None, x_col="target_end_date", y_col="value",
                    legend_col="model_name", legend_dict=None, line_width=2, color="rgba(0, 0, 255, 1)",
                    show_legend=True, point_value="median", opacity=0.1, connect_gaps=True, subplot_coord=None,
-                   hover_text=""):
+                   hover_text="", sort_x=True):
     """ Plot projection data on an existing Figure
 
     Plot projection data on an existing Figure for a specific tasks_id (scenario, target, location, model name, etc.)
@@ -290,6 +301,9 @@ def make_proj_plot(fig_plot, proj_data, intervals=None, intervals_dict=None, x_c
     :type subplot_coord: list | str
     :parameter hover_text: Appending text appearing on hover; by default, `""`
     :type hover_text: str
+    :parameter sort_x: Boolean to sort `proj_data` by `x_col`, can be set to `False` if `proj_data` is already sorted;
+        by default `True`
+    :type sort_x: bool
     :return: a plotly.graph_objs.Figure object with an added trace
     """
     # Prerequisite
@@ -305,7 +319,10 @@ def make_proj_plot(fig_plot, proj_data, intervals=None, intervals_dict=None, x_c
         full_model_name = "".join(list(proj_data[legend_col].unique()))
         proj_data_leg = proj_data.copy()
     # Order time value
-    df_trace = proj_data_leg.sort_values(x_col)
+    if sort_x is True:
+        df_trace = proj_data_leg.sort_values(x_col)
+    else:
+        df_trace = proj_data_leg
     # Figure add trace
     if point_value == "point":
         plot_df = df_trace[df_trace["type_id"].isna()]
@@ -314,11 +331,7 @@ def make_proj_plot(fig_plot, proj_data, intervals=None, intervals_dict=None, x_c
     else:
         plot_df = None
     # Plot
-    if len(re.findall("%{.+?}", hover_text)) > 0:
-        hover_value = proj_data_leg[re.sub("%{|}", "",
-                                           re.findall("%{.+?}", hover_text)[0])].unique()
-        hover_value = list(hover_value)[0]
-        hover_text = re.sub("%{.+?}", hover_value, hover_text)
+    hover_text = fill_hover_text(hover_text, proj_data_leg)
     # Lines
     if plot_df is not None:
         fig_plot = add_scatter_trace(fig_plot, plot_df, full_model_name, x_col=x_col, y_col=y_col,
@@ -331,9 +344,9 @@ def make_proj_plot(fig_plot, proj_data, intervals=None, intervals_dict=None, x_c
             quant_intervals = intervals_dict[intervals]
             fig_plot = ui_ribbons(fig_plot, df_trace, quant_intervals, full_model_name, x_col=x_col, y_col=y_col,
                                   color=color, opacity=opacity, subplot_coord=subplot_coord,
-                                  hover_text=hover_text)
+                                  hover_text=hover_text, connect_gaps=connect_gaps)
         elif len(intervals) > 1:
-            intervals.sort(reverse=True)
+            intervals = sorted(intervals, reverse=True)
             for i in range(0, len(intervals)):
                 if i is 0 and plot_df is None:
                     ui_show_legend = show_legend
@@ -342,7 +355,82 @@ def make_proj_plot(fig_plot, proj_data, intervals=None, intervals_dict=None, x_c
                 quant_intervals = intervals_dict[intervals[i]]
                 fig_plot = ui_ribbons(fig_plot, df_trace, quant_intervals, full_model_name, x_col=x_col,
                                       y_col=y_col, color=color, opacity=opacity, show_legend=ui_show_legend,
-                                      subplot_coord=subplot_coord, hover_text=hover_text)
+                                      subplot_coord=subplot_coord, hover_text=hover_text, connect_gaps=connect_gaps)
+    return fig_plot
+
+
+def add_scatter_facet(fig_plot, df_facet, truth_facet, intervals=None, intervals_dict=None, x_col="target_end_date",
+                      y_col="value", point_value="median", legend_col="model_name", truth_legend_name="Truth Data",
+                      legend_dict=None, x_truth_col="time_value", y_truth_col="value", truth_data_type="scatter",
+                      truth_mode="lines+markers", hover_text="", ensemble_name=None, ensemble_color=None,
+                      line_width=2, connect_gaps=True, color_dict=None, opacity=0.1, show_legend=True,
+                      subplot_coord=None, w_delay=None, sort_x=True, max_point=None, decimate_method="lttb"):
+    """Add the traces of one Scatter Plot facet
+
+    Add the truth data and projection traces of one subplot (or of the plot without subplots) of
+    `make_scatter_plot()` on a Figure. For more information on the parameters, please consult the
+    `make_scatter_plot()` documentation.
+
+    :parameter fig_plot: a Figure object to update
+    :type fig_plot: plotly.graph_objs.Figure
+    :parameter df_facet: Data frame containing the projection data of the facet
+    :type df_facet: pandas.DataFrame
+    :parameter truth_facet: Data frame containing the observed data of the facet, `None` for no observed data
+    :type truth_facet: pandas.DataFrame | None
+    :parameter show_legend: Boolean to show the legend; by default `True`
+    :type show_legend: bool
+    :parameter subplot_coord: For subplots, a list with 2 values: [row number, column number] indicating on which
+        subplots to add the traces. `None` for non subplots object (default)
+    :type subplot_coord: list | None
+    :return: a plotly.graph_objs.Figure object with the added traces
+    """
+    if truth_facet is not None:
+        if truth_data_type == "scatter":
+            if w_delay is not None:
+                # Dates parsed once for the two traces
+                truth_date = pd.to_datetime(truth_facet[x_truth_col])
+                truth_limit = truth_date.max() - timedelta(weeks=w_delay)
+                plot_truth_df = truth_facet[truth_date <= truth_limit]
+            else:
+                plot_truth_df = truth_facet
+            if max_point is not None:
+                n_point = len(plot_truth_df)
+                plot_truth_df = decimate_df(plot_truth_df, x_truth_col, y_truth_col, max_point,
+                                            method=decimate_method)
+                truth_meta = dict(decimate=[len(plot_truth_df), n_point])
+            else:
+                truth_meta = None
+            fig_plot = add_scatter_trace(fig_plot, plot_truth_df, truth_legend_name, show_legend=show_legend,
+                                         hover_text=truth_legend_name + "<br>", subplot_coord=subplot_coord,
+                                         x_col=x_truth_col, y_col=y_truth_col, width=line_width,
+                                         connect_gaps=connect_gaps, mode=truth_mode, meta=truth_meta)
+            if w_delay is not None:
+                plot_truth_df = truth_facet[truth_date > truth_limit]
+                fig_plot = add_scatter_trace(fig_plot, plot_truth_df, truth_legend_name,
+                                             show_legend=False, hover_text=truth_legend_name + "<br>",
+                                             subplot_coord=subplot_coord, x_col=x_truth_col, y_col=y_truth_col,
+                                             width=line_width, connect_gaps=connect_gaps, mode="markers",
+                                             color="rgb(200, 200, 200)", line_width=0.5)
+        elif truth_data_type == "bar":
+            fig_plot = add_bar_trace(fig_plot, truth_facet, truth_legend_name, show_legend=show_legend,
+                                     hover_text=truth_legend_name + "<br>", subplot_coord=subplot_coord,
+                                     x_col=x_truth_col)
+    list_mod = list(df_facet[legend_col].unique())
+    list_mod.sort()
+    if ensemble_name in list_mod:
+        list_mod.remove(ensemble_name)
+        list_mod.append(ensemble_name)
+    df_facet_mod = dict(list(df_facet.groupby(legend_col, sort=False)))
+    for mod_name in list_mod:
+        col_line = color_line_trace(color_dict, mod_name, ensemble_name=ensemble_name,
+                                    ensemble_color=ensemble_color, line_width=line_width)
+        # Figure add trace
+        fig_plot = make_proj_plot(fig_plot, df_facet_mod[mod_name], intervals=intervals,
+                                  intervals_dict=intervals_dict, x_col=x_col, y_col=y_col, legend_col=legend_col,
+                                  legend_dict=legend_dict, line_width=col_line[1], color=col_line[0],
+                                  show_legend=show_legend, point_value=point_value, opacity=opacity,
+                                  connect_gaps=connect_gaps, subplot_coord=subplot_coord, hover_text=hover_text,
+                                  sort_x=sort_x)
     return fig_plot
 
 
@@ -354,7 +442,8 @@ def make_scatter_plot(proj_data, truth_data, intervals=None, intervals_dict=None
                       hover_text="", ensemble_name=None, ensemble_color=None, ensemble_view=False, line_width=2,
                       connect_gaps=True, color_dict=None, opacity=0.1, palette="turbo", title="", subtitle="",
                       height=1000, theme="plotly_white", notes=None, button=True, button_opt="all", v_lines=None,
-                      h_lines=None, zoom_in_projection=None, specs=None, row_num=None, w_delay=None):
+                      h_lines=None, zoom_in_projection=None, specs=None, row_num=None, w_delay=None, sort_x=True,
+                      max_point=None, decimate_method="lttb", n_worker=None):
     """Create a Scatter Plot
 
     Create one plot for model projection output files. The function allows multiple view: adding truth data, projection
@@ -504,7 +593,19 @@ def make_scatter_plot(proj_data, truth_data, intervals=None, intervals_dict=None
     :parameter w_delay: For the truth data scatter plot, indicate a ending number of weeks to print in mode "markers"
       only . For example, if set to `4`, the last 4 weeks of the time series will be plotted in "markers" mode.
     :type w_delay: int | None
-    :return: a plotly.graph_objs.Figure object with model projection data
+    :parameter sort_x: Boolean to sort the projection of each `legend_col` value by `x_col`, can be set to `False` if
+        `proj_data` is already sorted; by default `True`
+    :type sort_x: bool
+    :parameter max_point: For the truth data scatter plot, maximum number of points to plot per trace (the last
+        `w_delay` weeks are not decimated), see `decimate_df()`. By default, `None` (all points plotted)
+    :type max_point: int | None
+    :parameter decimate_method: Decimation method used if `max_point` is not `None`: "lttb" (default) or "minmax"
+    :type decimate_method: str
+    :parameter n_worker: For plot with subplots, number of worker processes building the traces of each subplot in
+        parallel (see `add_facet_traces()`), by default `None` (no workers)
+    :type n_worker: int | None
+    :return: a plotly.graph_objs.Figure object with model projection data. If `max_point` is not `None`, the ratio of
+        retained truth data points is stored in `fig.layout.meta["decimate_ratio"]` (see `decimate_ratio_meta()`)
     """
     # Prerequisite
     # Figure preparation
@@ -525,8 +626,15 @@ def make_scatter_plot(proj_data, truth_data, intervals=None, intervals_dict=None
     if intervals is None:
         intervals = [0.95, 0.9, 0.8, 0.5]
     # Plot
+    facet_param = dict(intervals=intervals, intervals_dict=intervals_dict, x_col=x_col, y_col=y_col,
+                       point_value=point_value, legend_col=legend_col, truth_legend_name=truth_legend_name,
+                       legend_dict=legend_dict, x_truth_col=x_truth_col, y_truth_col=y_truth_col,
+                       truth_data_type=truth_data_type, truth_mode=truth_mode, hover_text=hover_text,
+                       ensemble_name=ensemble_name, ensemble_color=ensemble_color, line_width=line_width,
+                       connect_gaps=connect_gaps, color_dict=color_dict, opacity=opacity, w_delay=w_delay,
+                       sort_x=sort_x, max_point=max_point, decimate_method=decimate_method)
+    facet_list = list()
     # Figure with subplots
-    in_legend = list()
     if sub_var is not None:
         for var in sub_var:
             df_facet = proj_data[proj_data[subplot_var] == var]
@@ -537,100 +645,14 @@ def make_scatter_plot(proj_data, truth_data, intervals=None, intervals_dict=None
                     truth_facet = truth_data
             else:
                 truth_facet = None
-            subplot_coord = subplot_row_col(sub_var, var, row_num=row_num)
-            if var == sub_var[0]:
-                show_legend = True
-            else:
-                show_legend = False
-            if truth_facet is not None:
-                if truth_data_type is "scatter":
-                    if w_delay is not None:
-                        plot_truth_df = truth_facet[pd.to_datetime(truth_facet[x_truth_col]) <=
-                                                    (max(pd.to_datetime(truth_facet[x_truth_col])) -
-                                                     timedelta(weeks=w_delay))]
-                    else:
-                        plot_truth_df = truth_facet
-                    fig_plot = add_scatter_trace(fig_plot, plot_truth_df, truth_legend_name, show_legend=show_legend,
-                                                 hover_text=truth_legend_name + "<br>", subplot_coord=subplot_coord,
-                                                 x_col=x_truth_col, y_col=y_truth_col, width=line_width,
-                                                 connect_gaps=connect_gaps, mode=truth_mode)
-                    if w_delay is not None:
-                        plot_truth_df = truth_facet[pd.to_datetime(truth_facet[x_truth_col]) >
-                                                    (max(pd.to_datetime(truth_facet[x_truth_col])) -
-                                                     timedelta(weeks=w_delay))]
-                        fig_plot = add_scatter_trace(fig_plot, plot_truth_df, truth_legend_name,
-                                                     show_legend=False, hover_text=truth_legend_name + "<br>",
-                                                     subplot_coord=subplot_coord, x_col=x_truth_col, y_col=y_truth_col,
-                                                     width=line_width, connect_gaps=connect_gaps, mode="markers",
-                                                     color="rgb(200, 200, 200)", line_width=0.5)
-                elif truth_data_type is "bar":
-                    fig_plot = add_bar_trace(fig_plot, truth_facet, truth_legend_name, show_legend=show_legend,
-                                             hover_text=truth_legend_name + "<br>", subplot_coord=subplot_coord,
-                                             x_col=x_truth_col)
-                else:
-                    fig_plot = fig_plot
-            list_mod = list(df_facet[legend_col].unique())
-            list_mod.sort()
-            if ensemble_name in list_mod:
-                list_mod.remove(ensemble_name)
-                list_mod.append(ensemble_name)
-            for mod_name in list_mod:
-                df_facet_trace = df_facet[df_facet[legend_col] == mod_name]
-                col_line = color_line_trace(color_dict, mod_name, ensemble_name=ensemble_name,
-                                            ensemble_color=ensemble_color, line_width=line_width)
-                if (mod_name not in in_legend) and (len(df_facet_trace) > 0):
-                    in_legend.append(mod_name)
-                    show_legend = show_legend
-                else:
-                    show_legend = False
-                # Figure add trace
-                fig_plot = make_proj_plot(fig_plot, df_facet_trace, intervals=intervals, intervals_dict=intervals_dict,
-                                          x_col=x_col, y_col=y_col, legend_col=legend_col, legend_dict=legend_dict,
-                                          line_width=col_line[1], color=col_line[0], show_legend=show_legend,
-                                          point_value=point_value, opacity=opacity, connect_gaps=connect_gaps,
-                                          subplot_coord=subplot_coord, hover_text=hover_text)
+            facet_list.append([subplot_row_col(sub_var, var, row_num=row_num),
+                               dict(df_facet=df_facet, truth_facet=truth_facet, show_legend=bool(var == sub_var[0]),
+                                    **facet_param)])
     # Figure without subplots
     else:
-        fig_plot = fig_plot
-        if truth_data is not None:
-            if truth_data_type is "scatter":
-                if w_delay is not None:
-                    plot_truth_df = truth_data[pd.to_datetime(truth_data[x_truth_col]) <=
-                                               (max(pd.to_datetime(truth_data[x_truth_col])) -
-                                                timedelta(weeks=w_delay))]
-                else:
-                    plot_truth_df = truth_data
-                fig_plot = add_scatter_trace(fig_plot, plot_truth_df, truth_legend_name, x_col=x_truth_col,
-                                             hover_text=truth_legend_name + "<br>", y_col=y_truth_col, width=line_width,
-                                             connect_gaps=connect_gaps, mode=truth_mode)
-                if w_delay is not None:
-                    plot_truth_df = truth_data[pd.to_datetime(truth_data[x_truth_col]) >
-                                               (max(pd.to_datetime(truth_data[x_truth_col])) -
-                                                timedelta(weeks=w_delay))]
-                    fig_plot = add_scatter_trace(fig_plot, plot_truth_df, truth_legend_name, y_col=y_truth_col,
-                                                 hover_text=truth_legend_name + "<br>", x_col=x_truth_col,
-                                                 width=line_width, connect_gaps=connect_gaps, mode="markers",
-                                                 color="rgb(200, 200, 200)", show_legend=False, line_width=0.5)
-            elif truth_data_type is "bar":
-                fig_plot = add_bar_trace(fig_plot, truth_data, truth_legend_name,
-                                         hover_text=truth_legend_name + "<br>", x_col=x_truth_col)
-            else:
-                fig_plot = fig_plot
-        list_mod = list(proj_data[legend_col].unique())
-        list_mod.sort()
-        if ensemble_name in list_mod:
-            list_mod.remove(ensemble_name)
-            list_mod.append(ensemble_name)
-        for mod_name in list_mod:
-            df_trace = proj_data[proj_data[legend_col] == mod_name]
-            col_line = color_line_trace(color_dict, mod_name, ensemble_name=ensemble_name,
-                                        ensemble_color=ensemble_color, line_width=line_width)
-            # Figure add trace
-            fig_plot = make_proj_plot(fig_plot, df_trace, intervals=intervals, intervals_dict=intervals_dict,
-                                      x_col=x_col, y_col=y_col, legend_col=legend_col, legend_dict=legend_dict,
-                                      line_width=col_line[1], color=col_line[0], show_legend=True,
-                                      point_value=point_value, opacity=opacity, connect_gaps=connect_gaps,
-                                      subplot_coord=[None, None], hover_text=hover_text)
+        facet_list.append([None, dict(df_facet=proj_data, truth_facet=truth_data, show_legend=True, **facet_param)])
+    fig_plot = add_facet_traces(fig_plot, add_scatter_facet, facet_list, n_worker=n_worker)
+    fig_plot = decimate_ratio_meta(fig_plot)
     # View update
     to_vis = list()
     leg_only = list()
@@ -690,6 +712,90 @@ def make_scatter_plot(proj_data, truth_data, intervals=None, intervals_dict=None
     return fig_plot
 
 
+def make_scatter_plot_batch(proj_data, truth_data, keys, key_col=None, plot_param=None, color_dict=None,
+                            palette="turbo", legend_col="model_name", x_col="target_end_date", **kwargs):
+    """Create multiple Scatter Plots
+
+    Generator creating one Scatter Plot (see `make_scatter_plot()`) for each key in `keys` (for example, each
+    location and target combination). The projection data (and truth data) are sorted and partitioned only once,
+    the colors are calculated once for all the plots, and each figure is created only when requested by the
+    generator.
+
+    If no projection data is available for a key, the associated figure is an empty figure with an error message
+    (see `fig_error_message()`).
+
+    :parameter proj_data: Data frame containing the data to plot for all the keys
+    :type proj_data: pandas.DataFrame
+    :parameter truth_data: Data frame containing the observed data to plot for all the keys, set to None is no observed
+        data plotted. The truth data is partitioned by the `key_col` columns available in `truth_data`.
+    :type truth_data: pandas.DataFrame | None
+    :parameter keys: List of keys, each key is a tuple with one value per `key_col` column
+        (for example: `[("US", "inc hosp"), ("06", "inc hosp")]`)
+    :type keys: list
+    :parameter key_col: List of the columns name associated with each key value, by default `["location", "target"]`
+    :type key_col: list | None
+    :parameter plot_param: Dictionary with key (from `keys`) and a dictionary of additional `make_scatter_plot()`
+        parameters specific to this key (value), for example: `{("US", "inc hosp"): {"title": "US"}}`. By default,
+        `None`
+    :type plot_param: dict | None
+    :parameter color_dict: a dictionary with `legend_col` values (key) and associated color in the format
+        "rgba(X, Y, Z, 1)" (value), if `None` (default) it will be created by using `palette` on all `proj_data`.
+    :type color_dict: dict | None
+    :parameter palette: Name of the palette to create `color_dict` if `color_dict` is set to `None`. By default,
+        "turbo".
+    :type palette: str
+    :parameter legend_col: Name of the column to use for different traces (one trace per value), by default `model_name`
+    :type legend_col: str
+    :parameter x_col: Name of the column to use for x-axis, by default `target_end_date`
+    :type x_col: str
+    :parameter kwargs: Additional parameters for `make_scatter_plot()` shared by all the plots
+    :return: a generator of tuples (key, plotly.graph_objs.Figure object)
+    """
+    if key_col is None:
+        key_col = ["location", "target"]
+    if plot_param is None:
+        plot_param = dict()
+    # Colorscale
+    if color_dict is None:
+        color_dict = make_palette_sequential(proj_data, legend_col, palette=palette)
+    # Sort and partition
+    proj_data = proj_data.sort_values(key_col + [legend_col, x_col], kind="stable")
+    proj_index = proj_data.groupby(key_col, sort=False).indices
+    if truth_data is not None:
+        truth_key_col = [col for col in key_col if col in truth_data.columns]
+    else:
+        truth_key_col = []
+    if len(truth_key_col) > 0:
+        truth_index = truth_data.groupby(truth_key_col, sort=False).indices
+    else:
+        truth_index = None
+    # Figures
+    for key in keys:
+        key = tuple(key)
+        if len(key_col) == 1:
+            proj_key = key[0]
+        else:
+            proj_key = key
+        if proj_key not in proj_index:
+            yield key, fig_error_message("No projection data available")
+            continue
+        df_key = proj_data.iloc[proj_index[proj_key]]
+        if truth_index is not None:
+            truth_key = tuple(key[key_col.index(col)] for col in truth_key_col)
+            if len(truth_key_col) == 1:
+                truth_key = truth_key[0]
+            if truth_key in truth_index:
+                truth_key = truth_data.iloc[truth_index[truth_key]]
+            else:
+                truth_key = None
+        else:
+            truth_key = truth_data
+        fig_param = dict(kwargs, **plot_param.get(key, dict()))
+        fig = make_scatter_plot(df_key, truth_key, color_dict=color_dict, legend_col=legend_col, x_col=x_col,
+                                sort_x=False, **fig_param)
+        yield key, fig
+
+
 def add_point_scatter(fig, df, ens_name, color_dict=None, multiply=1, symbol="circle", ens_symbol="diamond-wide",
                       size=20, opacity=0.7, legend_dict=None, show_legend=True, subplot_col=None, add_zero_line=True,
                       legend_col="model_name", palette="turbo"):
@@ -737,50 +843,92 @@ def add_point_scatter(fig, df, ens_name, color_dict=None, multiply=1, symbol="ci
     :return: a plotly.graph_objs.Figure object
     """
     # prerequisite
-    ens_marker = dict(symbol=ens_symbol, size=size, color="rgba(0,0,0," + str(opacity) + ")")
-    multi = multiply
     if fig is None:
         fig = go.Figure()
     if subplot_col is None:
         subplot_col = 1
-        # Colorscale
+    # Colorscale
     if color_dict is None:
         color_dict = make_palette_sequential(df, legend_col, palette=palette)
     # figure
-    df_comp_model = df[df[legend_col] != ens_name]
-    for model in df_comp_model[legend_col].drop_duplicates():
-        df_model = df_comp_model[df_comp_model[legend_col] == model]
+    traces = point_scatter_traces(df, ens_name, color_dict, multiply=multiply, symbol=symbol, ens_symbol=ens_symbol,
+                                  size=size, opacity=opacity, legend_dict=legend_dict, show_legend=show_legend,
+                                  legend_col=legend_col)
+    fig.add_traces(traces, rows=1, cols=subplot_col)
+    # Add horizon line
+    if add_zero_line is True:
+        fig.add_hline(y=0, line_width=1, line_color="black", line_dash="dash")
+    return fig
+
+
+def point_scatter_traces(df, ens_name, color_dict, multiply=1, symbol="circle", ens_symbol="diamond-wide", size=20,
+                         opacity=0.7, legend_dict=None, show_legend=True, legend_col="model_name"):
+    """Create point scatter traces
+
+    Create the point scatter traces used in `add_point_scatter()`: one trace per `legend_col` value (in order of
+    appearance) and the "Ensemble" trace (`ens_name`) on top, from one grouping of `df`.
+
+    :parameter df: Data frame containing the data to plot, with the columns: "full_x", "rel_change" and `legend_col`
+    :type df: pandas.DataFrame
+    :parameter ens_name: Name of the "Ensemble" variable, to plot on top of the other with a specific color
+        (black) and symbol (see parameters `ens_symbol`)
+    :type ens_name: str
+    :parameter color_dict: Dictionary containing each legend value and the associated color
+    :type color_dict: dict
+    :parameter multiply: a value to multiply all the value. By default, 1
+    :type multiply: int | float
+    :parameter symbol: Marker symbol, by default "circle"
+    :type symbol: str
+    :parameter ens_symbol: "Ensemble" marker symbol. By default, "diamond-wide"
+    :type ens_symbol: str
+    :parameter size: Size of the "Ensemble" markers
+    :type size: int
+    :parameter opacity: Opacity of the markers. By default, 0.7
+    :type opacity: int | float
+    :parameter legend_dict: a dictionary with value associated with `legend_col` variable (key, as in `df`) and
+        associated full name (value, for  legend purposes). If `None` (default), use information from the
+        `legend_col` column for legend
+    :type legend_dict: dict
+    :parameter show_legend: Boolean, to show the legend. By default, True
+    :type show_legend: bool
+    :parameter legend_col: Name of the column to use for the legend. By default, "model_name"
+    :type legend_col: str
+    :return: a list of plotly.graph_objs.Scatter object
+    """
+    ens_marker = dict(symbol=ens_symbol, size=size, color="rgba(0,0,0," + str(opacity) + ")")
+    traces = list()
+    df_ens = None
+    for model, df_model in df.groupby(legend_col, sort=False):
+        if model == ens_name:
+            df_ens = df_model
+            continue
         if legend_dict is not None:
             full_model_name = legend_dict[model]
         else:
             full_model_name = "".join(list(model))
         # prerequisite
         color_marker = color_line_trace(color_dict, model, line_width=0)
-        color_marker = re.sub(", 1\)", ", " + str(opacity) + ")", color_marker[0])
+        color_marker = re.sub(", 1\\)", ", " + str(opacity) + ")", color_marker[0])
         model_marker = dict(size=20, color=color_marker, symbol=symbol)
-        fig.add_trace(go.Scatter(x=df_model["full_x"],
-                                 y=df_model["rel_change"] * multi,
+        traces.append(go.Scatter(x=df_model["full_x"],
+                                 y=df_model["rel_change"] * multiply,
                                  name=full_model_name,
                                  showlegend=show_legend,
                                  marker=model_marker,
                                  legendgroup=full_model_name,
                                  mode="markers",
-                                 hovertemplate="%{x}: %{y:.1%}"),
-                      row=1, col=subplot_col)
-    df_comp_ens = df[df[legend_col] == ens_name]
-    fig.add_trace(go.Scatter(x=df_comp_ens["full_x"],
-                             y=df_comp_ens["rel_change"] * multi,
+                                 hovertemplate="%{x}: %{y:.1%}"))
+    if df_ens is None:
+        df_ens = df[df[legend_col] == ens_name]
+    traces.append(go.Scatter(x=df_ens["full_x"],
+                             y=df_ens["rel_change"] * multiply,
                              name=ens_name,
                              showlegend=show_legend,
                              marker=ens_marker,
                              legendgroup=ens_name,
                              mode="markers",
-                             hovertemplate="%{x}: %{y:.1%}"),
-                  row=1, col=subplot_col)
-    # Add horizon line
-    if add_zero_line is True:
-        fig.add_hline(y=0, line_width=1, line_color="black", line_dash="dash")
-    return fig
+                             hovertemplate="%{x}: %{y:.1%}"))
+    return traces
 
 
 def make_point_comparison_plot(df, ens_name, plot_comparison=None, title=None, height=1000, theme="plotly_white",
@@ -800,65 +948,63 @@ def make_point_comparison_plot(df, ens_name, plot_comparison=None, title=None, h
     else:
         fig = go.Figure()
     # Plot
+    df_all = df.copy()
     if x_dictionary is not None:
-        x_list = []
-        for x_val in df[x_col]:
-            x_list.append(x_dictionary[x_val])
+        df_all["full_x"] = df_all[x_col].map(x_dictionary)
     else:
-        x_list = df[x_col]
-    df_all = df.copy()
-    df_all.loc[:, "full_x"] = x_list
+        df_all["full_x"] = df_all[x_col]
+    # x axis position in the input data order
+    x_list_unique = list(df_all["full_x"].drop_duplicates())
     if x_order is not None:
         df_all["full_x"] = pd.CategoricalIndex(df_all["full_x"], ordered=True, categories=x_order)
         df_all = df_all.sort_values("full_x", ascending=True)
+    # Colorscale
+    if color_dict is None:
+        color_dict = make_palette_sequential(df_all, legend_col, palette=palette)
+    traces = list()
+    traces_col = list()
     if style == "individual":
         plot_comparison = list(df_all["comparison"].drop_duplicates())
-        for comparison in plot_comparison:
+        for comparison, df_comp in df_all.groupby("comparison", sort=False):
             subplot_col = plot_comparison.index(comparison) + 1
-            if comparison == plot_comparison[0]:
-                show_legend = True
-            else:
-                show_legend = False
-            df_comp = df_all[df_all["comparison"] == comparison]
-            fig = add_point_scatter(fig, df_comp, ens_name, color_dict, legend_dict=legend_dict,
-                                    show_legend=show_legend, subplot_col=subplot_col, add_zero_line=True,
-                                    legend_col=legend_col, palette=palette, multiply=multiply)
+            comp_traces = point_scatter_traces(df_comp, ens_name, color_dict, legend_dict=legend_dict,
+                                               show_legend=comparison == plot_comparison[0], legend_col=legend_col,
+                                               multiply=multiply)
+            traces = traces + comp_traces
+            traces_col = traces_col + [subplot_col] * len(comp_traces)
     else:
-        x_list_unique = []
-        for x_val in x_list:
-            if x_val not in x_list_unique:
-                x_list_unique.append(x_val)
+        plot_comparison = list(plot_comparison)
+        first_x = df_all["full_x"].iloc[0]
         x_axis_def = dict(zip(x_list_unique, range(1, len(x_list_unique) + 1)))
         tick_x1 = tick_label1 = tick_x2 = tick_label2 = []
-        for targ in df_all["full_x"].drop_duplicates():
-            df_sub = df_all[df_all["full_x"] == targ]
+        for targ, df_sub in df_all.groupby("full_x", sort=False, observed=True):
             for comp in plot_comparison:
                 list_comparison = list(comp.keys())
-                df_sub_c = df_sub[df_sub["comparison"].isin(list(list_comparison))].copy()
-                subplot_col = list(plot_comparison).index(comp) + 1
+                df_sub_c = df_sub[df_sub["comparison"].isin(list_comparison)]
+                subplot_col = plot_comparison.index(comp) + 1
                 for comparison in list_comparison:
                     if comparison == list_comparison[0]:
                         x_axis = int(x_axis_def[targ]) + 0
-                        if comp == list(plot_comparison)[0] and \
-                                targ == list(df_all["full_x"].drop_duplicates())[0]:
-                            show_legend = True
-                        else:
-                            show_legend = False
+                        show_legend = comp == plot_comparison[0] and targ == first_x
                     else:
                         x_axis = int(x_axis_def[targ]) + 0.65
                         show_legend = False
-                    if comp == list(plot_comparison)[0]:
+                    if comp == plot_comparison[0]:
                         tick_x1.append(x_axis)
                         tick_label1.append(str(targ) + " - " + comparison)
                     else:
                         tick_x2.append(x_axis)
                         tick_label2.append(str(targ) + " - " + comparison)
-                    df_sub_c["x_target"] = x_axis
-                    fig = add_point_scatter(fig, df_sub_c, ens_name, color_dict, legend_dict=legend_dict,
-                                            show_legend=show_legend, subplot_col=subplot_col, add_zero_line=True,
-                                            legend_col=legend_col, palette=palette, multiply=multiply)
+                    comp_traces = point_scatter_traces(df_sub_c, ens_name, color_dict, legend_dict=legend_dict,
+                                                       show_legend=show_legend, legend_col=legend_col,
+                                                       multiply=multiply)
+                    traces = traces + comp_traces
+                    traces_col = traces_col + [subplot_col] * len(comp_traces)
         fig.update_layout(xaxis1=dict(tickmode="array", tickvals=tick_x1, ticktext=tick_label1))
         fig.update_layout(xaxis2=dict(tickmode="array", tickvals=tick_x2, ticktext=tick_label2))
+    fig.add_traces(traces, rows=[1] * len(traces), cols=traces_col)
+    # Add horizon line
+    fig.add_hline(y=0, line_width=1, line_color="black", line_dash="dash")
     # Update Layout
     fig.update_xaxes(showline=True, linewidth=1, linecolor='black', mirror=True, tickangle=20)
     fig.update_yaxes(showline=True, linewidth=1, linecolor='black', mirror=True, tickformat=".1%")
@@ -875,24 +1021,38 @@ def make_point_comparison_plot(df, ens_name, plot_comparison=None, title=None, h
 
 def make_heatmap_plot(df, show_legend=True, subplot=False, subplot_col=None, subplot_titles=None, palette="ylorrd",
                       share_x="all", share_y="all", x_col="target_end_date", y_col="location_name", title=None,
-                      height=1000, theme="plotly_white", sub_nrow=1, orientation="h"):
+                      height=1000, theme="plotly_white", sub_nrow=1, orientation="h", dense=False, max_x=None):
+    if dense is True:
+        # One pivot for all the subplots, sharing the axis labels
+        if subplot is True:
+            heatmap = prep_heatmap_matrix(df, x_col=x_col, y_col=y_col, facet_col=subplot_col, max_x=max_x)
+        else:
+            heatmap = prep_heatmap_matrix(df, x_col=x_col, y_col=y_col, max_x=max_x)
+    else:
+        heatmap = None
     if subplot is True:
         sub_var = list(df[subplot_col].unique())
         fig = prep_subplot(sub_var, subplot_titles, "", "", sort=False, share_x=share_x, share_y=share_y,
                            row_num=sub_nrow)
         for var in sub_var:
-            df_plot = df[df[subplot_col] == var]
             if var == sub_var[0]:
                 show_legend = show_legend
             else:
                 show_legend = False
             plot_coord = subplot_row_col(sub_var, var, orientation=orientation)
-            fig = fig.add_trace(
-                go.Heatmap(z=df_plot["value"], x=df_plot[x_col], y=df_plot[y_col], coloraxis="coloraxis",
-                           hovertemplate="x: %{x}<br>y: %{y}<br>z: %{z}<extra></extra>"),
-                row=plot_coord[0], col=plot_coord[1])
+            if heatmap is not None:
+                trace = go.Heatmap(z=heatmap["z"][heatmap["facet"].index(var)], x=heatmap["x"], y=heatmap["y"],
+                                   coloraxis="coloraxis", hovertemplate="x: %{x}<br>y: %{y}<br>z: %{z}<extra></extra>")
+            else:
+                df_plot = df[df[subplot_col] == var]
+                trace = go.Heatmap(z=df_plot["value"], x=df_plot[x_col], y=df_plot[y_col], coloraxis="coloraxis",
+                                   hovertemplate="x: %{x}<br>y: %{y}<br>z: %{z}<extra></extra>")
+            fig = fig.add_trace(trace, row=plot_coord[0], col=plot_coord[1])
     else:
-        fig = go.Figure(data=go.Heatmap(z=df["value"], x=df[x_col], y=df[y_col], coloraxis="coloraxis"))
+        if heatmap is not None:
+            fig = go.Figure(data=go.Heatmap(z=heatmap["z"][0], x=heatmap["x"], y=heatmap["y"], coloraxis="coloraxis"))
+        else:
+            fig = go.Figure(data=go.Heatmap(z=df["value"], x=df[x_col], y=df[y_col], coloraxis="coloraxis"))
     fig.update_layout(
         title=dict(text=title, font=dict(size=18), xanchor="center", xref="paper", x=0.5, yref="paper"),
         height=height, template=theme, coloraxis={'colorscale': palette, 'colorbar': {'title': "Peak Probability"}})
@@ -900,47 +1060,50 @@ def make_heatmap_plot(df, show_legend=True, subplot=False, subplot_col=None, sub
 
 
 def add_box_plot(df_var, fig, x_col="model_name", y_col="type_id", box_value=None, color_dict=None,
-                 box_orientation="h", show_legend=False, plot_coord=None):
+                 box_orientation="h", show_legend=False, plot_coord=None, group_color=False):
     if box_value is None:
         box_value = [0.01, 0.25, 0.5, 0.75, 0.99]
-    for x_val in df_var[x_col].unique():
-        df_plot = df_var[df_var[x_col] == x_val]
-        if color_dict is None:
-            color_x_val = "black"
-        else:
-            color_x_val = color_dict[x_val]
-        if plot_coord is None:
-            fig = fig.add_trace(go.Box(
-                orientation=box_orientation,
-                y=df_plot[x_col].astype(str),
-                lowerfence=df_plot[df_plot[y_col] == box_value[0]]["value"],
-                q1=df_plot[df_plot[y_col] == box_value[1]]["value"],
-                median=df_plot[df_plot[y_col] == box_value[2]]["value"],
-                q3=df_plot[df_plot[y_col] == box_value[3]]["value"],
-                upperfence=df_plot[df_plot[y_col] == box_value[4]]["value"],
-                marker_color=color_x_val,
-                name=x_val, showlegend=show_legend))
-        else:
-            fig = fig.add_trace(go.Box(
-                orientation=box_orientation,
-                y=df_plot[x_col].astype(str),
-                lowerfence=df_plot[df_plot[y_col] == box_value[0]]["value"],
-                q1=df_plot[df_plot[y_col] == box_value[1]]["value"],
-                median=df_plot[df_plot[y_col] == box_value[2]]["value"],
-                q3=df_plot[df_plot[y_col] == box_value[3]]["value"],
-                upperfence=df_plot[df_plot[y_col] == box_value[4]]["value"],
-                marker_color=color_x_val,
-                name=x_val, showlegend=show_legend),
-                row=plot_coord[0], col=plot_coord[1])
-
-
+    if plot_coord is None:
+        plot_coord = [None, None]
+    # Matrix (x value x box value) of the quantiles, in one pass
+    x_list = list(df_var[x_col].unique())
+    df_box = df_var[df_var[y_col].isin(box_value)]
+    box_matrix = np.full((len(x_list), len(box_value)), np.nan)
+    box_matrix[pd.Categorical(df_box[x_col], categories=x_list).codes,
+               pd.Categorical(df_box[y_col], categories=box_value).codes] = df_box["value"].to_numpy()
+    if color_dict is None:
+        color_list = ["black"] * len(x_list)
+    else:
+        color_list = [color_dict[x_val] for x_val in x_list]
+    # Traces: one per x value or one per color
+    if group_color is True:
+        color_group = dict()
+        for i in range(len(x_list)):
+            color_group.setdefault(color_list[i], []).append(i)
+        box_group = [[color, index] for color, index in color_group.items()]
+    else:
+        box_group = [[color_list[i], [i]] for i in range(len(x_list))]
+    traces = list()
+    for color_x_val, index in box_group:
+        traces.append(go.Box(
+            orientation=box_orientation,
+            y=[str(x_list[i]) for i in index],
+            lowerfence=box_matrix[index, 0],
+            q1=box_matrix[index, 1],
+            median=box_matrix[index, 2],
+            q3=box_matrix[index, 3],
+            upperfence=box_matrix[index, 4],
+            marker_color=color_x_val,
+            name=x_list[index[0]] if group_color is False else "",
+            showlegend=show_legend if group_color is False else False))
+    fig = fig.add_traces(traces, rows=plot_coord[0], cols=plot_coord[1])
     return fig
 
 
 def make_boxplot_plot(df, show_legend=False, subplot=False, subplot_col=None, subplot_titles=None, sub_nrow=1,
                       share_x="all", share_y="all", x_col="model_name", y_col="type_id", title=None, box_value=None,
                       height=1000, theme="plotly_white", sub_orientation="v", color_dict=None, box_orientation="h",
-                      subplot_spacing=0.05):
+                      subplot_spacing=0.05, group_color=False):
     if subplot is True:
         sub_var = list(df[subplot_col].unique())
         fig = prep_subplot(sub_var, subplot_titles, "", "", sort=False, share_x=share_x, share_y=share_y,
@@ -953,11 +1116,13 @@ def make_boxplot_plot(df, show_legend=False, subplot=False, subplot_col=None, su
                 show_legend = False
             plot_coord = subplot_row_col(sub_var, var, orientation=sub_orientation)
             fig = add_box_plot(df_var, fig, x_col=x_col, y_col=y_col, box_value=box_value, color_dict=color_dict,
-                               box_orientation=box_orientation, show_legend=show_legend, plot_coord=plot_coord)
+                               box_orientation=box_orientation, show_legend=show_legend, plot_coord=plot_coord,
+                               group_color=group_color)
     else:
         fig = go.Figure()
         fig = add_box_plot(df, fig, x_col=x_col, y_col=y_col, box_value=box_value, color_dict=color_dict,
-                           box_orientation=box_orientation, show_legend=show_legend, plot_coord = None)
+                           box_orientation=box_orientation, show_legend=show_legend, plot_coord=None,
+                           group_color=group_color)
 
     fig.update_layout(
         title=dict(text=title, font=dict(size=18), xanchor="center", xref="paper", x=0.5, yref="paper"),
@@ -969,18 +1134,24 @@ def add_bar_plot(fig, df_var, df_other=None, truth_data=None, df_x="target_end_d
                  truth_data_x="time_value", show_legend=True, obs_legend=True, title=None, height=1000, plot_coord=None,
                  var="Pathogen", other_var="Second Pathogen", truth_data_legend_name="Observed Data",
                  truth_data_tot_legend_name="Observed Data", theme="plotly_white", color='crimson',
-                 color_other='deepskyblue', truth_data_tot_col="total_value"):
+                 color_other='deepskyblue', truth_data_tot_col="total_value", max_point=None,
+                 decimate_method="lttb"):
     if plot_coord is None:
         plot_coord = [1, 1]
     if truth_data is not None:
-        fig.add_trace(go.Scatter(x=truth_data[truth_data_x], y=truth_data["value"],
-                                 legendgroup="observed_data", name=truth_data_legend_name,
+        # Number of retained and input points of the decimated traces, see `decimate_ratio_meta()`
+        truth_value = decimate_df(truth_data, truth_data_x, "value", max_point, method=decimate_method)
+        truth_meta = dict(decimate=[len(truth_value), len(truth_data)]) if max_point is not None else None
+        fig.add_trace(go.Scatter(x=truth_value[truth_data_x], y=truth_value["value"],
+                                 legendgroup="observed_data", name=truth_data_legend_name, meta=truth_meta,
                                  marker=dict(color="black"), visible="legendonly", showlegend=obs_legend,
                                  hovertemplate=str(truth_data_legend_name) + ": %{y:,.2f}" + "<extra></extra>"),
                       row=plot_coord[0], col=plot_coord[1])
         if truth_data_tot_col in truth_data.columns:
-            fig.add_trace(go.Scatter(x=truth_data[truth_data_x], y=truth_data[truth_data_tot_col],
-                                     legendgroup="all_observed_data",
+            truth_tot = decimate_df(truth_data, truth_data_x, truth_data_tot_col, max_point, method=decimate_method)
+            truth_meta = dict(decimate=[len(truth_tot), len(truth_data)]) if max_point is not None else None
+            fig.add_trace(go.Scatter(x=truth_tot[truth_data_x], y=truth_tot[truth_data_tot_col],
+                                     legendgroup="all_observed_data", meta=truth_meta,
                                      name=truth_data_tot_legend_name,
                                      hovertemplate=str(truth_data_tot_legend_name) + ": %{y:,.2f}<extra></extra>",
                                      marker=dict(color="lightslategray"), visible="legendonly",
@@ -1003,6 +1174,7 @@ def add_bar_plot(fig, df_var, df_other=None, truth_data=None, df_x="target_end_d
         height=height, template=theme, barmode="stack", hovermode="x",
         legend=dict(orientation="h", yanchor="top", xanchor="left", traceorder="grouped")
     )
+    fig = decimate_ratio_meta(fig)
     return fig
 
 
@@ -1011,7 +1183,10 @@ def make_bar_plot(df, df_other=None, truth_data=None, df_x="target_end_date", df
                   subplot_col=None, truth_data_legend_name="Observed Data", truth_data_tot_legend_name="Observed Data",
                   df_legend_name="Pathogen", df_other_legend_name="Second Pathogen", subplot_titles=None,
                   share_x="all", share_y="all", x_title="", y_title="N", theme="plotly_white", color_dict=None,
-                  palette=px.colors.qualitative.Plotly):
+                  palette=None, max_point=None, decimate_method="lttb"):
+    if palette is None:
+        from plotly.colors import qualitative
+        palette = qualitative.Plotly
     if subplot is True:
         sub_var = list(df[subplot_col].unique())
         fig = prep_subplot(sub_var, subplot_titles, x_title, y_title, sort=False, share_x=share_x, share_y=share_y)
@@ -1035,7 +1210,8 @@ def make_bar_plot(df, df_other=None, truth_data=None, df_x="target_end_date", df
                                truth_data_x=truth_data_x, show_legend=show_legend, obs_legend=obs_legend,
                                title=title, height=height, plot_coord=plot_coord, var=var, other_var=other_var,
                                truth_data_legend_name=truth_data_legend_name, color=color,
-                               truth_data_tot_legend_name=truth_data_tot_legend_name, theme=theme)
+                               truth_data_tot_legend_name=truth_data_tot_legend_name, theme=theme,
+                               max_point=max_point, decimate_method=decimate_method)
 
     else:
         fig = go.Figure()
@@ -1044,13 +1220,15 @@ def make_bar_plot(df, df_other=None, truth_data=None, df_x="target_end_date", df
                            title=title, height=height, plot_coord=[1, 1], var=df_legend_name,
                            other_var=df_other_legend_name,
                            truth_data_legend_name=truth_data_legend_name,
-                           truth_data_tot_legend_name=truth_data_tot_legend_name, theme=theme)
+                           truth_data_tot_legend_name=truth_data_tot_legend_name, theme=theme,
+                           max_point=max_point, decimate_method=decimate_method)
     return fig
 
 
 def add_spaghetti_plot(fig, df, color_dict, legend_dict=None,
                        legend_col="model_name", spag_col="type_id", show_legend=True, hover_text="", opacity=0.3,
-                       subplot_coord=None, add_median=False, median=0.5):
+                       subplot_coord=None, add_median=False, median=0.5, max_point=None, decimate_method="lttb",
+                       x_col="target_end_date"):
     if add_median is True:
         df_med = df[df[spag_col] == median]
         df = df[df[spag_col] != median]
@@ -1065,36 +1243,46 @@ def add_spaghetti_plot(fig, df, color_dict, legend_dict=None,
         else:
             legend_name = legend_dict[leg]
             col_line = color_line_trace(color_dict, legend_name)
+        # Decimate each trajectory, to keep around `max_point` points in the trace
+        if max_point is not None:
+            n_point = len(df_plot)
+            traj_point = max(max_point // df_plot[spag_col].nunique(), 3)
+            df_plot = decimate_df(df_plot, x_col, "value", traj_point, method=decimate_method, group_col=spag_col)
+            traj_meta = dict(decimate=[len(df_plot), n_point])
+        else:
+            traj_meta = None
         # Prepare df with all trajectories in a model, separated by null rows
         # (which break up trajectories into different lines)
         temp = pd.DataFrame()
-        traj_list = list(df_plot['type_id'].unique())
+        traj_list = list(df_plot[spag_col].unique())
         temp.loc[:, 'value'] = [np.nan] * len(traj_list)
-        temp.loc[:, 'type_id'] = traj_list
-        temp.loc[:, 'target_end_date'] = [pd.NaT] * len(traj_list)
+        temp.loc[:, spag_col] = traj_list
+        temp.loc[:, x_col] = [pd.NaT] * len(traj_list)
         all_traj_df = pd.concat([df_plot, temp], axis=0)
-        all_traj_df = all_traj_df.sort_values(['type_id', 'target_end_date'])
+        all_traj_df = all_traj_df.sort_values([spag_col, x_col])
         # Once Nan's are inserted between typeIDs, insert Nan in type ID col so hover text renders correctly
-        all_traj_df.loc[pd.isna(all_traj_df['value']), 'type_id'] = np.nan
+        all_traj_df.loc[pd.isna(all_traj_df['value']), spag_col] = np.nan
 
         # Add single trace
         color = re.sub(", 1\)", ", " + str(opacity) + ")", col_line[0])
-        fig = add_scatter_trace(fig, all_traj_df, legend_name, x_col="target_end_date", mode="lines", color=color,
+        fig = add_scatter_trace(fig, all_traj_df, legend_name, x_col=x_col, mode="lines", color=color,
                                 show_legend=show_legend, subplot_coord=subplot_coord,
-                                custom_data=all_traj_df['type_id'],
+                                custom_data=all_traj_df[spag_col], meta=traj_meta,
                                 hover_text=hover_text + "Model: " + legend_name + "<br>Type ID: %{customdata}<br>")
         if add_median is True and df_med is not None:
             df_plot_med = df_med[df_med[legend_col] == leg]
-            add_scatter_trace(fig, df_plot_med, legend_name, x_col="target_end_date", show_legend=False,
+            add_scatter_trace(fig, df_plot_med, legend_name, x_col=x_col, show_legend=False,
                               mode="lines", subplot_coord=subplot_coord, width=4,
                               hover_text=hover_text + spag_col.title() + ": Median <br>", color=col_line[0])
+    fig = decimate_ratio_meta(fig)
     return fig
 
 
 def make_spaghetti_plot(df, legend_col="model_name", spag_col="type_id", show_legend=True, hover_text="", opacity=0.3,
                         subplot=False, title="", height=1000, subplot_col=None, subplot_titles=None, palette="turbo",
                         share_x="all", share_y="all", x_title="", y_title="N", theme="plotly_white", color_dict=None,
-                        add_median=False, legend_dict=None, row_num=None):
+                        add_median=False, legend_dict=None, row_num=None, max_point=None, decimate_method="lttb",
+                        n_worker=None, x_col="target_end_date"):
     # Colorscale
     if color_dict is None:
         color_dict = make_palette_sequential(df, legend_col, palette=palette)
@@ -1103,6 +1291,7 @@ def make_spaghetti_plot(df, legend_col="model_name", spag_col="type_id", show_le
         sub_var = list(df[subplot_col].unique())
         fig = prep_subplot(sub_var, subplot_titles, x_title, y_title, sort=False, share_x=share_x,
                            share_y=share_y, row_num=row_num)
+        facet_list = list()
         for var in sub_var:
             df_var = df[df[subplot_col] == var].drop(subplot_col, axis=1)
             plot_coord = subplot_row_col(sub_var, var, row_num=row_num)
@@ -1110,16 +1299,20 @@ def make_spaghetti_plot(df, legend_col="model_name", spag_col="type_id", show_le
                 show_legend = show_legend
             else:
                 show_legend = False
-            add_spaghetti_plot(fig, df_var, color_dict=color_dict, legend_col=legend_col,
-                               spag_col=spag_col, show_legend=show_legend, hover_text=hover_text,
-                               opacity=opacity, subplot_coord=plot_coord, add_median=add_median,
-                               legend_dict=legend_dict)
+            facet_list.append([plot_coord, dict(df=df_var, color_dict=color_dict, legend_col=legend_col,
+                                                spag_col=spag_col, show_legend=show_legend, hover_text=hover_text,
+                                                opacity=opacity, add_median=add_median, legend_dict=legend_dict,
+                                                max_point=max_point, decimate_method=decimate_method,
+                                                x_col=x_col)])
+        fig = add_facet_traces(fig, add_spaghetti_plot, facet_list, n_worker=n_worker)
+        fig = decimate_ratio_meta(fig)
     else:
         fig = go.Figure()
         fig.update_layout(xaxis_title=x_title, yaxis_title=y_title)
         add_spaghetti_plot(fig, df, color_dict=color_dict, legend_col=legend_col,
                            spag_col=spag_col, show_legend=show_legend, hover_text=hover_text,
-                           opacity=opacity, subplot_coord=None, add_median=add_median, legend_dict=legend_dict)
+                           opacity=opacity, subplot_coord=None, add_median=add_median, legend_dict=legend_dict,
+                           max_point=max_point, decimate_method=decimate_method, x_col=x_col)
     subplot_fig_output(fig, title, subtitle="", height=height, theme=theme)
     return fig
 
@@ -1195,8 +1388,7 @@ def make_combine_multi_pathogen_plot(list_df, list_pathogen, truth_data=None, op
         print(error_bar_pat + " is not in `list_pathogen`. The first element of `list_pathogen` will be use instead.")
         error_bar_pat = list_pathogen[0]
     elif error_bar_pat != list_pathogen[0]:
-        list_pathogen.remove(error_bar_pat)
-        list_pathogen = [error_bar_pat] + list_pathogen
+        list_pathogen = [error_bar_pat] + [pathogen for pathogen in list_pathogen if pathogen != error_bar_pat]
     low_list_pathogen = list()
     for pathogen in list_pathogen:
         low_list_pathogen.append(pathogen.lower())
@@ -1207,16 +1399,17 @@ def make_combine_multi_pathogen_plot(list_df, list_pathogen, truth_data=None, op
             color = make_palette_sequential(pd.DataFrame(data={"pathogen": ["Combined"] + list_pathogen}),
                                             "pathogen", palette=palette)
     # Subplot
+    from plotly.subplots import make_subplots
     fig = make_subplots(rows=2, cols=1, vertical_spacing=0.05, shared_xaxes=True)
     # Scatter plot
-    scatter_df = list_df["all"]
-    col_value = ["value_" + pathogen for pathogen in low_list_pathogen] + ["value"]
-    df_plot = pd.wide_to_long(scatter_df.reset_index(), col_value, j="type_id", i="target_end_date",
-                              suffix="\\w+", sep="-").reset_index()
-    df_plot.sort_values("target_end_date")
     if intervals is None:
         intervals = [0.95, 0.9, 0.8, 0.5]
-    intervals.sort(reverse=True)
+    intervals = sorted(intervals, reverse=True)
+    scatter_df = list_df["all"]
+    col_value = ["value_" + pathogen for pathogen in low_list_pathogen] + ["value"]
+    quant_list = flatten_list([intervals_dict[interval] for interval in intervals])
+    df_plot = pd.concat([scatter_df[[col + "-" + quant for col in col_value]].set_axis(col_value, axis=1).assign(
+        type_id=quant) for quant in quant_list]).reset_index()
     for j in ["Combined"] + list_pathogen:
         if j == "Combined":
             col_name = ""
@@ -1236,12 +1429,7 @@ def make_combine_multi_pathogen_plot(list_df, list_pathogen, truth_data=None, op
             fig = ui_ribbons(fig, df_plot, quant_sel, y_col="value" + col_name, legend_name=j, color=color[j],
                              show_legend=show_leg, opacity=opacity, subplot_coord=[1, 1],
                              special_hover={"first": first_hover_text, "second": second_hover_text})
-            fig.for_each_trace(
-                lambda trace: trace.update(visible=True) if trace.name == "Combined" else (),
-            )
-            fig.for_each_trace(
-                lambda trace: trace.update(visible="legendonly") if trace.name != "Combined" else (),
-            )
+    fig.for_each_trace(lambda trace: trace.update(visible=True if trace.name == "Combined" else "legendonly"))
     if truth_data is not None:
         fig = add_scatter_trace(fig, truth_data, list_pathogen[0] + " Observed Data", subplot_coord=[1, 1],
                                 hover_text=list_pathogen[0] + "<br>", color="rgba(0,0,0,1)", visible="legendonly")
@@ -1252,40 +1440,35 @@ def make_combine_multi_pathogen_plot(list_df, list_pathogen, truth_data=None, op
     # Bar plot
     quant_sel = intervals_dict[bar_interval]
     bar_df = list_df["detail"]
-    col_value = ["proportion_" + pathogen for pathogen in low_list_pathogen]
-    df_plot = pd.wide_to_long(bar_df.reset_index(), col_value, j="type_id", i="target_end_date",
-                              suffix="\\w+", sep="-").reset_index()
     bar_pathogen_list = list_pathogen.copy()
     bar_pathogen_list.reverse()
-    med_point = pd.Series([1] * len(df_plot[df_plot["type_id"] == bar_calc]))
-    for pathogen in bar_pathogen_list:
-        med_val = df_plot[df_plot["type_id"] == bar_calc]["proportion_" + pathogen.lower()].reset_index(drop=True)
-        med_point = med_point.subtract(med_val)
-        fig.add_trace(go.Bar(
-            x=df_plot["target_end_date"], marker=dict(color=color[pathogen]), showlegend=False,
-            y=med_val, base=med_point, name="bar_" + pathogen), row=2, col=1)
-        upper_bar = (
-            df_plot[df_plot["type_id"] == quant_sel[1]]["proportion_" + pathogen.lower()].reset_index(drop=True))
-        lower_bar = (
-            df_plot[df_plot["type_id"] == quant_sel[0]]["proportion_" + pathogen.lower()].reset_index(drop=True))
-        text_low_bar = round(lower_bar, 3)
-        text_up_bar = round(upper_bar, 3)
+    # Matrix (pathogen x date) of the bar value, stacked from the top (1)
+    med_matrix = np.array([bar_df["proportion_" + pathogen.lower() + "-" + bar_calc].to_numpy(dtype=float)
+                           for pathogen in bar_pathogen_list])
+    base_matrix = 1 - np.cumsum(med_matrix, axis=0)
+    bar_traces = list()
+    for i in range(len(bar_pathogen_list)):
+        pathogen = bar_pathogen_list[i]
+        med_val = med_matrix[i]
         if pathogen == error_bar_pat:
-            fig.update_traces(
-                customdata=text_low_bar.astype(str) + " - " + text_up_bar.astype(str),
+            upper_bar = bar_df["proportion_" + pathogen.lower() + "-" + quant_sel[1]]
+            lower_bar = bar_df["proportion_" + pathogen.lower() + "-" + quant_sel[0]]
+            bar_info = dict(
+                customdata=lower_bar.round(3).astype(str) + " - " + upper_bar.round(3).astype(str),
                 hovertemplate="Epiweek: %{x|%Y-%m-%d}<br>" + bar_calc.title() + " " + pathogen +
                               ": %{y:,.3f}<br>" + str(bar_interval * 100) + "% Intervals: %{customdata}<extra></extra>",
-                error_y=dict(type="data", symmetric=False, visible=True, array=list(upper_bar.subtract(med_val)),
-                             arrayminus=list(med_val.subtract(lower_bar))),
-                selector=dict(name="bar_" + pathogen))
+                error_y=dict(type="data", symmetric=False, visible=True, array=upper_bar.to_numpy() - med_val,
+                             arrayminus=med_val - lower_bar.to_numpy()))
         else:
-            fig.update_traces(
+            bar_info = dict(
                 customdata=med_val,
                 hovertemplate="Epiweek: %{x|%Y-%m-%d}<br>" + bar_calc.title() + " " + pathogen +
                               ": %{customdata:,.3f}<br>" + bar_calc.title() + " " +
-                              " + ".join(bar_pathogen_list[bar_pathogen_list.index(pathogen):
-                                                           len(bar_pathogen_list) + 1]) + ": %{y:,.3f}<extra></extra>",
-                selector=dict(name="bar_" + pathogen))
+                              " + ".join(bar_pathogen_list[i:len(bar_pathogen_list) + 1]) +
+                              ": %{y:,.3f}<extra></extra>")
+        bar_traces.append(go.Bar(x=bar_df.index, marker=dict(color=color[pathogen]), showlegend=False, y=med_val,
+                                 base=base_matrix[i], name="bar_" + pathogen, **bar_info))
+    fig.add_traces(bar_traces, rows=2, cols=1)
     # Update layout
     # Button
     title_list_pathogen = list()
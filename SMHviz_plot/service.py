@@ -0,0 +1,217 @@
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import pickle
+
+import pandas as pd
+
+from SMHviz_plot import figures
+
+
+def build_figure(plot_function, args, kwargs):
+    """ Build a figure
+
+    Call the `SMHviz_plot.figures` function named `plot_function` (or the function `plot_function`) with the `args`
+    and `kwargs` parameters and return the output Figure.
+
+    :parameter plot_function: Name of a function from `SMHviz_plot.figures` returning a Figure (for example:
+        "make_scatter_plot") or function
+    :type plot_function: str | collections.abc.Callable
+    :parameter args: Positional parameters of the function
+    :type args: tuple
+    :parameter kwargs: Keyword parameters of the function
+    :type kwargs: dict
+    :return: a plotly.graph_objs.Figure object
+    """
+    if isinstance(plot_function, str):
+        plot_function = getattr(figures, plot_function)
+    return plot_function(*args, **kwargs)
+
+
+def build_figure_json(plot_function, args, kwargs):
+    """ Build a figure and serialize it
+
+    Call the `SMHviz_plot.figures` function named `plot_function` with the `args` and `kwargs` parameters and return
+    the output Figure serialized in JSON.
+
+    :parameter plot_function: Name of a function from `SMHviz_plot.figures` returning a Figure (for example:
+        "make_scatter_plot")
+    :type plot_function: str
+    :parameter args: Positional parameters of the function
+    :type args: tuple
+    :parameter kwargs: Keyword parameters of the function
+    :type kwargs: dict
+    :return: a string containing the Figure in JSON format
+    """
+    return build_figure(plot_function, args, kwargs).to_json()
+
+
+def build_figure_batch(requests, max_workers=4, serialize=False, ordered=True):
+    """ Build multiple figures in a thread pool
+
+    Build the figures of a list of requests in a pool of `max_workers` threads and yield each Figure when it is
+    ready, so the caller can write or send a figure (I/O) while the next ones are built. The figure functions do not
+    modify their input parameters, the requests can share the same DataFrames, lists and dictionaries.
+
+    Example:
+
+    ```
+        requests = [("make_scatter_plot", (df_loc, truth_loc), {"intervals": intervals}) for df_loc, truth_loc in ...]
+        for i, fig in build_figure_batch(requests, max_workers=4):
+            fig.write_html(f"scatter_{i}.html")
+    ```
+
+    :parameter requests: List or iterable of tuples (plot_function, args, kwargs), see `build_figure()`
+    :type requests: list | collections.abc.Iterable
+    :parameter max_workers: Number of threads, by default `4`
+    :type max_workers: int
+    :parameter serialize: Boolean to yield the Figures serialized in JSON, by default `False`
+    :type serialize: bool
+    :parameter ordered: Boolean to yield the Figures in the requests order (`True`, default) or as soon as they are
+        ready (`False`)
+    :type ordered: bool
+    :return: a generator of tuples (index of the request, Figure or JSON string)
+    """
+    build = build_figure_json if serialize is True else build_figure
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    future_list = list()
+    try:
+        for request in requests:
+            future_list.append(executor.submit(build, *request))
+        if ordered is True:
+            for i, future in enumerate(future_list):
+                yield i, future.result()
+        else:
+            future_index = {future: i for i, future in enumerate(future_list)}
+            for future in concurrent.futures.as_completed(future_list):
+                yield future_index[future], future.result()
+    finally:
+        # Generator closed early or error: the figures not started are cancelled
+        for future in future_list:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def figure_request_key(plot_function, args, kwargs):
+    """ Key of a figure request
+
+    Returns a key (SHA-1 digest) identifying a figure request, calculated from the name of the function and the
+    parameters. The DataFrame and Series parameters are hashed on their content (values, index, column names and
+    types) with `pandas.util.hash_pandas_object()`, the other parameters are pickled.
+
+    :parameter plot_function: Name of a function from `SMHviz_plot.figures`
+    :type plot_function: str
+    :parameter args: Positional parameters of the function
+    :type args: tuple
+    :parameter kwargs: Keyword parameters of the function
+    :type kwargs: dict
+    :return: a string key
+    """
+    key = hashlib.sha1(plot_function.encode())
+    for name, value in list(enumerate(args)) + sorted(kwargs.items()):
+        key.update(repr(name).encode())
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            key.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+            key.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else value.name).encode())
+            key.update(repr(list(value.dtypes) if isinstance(value, pd.DataFrame) else value.dtype).encode())
+        else:
+            key.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return key.hexdigest()
+
+
+class FigureService:
+    """ Asynchronous figure service
+
+    Render the `SMHviz_plot.figures` plots from an asyncio application (for example a web server) without
+    blocking the event loop:
+
+    - the figures are built in a bounded pool of worker processes (`executor="process"`, default) or threads
+      (`executor="thread"`)
+    - identical requests received while a figure is being built wait for the same result (only one build)
+    - the serialized figures are stored in a Least Recently Used (LRU) cache of `cache_size` figures
+
+    Example:
+
+    ```
+        service = FigureService(max_workers=2)
+        fig_json = await service.render("make_scatter_plot", proj_data, truth_data, subplot_var="scenario_id")
+        service.close()
+    ```
+
+    :parameter max_workers: Maximum number of workers building figures in parallel, by default `2`
+    :type max_workers: int
+    :parameter executor: Type of workers: "process" (default) or "thread"
+    :type executor: str
+    :parameter cache_size: Maximum number of serialized figures kept in cache, by default `128`. `0` for no cache
+    :type cache_size: int
+    """
+
+    def __init__(self, max_workers=2, executor="process", cache_size=128):
+        if executor == "process":
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        elif executor == "thread":
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        else:
+            raise ValueError("`executor` should be 'process' or 'thread'")
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.in_flight = dict()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    async def render(self, plot_function, *args, key=None, **kwargs):
+        """ Render a figure
+
+        Returns the Figure created by the `SMHviz_plot.figures` function named `plot_function`, serialized in JSON.
+
+        :parameter plot_function: Name of a function from `SMHviz_plot.figures` returning a Figure
+        :type plot_function: str
+        :parameter args: Positional parameters of the function
+        :parameter key: Key identifying the request, if `None` (default), calculated with `figure_request_key()` in
+            the default executor of the event loop (the DataFrames hashing does not block the loop)
+        :type key: str | None
+        :parameter kwargs: Keyword parameters of the function
+        :return: a string containing the Figure in JSON format
+        """
+        loop = asyncio.get_running_loop()
+        if key is None:
+            key = await loop.run_in_executor(None, figure_request_key, plot_function, args, kwargs)
+        # Cache
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.stats["hits"] += 1
+            return self.cache[key]
+        # Identical request in progress
+        if key in self.in_flight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self.in_flight[key])
+        self.stats["misses"] += 1
+        future = loop.run_in_executor(self.executor, build_figure_json, plot_function, args, kwargs)
+        self.in_flight[key] = future
+        try:
+            fig_json = await asyncio.shield(future)
+        finally:
+            del self.in_flight[key]
+        if self.cache_size > 0:
+            self.cache[key] = fig_json
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return fig_json
+
+    def clear_cache(self):
+        """ Remove all the figures from the cache """
+        self.cache.clear()
+
+    def close(self, wait=True):
+        """ Shutdown the workers
+
+        :parameter wait: Boolean to wait for the figures in progress, by default `True`
+        :type wait: bool
+        """
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
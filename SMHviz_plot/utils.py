@@ -1,17 +1,24 @@
+import collections
+import copy
+import functools
+import math
 import re
-import plotly.express as px
+import sys
+import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 
 
 def prep_subplot(sub_var, sub_title, x_title, y_title, sort=True, font_size=14, subplot_spacing=0.05, share_x="all",
-                 share_y="all", row_num=None, specs=None):
+                 share_y="all", row_num=None, specs=None, lazy=False, populated=None):
     """ Prepare Plotly subplot object
 
     Prepared a Plotly Figure object with predefined subplots information:
         - column grid: 2 if length `sub_var` is superior to 1 (1 if not)
         - row grid: length of `sub_var` divided by 2 (+1 for odd number) or 1 if length of `sub_var` is lesser than 3
 
+    See `subplot_grid()` for more information on the grid dimension.
+
     :parameter sub_var: List of value associated with the variable used to create the subplot (for example: list of
         scenario value associated with the column `scenario_id`)
     :type sub_var: list
@@ -40,30 +47,173 @@ def prep_subplot(sub_var, sub_title, x_title, y_title, sort=True, font_size=14,
     :parameter specs: Parameter `specs` as in the `plotly.subplots.make_subplots()` function. See
       plotly.subplots.make_subplots()` documentation for more details.
     :type specs: list | None
+    :parameter lazy: Boolean to indicate if the subplots layout should be computed directly with
+        `make_subplot_layout()` instead of `plotly.subplots.make_subplots()` (recommended for large grid). Only
+        available if `specs` is `None`; by default `False`
+    :type lazy: bool
+    :parameter populated: Only used if `lazy` is `True`. List of `sub_var` value containing data, the axes are
+        created only for these subplots. If `None` (default), all the subplots are created.
+    :type populated: list | None
     :return: a Plotly subplots object; `plotly.graph_objs.Figure` with predefined subplots configured in 'layout
     """
     # Sort value
     if sort is True:
-        sub_var.sort()
-    # Row and Columns information
+        sub_var = sorted(sub_var)
+    # Subplots
+    if lazy is True and specs is None:
+        fig = make_subplot_layout(sub_var, sub_title, x_title, y_title, populated=populated, row_num=row_num,
+                                  font_size=font_size, subplot_spacing=subplot_spacing, share_x=share_x,
+                                  share_y=share_y)
+    else:
+        from plotly.subplots import make_subplots
+        # Row and Columns information
+        row_num, col_num = subplot_grid(len(sub_var), row_num=row_num)
+        fig = make_subplots(rows=int(row_num), cols=int(col_num), subplot_titles=sub_title, shared_yaxes=share_y,
+                            shared_xaxes=share_x, vertical_spacing=subplot_spacing,
+                            horizontal_spacing=subplot_spacing, x_title=x_title, y_title=y_title, specs=specs)
+        fig.update_annotations(font_size=font_size)
+    return fig
+
+
+def subplot_grid(n_plot, row_num=None):
+    """ Returns subplot grid dimension
+
+    Returns the number of rows and columns of the subplot grid used for `n_plot` subplots:
+        - if `row_num` is None: 2 columns and length of `n_plot` divided by 2 (+1 for odd number) rows, or 1 row if
+          `n_plot` is lesser than 3
+        - if `row_num` is not None: `row_num` rows and `round((n_plot / row_num) + 0.4)` columns (+1 column if the
+          grid is too small to contain all the subplots)
+
+    :parameter n_plot: Number of subplots
+    :type n_plot: int
+    :parameter row_num: If `row_num` is not None, force a number of rows in the output subplots
+    :type row_num: int | None
+    :return: a list with 2 values: [number of rows, number of columns]
+    """
     if row_num is None:
-        if len(sub_var) > 2:
+        if n_plot > 2:
             col_num = 2
-            if len(sub_var) % 2 == 0:
-                row_num = len(sub_var) / 2
-            else:
-                row_num = (len(sub_var) + 1) / 2
+            row_num = math.ceil(n_plot / 2)
         else:
             row_num = 1
-            col_num = len(sub_var)
+            col_num = n_plot
     else:
-        row_num = row_num
-        col_num = round((len(sub_var) / row_num) + 0.4)
+        col_num = round((n_plot / row_num) + 0.4)
+        if col_num * row_num < n_plot:
+            col_num = math.ceil(n_plot / row_num)
+    return [int(row_num), max(int(col_num), 1)]
+
+
+SubplotRef = collections.namedtuple("SubplotRef", ("subplot_type", "layout_keys", "trace_kwargs"))
+
+
+def make_subplot_layout(sub_var, sub_title, x_title, y_title, populated=None, row_num=None, font_size=14,
+                        subplot_spacing=0.05, share_x="all", share_y="all"):
+    """ Prepare Plotly subplot object for large grid
+
+    Prepared a Plotly Figure object with predefined subplots information, equivalent to
+    `plotly.subplots.make_subplots()` but with the domains and axis references of each subplot directly calculated
+    from its position in the grid (see `subplot_grid()`). The axes are created only for the subplots associated with
+    a value in `populated`, the other cells of the grid stay empty.
+
+    The axis reference of each subplot follows the `plotly.subplots.make_subplots()` numbering (row by row, starting
+    at the top left), and the output Figure can be used with the `row` and `col` parameters of
+    `plotly.graph_objs.Figure.add_trace()` (see `subplot_row_col()`).
+
+    The spacing between subplots is reduced if necessary to keep the total spacing lesser than half of the Figure
+    width or height.
+
+    :parameter sub_var: List of value associated with the variable used to create the subplot (for example: list of
+        scenario value associated with the column `scenario_id`)
+    :type sub_var: list
+    :parameter sub_title: Title(s) for each subplot, should be of same length as `sub_var`. `None` for no titles.
+    :type sub_title: list | None
+    :parameter x_title: Title of the x-axis
+    :type x_title: str
+    :parameter y_title: Title of the y-axis
+    :type y_title: str
+    :parameter populated: List of `sub_var` value containing data, the axes are created only for these subplots. If
+        `None` (default), all the subplots are created.
+    :type populated: list | None
+    :parameter row_num: If `row_num` is not None, force a number of rows in the output subplots
+    :type row_num: int | None
+    :parameter font_size:  Font size of the subplots annotation, by default `14`
+    :type font_size: int
+    :parameter subplot_spacing: Space between subplot rows and columns, must be a float between 0 and 1; by default
+        `0.05`
+    :type subplot_spacing: int | float
+    :parameter share_x: Share x-axis in-between subplots: `"all"`, `"columns"` (or `True`), `"rows"` or `False`;
+        by default `"all"`
+    :type share_x: bool | str
+    :parameter share_y: Share y-axis in-between subplots: `"all"`, `"rows"` (or `True`), `"columns"` or `False`;
+        by default `"all"`
+    :type share_y: bool | str
+    :return: a Plotly subplots object; `plotly.graph_objs.Figure` with predefined subplots configured in 'layout
+    """
+    sub_var = list(sub_var)
+    if populated is not None:
+        populated = set(populated)
+    row_num, col_num = subplot_grid(len(sub_var), row_num=row_num)
+    # Domains
+    h_spacing = min(subplot_spacing, 0.5 / (col_num - 1)) if col_num > 1 else 0
+    v_spacing = min(subplot_spacing, 0.5 / (row_num - 1)) if row_num > 1 else 0
+    width = (1 - h_spacing * (col_num - 1)) / col_num
+    height = (1 - v_spacing * (row_num - 1)) / row_num
     # Subplots
-    fig = make_subplots(rows=int(row_num), cols=int(col_num), subplot_titles=sub_title, shared_yaxes=share_y,
-                        shared_xaxes=share_x, vertical_spacing=subplot_spacing, horizontal_spacing=subplot_spacing,
-                        x_title=x_title, y_title=y_title, specs=specs)
-    fig.update_annotations(font_size=font_size)
+    layout = dict()
+    annotations = list()
+    grid_ref = [[None] * col_num for _ in range(row_num)]
+    panels = list()
+    for i in range(len(sub_var)):
+        if populated is not None and sub_var[i] not in populated:
+            continue
+        row, col = i // col_num, i % col_num
+        x_domain = [round(col * (width + h_spacing), 10), round(col * (width + h_spacing) + width, 10)]
+        y_domain = [round((row_num - 1 - row) * (height + v_spacing), 10),
+                    round((row_num - 1 - row) * (height + v_spacing) + height, 10)]
+        axis_id = str(i + 1) if i > 0 else ""
+        layout["xaxis" + axis_id] = dict(anchor="y" + axis_id, domain=x_domain)
+        layout["yaxis" + axis_id] = dict(anchor="x" + axis_id, domain=y_domain)
+        grid_ref[row][col] = (SubplotRef("xy", ("xaxis" + axis_id, "yaxis" + axis_id),
+                                         dict(xaxis="x" + axis_id, yaxis="y" + axis_id)),)
+        panels.append([row, col, axis_id])
+        if sub_title is not None and i < len(sub_title) and sub_title[i]:
+            annotations.append(dict(text=sub_title[i], x=sum(x_domain) / 2, y=y_domain[1], xref="paper",
+                                    yref="paper", xanchor="center", yanchor="bottom", showarrow=False,
+                                    font=dict(size=font_size)))
+    # Shared axes: all the axes of a group match the bottom left axis of the group
+    panels.sort(key=lambda panel: (-panel[0], panel[1]))
+    for axis, share in [["x", share_x], ["y", share_y]]:
+        if share is True:
+            share = "columns" if axis == "x" else "rows"
+        if share not in ["all", "columns", "rows"]:
+            continue
+        first_axis = dict()
+        for row, col, axis_id in panels:
+            group = {"all": 0, "columns": col, "rows": row}[share]
+            if group not in first_axis:
+                first_axis[group] = axis + axis_id
+            else:
+                layout[axis + "axis" + axis_id]["matches"] = first_axis[group]
+        # Tick labels only on the bottom subplot of each column (x) or on the left subplot of each row (y)
+        if (axis == "x" and share in ["all", "columns"]) or (axis == "y" and share in ["all", "rows"]):
+            labeled = list()
+            for row, col, axis_id in panels:
+                label_group = col if axis == "x" else row
+                if label_group in labeled:
+                    layout[axis + "axis" + axis_id]["showticklabels"] = False
+                else:
+                    labeled.append(label_group)
+    # Axis titles
+    if x_title:
+        annotations.append(dict(text=x_title, x=0.5, y=0, xref="paper", yref="paper", xanchor="center",
+                                yanchor="top", yshift=-30, showarrow=False, font=dict(size=font_size)))
+    if y_title:
+        annotations.append(dict(text=y_title, x=0, y=0.5, xref="paper", yref="paper", xanchor="right",
+                                yanchor="middle", xshift=-40, textangle=-90, showarrow=False,
+                                font=dict(size=font_size)))
+    layout["annotations"] = annotations
+    fig = go.Figure(dict(data=[], layout=layout, _grid_ref=grid_ref, _grid_str=None))
     return fig
 
 
@@ -71,7 +221,7 @@ def subplot_row_col(sub_var, var, orientation=None, row_num=None):
     """ Returns row and column information
 
     For a subplots Figure, returns the associated row and column information for a specific value for an object
-    created with `prep_subplot()` function and containing less than 7 plots in the subplot object for None orientation.
+    created with `prep_subplot()` function, filling the grid (see `subplot_grid()`) row by row for None orientation.
     If orientation is not None, all the subplots are either in 1 column ("v") or 1 row ("h")
 
     :parameter sub_var: List of value associated with the variable used to create the subplot (for example: list of
@@ -87,25 +237,17 @@ def subplot_row_col(sub_var, var, orientation=None, row_num=None):
     :return: a list with 2 values: [row number, column number] in the subplots
     """
     if row_num is not None:
-        n_col = round((len(sub_var) / row_num) + 0.4)
+        n_col = subplot_grid(len(sub_var), row_num=row_num)[1]
         if row_num == 1:
             orientation = "h"
         if n_col == 1:
             orientation = "v"
+    sub_var = list(sub_var)
     if orientation is None:
-        scen_order_dict = dict(zip(sub_var, list(range(len(sub_var)))))
-        if scen_order_dict[var] < 2:
-            n_row = 1
-        elif scen_order_dict[var] < 4:
-            n_row = 2
-        else:
-            n_row = 3
-        if scen_order_dict[var] % 2 == 0:
-            n_col = 1
-        else:
-            n_col = 2
+        n_col_grid = subplot_grid(len(sub_var), row_num=row_num)[1]
+        n_row = sub_var.index(var) // n_col_grid + 1
+        n_col = sub_var.index(var) % n_col_grid + 1
     else:
-        sub_var = list(sub_var)
         if orientation == "h":
             n_col = sub_var.index(var) + 1
             n_row = 1
@@ -217,6 +359,166 @@ def make_slider_buttons(x=-0.1, y=-0.25, redraw=False, duration=300):
     return button
 
 
+def make_frame(name, frame_update, trace_type=None):
+    """ Create an animation frame
+
+    Create a dictionary containing an animation frame only updating some properties of the base traces of a Figure,
+    for example:
+
+    ```
+        make_frame("2023-01-07", {0: {"z": [1, 2, 3]}, 2: {"y": [4, 5], "customdata": [6, 7]}})
+    ```
+
+    will return a frame updating the `z` property of the first trace, and the `y` and `customdata` properties of the
+    third trace of the Figure. The other traces and properties are not repeated in the frame.
+
+    :parameter name: Name of the frame, also used as slider label
+    :type name: str
+    :parameter frame_update: Dictionary with the index of the trace to update in the Figure (key) and a dictionary
+        with the property(ies) to update and the associated new value (value)
+    :type frame_update: dict
+    :parameter trace_type: Dictionary with the index of the trace (key) and the associated trace type (value, for
+        example: "heatmap"), required for all traces other than "scatter". By default, `None`
+    :type trace_type: dict | None
+    :return: a dictionary with the frame information
+    """
+    frame_data = list()
+    for trace_index in frame_update:
+        if trace_type is not None and trace_index in trace_type:
+            frame_data.append(dict(type=trace_type[trace_index], **frame_update[trace_index]))
+        else:
+            frame_data.append(frame_update[trace_index])
+    frame = {
+        "name": str(name),
+        "data": frame_data,
+        "traces": list(frame_update.keys())
+    }
+    return frame
+
+
+def df_frame_generator(df, frame_col, value_col, trace_index=0, frame_property="z", sort_col=None):
+    """ Generate animation frames from a DataFrame
+
+    Generator returning, for each unique value of the `frame_col` column (sorted), a tuple (name, frame_update) as
+    expected by `add_animation_frames()`, with the `value_col` column used to update the `frame_property` property of
+    the trace `trace_index` of a Figure. The DataFrame is grouped only once.
+
+    :parameter df: a DataFrame containing the `frame_col` and `value_col` columns
+    :type df: pandas.DataFrame
+    :parameter frame_col: Name of the column containing the frame name (for example a date)
+    :type frame_col: str
+    :parameter value_col: Name of the column containing the value associated with each frame
+    :type value_col: str
+    :parameter trace_index: Index of the trace to update in the Figure, by default `0`
+    :type trace_index: int
+    :parameter frame_property: Name of the trace property to update, by default `"z"`
+    :type frame_property: str
+    :parameter sort_col: Name of the column used to sort the value inside each frame (should match the order of the
+        base trace), by default `None` (no sorting)
+    :type sort_col: str | None
+    :return: a generator of tuples (frame name, frame update)
+    """
+    if sort_col is not None:
+        df = df.sort_values(sort_col, kind="stable")
+    for frame_name, df_frame in df.groupby(frame_col, sort=True):
+        yield frame_name, {trace_index: {frame_property: df_frame[value_col].to_numpy()}}
+
+
+def matrix_frame_generator(matrix, facet=0, trace_index=0, frame_property="z", date_format="%Y-%m-%d"):
+    """ Generate animation frames from a matrix
+
+    Generator returning, for each column of a (location x date) matrix (see `map_frame_matrix()` or
+    `prep_heatmap_matrix()`), a tuple (name, frame_update) as expected by `add_animation_frames()`, with the column
+    used to update the `frame_property` property of the trace `trace_index` of a Figure. The frame name is the
+    associated "x" label (formatted with `date_format` if it is a date).
+
+    :parameter matrix: a dictionary with the objects "z": array of dimension (facet x location x date) and "x":
+        array of the dates
+    :type matrix: dict
+    :parameter facet: Index of the facet matrix to use, by default `0`
+    :type facet: int
+    :parameter trace_index: Index of the trace to update in the Figure, by default `0`
+    :type trace_index: int
+    :parameter frame_property: Name of the trace property to update, by default `"z"`
+    :type frame_property: str
+    :parameter date_format: Format of the frame name for date labels, by default `"%Y-%m-%d"`
+    :type date_format: str
+    :return: a generator of tuples (frame name, frame update)
+    """
+    z = matrix["z"][facet]
+    for i, frame_name in enumerate(matrix["x"]):
+        if isinstance(frame_name, (pd.Timestamp, np.datetime64)):
+            frame_name = pd.Timestamp(frame_name).strftime(date_format)
+        yield frame_name, {trace_index: {frame_property: z[:, i]}}
+
+
+def add_animation_frames(fig, frames, slider=None, button=None, redraw=False, duration=300, report_size=False):
+    """ Add animation frames and slider to a Figure
+
+    Add animation frames to a Figure, with an associated slider (one step per frame) and a "play/pause" button. The
+    frames only contain the updated data arrays (for example `z`, `y`, `customdata`) and reference the base traces of
+    the Figure by index (see `make_frame()`), the base traces are not duplicated in each frame.
+
+    The `frames` parameter can be a list or a generator of tuples (frame name, frame update), see
+    `df_frame_generator()` for example. Each frame is created when consumed from the generator.
+
+    :parameter fig: a Figure object to update, containing the base traces
+    :type fig: plotly.graph_objs.Figure
+    :parameter frames: list or generator of tuples (frame name, frame update), with frame update as a dictionary with
+        the index of the trace to update (key) and a dictionary with the property(ies) to update and associated new
+        value (value)
+    :type frames: list | collections.abc.Iterable
+    :parameter slider: Dictionary with a "blank" slider, if `None` (default), created with `make_blank_slider()`. The
+        dictionary is copied, it can be reused as a template
+    :type slider: dict | None
+    :parameter button: "play/pause" button information, if `None` (default), created with `make_slider_buttons()`.
+        Set to `False` for no button.
+    :type button: list | bool | None
+    :parameter redraw: Boolean, slider and button redraw associated information, by default `False`
+    :type redraw: bool
+    :parameter duration: Slider duration transition; by default `300`
+    :type duration: int
+    :parameter report_size: Boolean to indicate if the size (in bytes) of each serialized frame should be returned;
+        by default `False`
+    :type report_size: bool
+    :return: a plotly.graph_objs.Figure object with animation frames and slider. If `report_size` is `True`, a
+        dictionary with 2 objects: "figure": the Figure object and "frame_size": a dictionary with the frame name
+        (key) and the size in bytes of the serialized frame (value)
+    """
+    # Caller slider and button templates are copied, not updated
+    if slider is None:
+        slider = make_blank_slider(duration=duration)
+    else:
+        slider = copy.deepcopy(slider)
+    if button is None:
+        button = make_slider_buttons(redraw=redraw, duration=duration)
+    elif button is not False:
+        button = copy.deepcopy(button)
+    trace_type = dict(enumerate([trace.type for trace in fig.data]))
+    frame_list = list()
+    frame_size = dict()
+    for frame_name, frame_update in frames:
+        frame = make_frame(frame_name, frame_update, trace_type=trace_type)
+        if report_size is True:
+            import json
+            from plotly.utils import PlotlyJSONEncoder
+            frame_size[frame["name"]] = len(json.dumps(frame, cls=PlotlyJSONEncoder).encode("utf-8"))
+        frame_list.append(go.Frame(frame))
+        slider["steps"].append({
+            "args": [[frame["name"]], {"frame": {"duration": duration, "redraw": redraw}, "mode": "immediate",
+                                       "transition": {"duration": duration}}],
+            "label": frame["name"],
+            "method": "animate"
+        })
+    fig.frames = frame_list
+    fig.update_layout(sliders=[slider])
+    if button is not False:
+        fig.update_layout(updatemenus=button)
+    if report_size is True:
+        fig = {"figure": fig, "frame_size": frame_size}
+    return fig
+
+
 def make_ens_button(fig_plot, viz_truth_data=True, truth_legend_name="Truth Data", ensemble_name=None,
                     button_name="Ensemble", button_opt="all"):
     """ Ensemble button
@@ -318,6 +620,69 @@ def color_line_trace(color_dict, mod_name, ensemble_name=None, ensemble_color=No
     return [color, line_width]
 
 
+@functools.lru_cache(maxsize=1024)
+def compile_hover_text(hover_text):
+    """ Parse a hover text
+
+    Split a hover text on the "%{<column name>}" fields. The parsing is cached: each hover text is parsed only once.
+
+    :parameter hover_text: Hover text, for example: "Model: %{model_name}<br>"
+    :type hover_text: str
+    :return: a tuple with 2 objects: the name of the column of the first field (`None` if no field) and a tuple of the
+        text around the fields
+    """
+    field = re.findall("%{.+?}", hover_text)
+    if len(field) == 0:
+        return None, (hover_text,)
+    return re.sub("%{|}", "", field[0]), tuple(re.split("%{.+?}", hover_text))
+
+
+def fill_hover_text(hover_text, df):
+    """ Replace the fields of a hover text
+
+    Replace all the "%{<column name>}" fields of `hover_text` by the first value of the column of the first field in
+    `df` (see `compile_hover_text()`). The output string is interned: the identical hover texts of multiple traces
+    are stored once.
+
+    :parameter hover_text: Hover text, for example: "Model: %{model_name}<br>"
+    :type hover_text: str
+    :parameter df: a DataFrame containing the column of the first field
+    :type df: pandas.DataFrame
+    :return: a string
+    """
+    column, text = compile_hover_text(hover_text)
+    if column is None:
+        return hover_text
+    return sys.intern(str(df[column].iloc[0]).join(text))
+
+
+@functools.lru_cache(maxsize=1024)
+def ribbon_hover_template(hover_text, quant_low, quant_up, rm_second_hover=False):
+    """ Hover templates of the intervals (ribbons)
+
+    Create the hover templates of the lower and upper traces of an interval (see `ui_ribbons()`). The templates are
+    cached and interned: created once per hover text and interval.
+
+    :parameter hover_text: Appending text appearing on hover
+    :type hover_text: str
+    :parameter quant_low: Lower quantile of the interval
+    :type quant_low: float
+    :parameter quant_up: Upper quantile of the interval
+    :type quant_up: float
+    :parameter rm_second_hover: Boolean to remove hover associated with the upper trace; by default `False`
+    :type rm_second_hover: bool
+    :return: a tuple with the hover templates of the lower ("first") and upper ("second") traces
+    """
+    interval_text = hover_text + str(round((quant_up - quant_low) * 100)) + " % Interval: "
+    first_hover_text = interval_text + "%{y:,.2f} - %{customdata:,.2f}<br>Epiweek: %{x|%Y-%m-%d}<extra></extra>"
+    if rm_second_hover is False:
+        second_hover_text = (interval_text +
+                             "%{customdata:,.2f} - %{y:,.2f}<br>Epiweek: %{x|%Y-%m-%d}<extra></extra>")
+    else:
+        second_hover_text = "<extra></extra>"
+    return sys.intern(first_hover_text), sys.intern(second_hover_text)
+
+
 def make_palette_sequential(df, legend_col, palette="turbo"):
     """ Legend Color Dictionary
 
@@ -335,10 +700,132 @@ def make_palette_sequential(df, legend_col, palette="turbo"):
     :return: a dictionary with the legend value and the associated color (derived from the palette information)
     """
     if len(df[legend_col].unique()) > 1:
-        palette_list = px.colors.sample_colorscale(palette, len(df[legend_col].unique()))
+        from plotly.colors import sample_colorscale
+        palette_list = sample_colorscale(palette, len(df[legend_col].unique()))
         for i in range(0, len(palette_list)):
             palette_list[i] = re.sub("\)", ", 1)", re.sub("rgb", "rgba", palette_list[i]))
         color_dict = dict(zip(df[legend_col].unique(), palette_list))
     else:
         color_dict = dict(zip(df[legend_col].unique(), ["rgba(0, 0, 255, 1)"]))
     return color_dict
+
+
+def build_facet_traces(add_function, facet_param):
+    """ Build the traces of one facet
+
+    Call `add_function` on an empty Figure (without subplots) with the `facet_param` parameters and return the
+    traces added, as dictionaries. The DataFrame parameters can be passed as shared memory handles (see
+    `df_to_shared()`), the DataFrames are reconstructed from the shared memory blocks without copying the
+    numeric columns.
+
+    :parameter add_function: Function adding traces to a Figure (first parameter) with a `subplot_coord` parameter,
+        for example `add_spaghetti_plot()`
+    :type add_function: function
+    :parameter facet_param: Dictionary of parameters of the `add_function` function
+    :type facet_param: dict
+    :return: a list of dictionaries, one per trace
+    """
+    from SMHviz_plot.utils_data import SharedFrame, df_from_shared
+    shm_list = list()
+    param = dict()
+    for key, value in facet_param.items():
+        if isinstance(value, SharedFrame):
+            param[key], shm = df_from_shared(value)
+            shm_list.append(shm)
+        else:
+            param[key] = value
+    try:
+        fig = go.Figure()
+        add_function(fig, subplot_coord=None, **param)
+        # The trace data are copies of the DataFrames values
+        traces = [trace.to_plotly_json() for trace in fig.data]
+    finally:
+        del param
+        for shm in shm_list:
+            shm.close()
+    return traces
+
+
+def add_facet_traces(fig, add_function, facet_list, n_worker=None):
+    """ Add the traces of multiple facets to a Figure
+
+    Call `add_function` for each facet of `facet_list`. If `n_worker` is `None` (default), the traces are added
+    directly to `fig`, one facet after the other. Otherwise, the traces of each facet are built independently in a
+    pool of `n_worker` processes (see `build_facet_traces()`) and a new Figure is created with the layout of `fig` and
+    all the traces in the order of `facet_list`: the output Figure is the same as without workers.
+
+    The `add_function` function and its parameters should be picklable (module level function, etc.). The DataFrame
+    parameters are sent to the workers in shared memory blocks (see `shared_df()`), removed when all the facets are
+    built. The pool is created at each call, for small plots it might be faster without workers.
+
+    :parameter fig: a Figure object to update
+    :type fig: plotly.graph_objs.Figure
+    :parameter add_function: Function adding traces to a Figure (first parameter) with a `subplot_coord` parameter
+        ([row number, column number] or `None`), for example `add_spaghetti_plot()`
+    :type add_function: function
+    :parameter facet_list: List of facets, each facet as a list: [subplot coordinates, dictionary of the
+        `add_function` parameters]
+    :type facet_list: list
+    :parameter n_worker: Number of worker processes, by default `None` (no workers)
+    :type n_worker: int | None
+    :return: a plotly.graph_objs.Figure object with the added traces
+    """
+    if n_worker is None or len(facet_list) < 2:
+        for subplot_coord, facet_param in facet_list:
+            add_function(fig, subplot_coord=subplot_coord, **facet_param)
+    else:
+        import concurrent.futures
+        from SMHviz_plot.utils_data import shared_df
+        # DataFrame parameters sent to the workers in shared memory
+        df_dict = dict()
+        for i, (subplot_coord, facet_param) in enumerate(facet_list):
+            for key, value in facet_param.items():
+                if isinstance(value, pd.DataFrame):
+                    df_dict[(i, key)] = value
+        with shared_df(df_dict) as handle:
+            param_list = list()
+            for i, (subplot_coord, facet_param) in enumerate(facet_list):
+                param_list.append({key: handle.get((i, key), value) for key, value in facet_param.items()})
+            with concurrent.futures.ProcessPoolExecutor(max_workers=n_worker) as executor:
+                facet_traces = list(executor.map(build_facet_traces, [add_function] * len(facet_list), param_list))
+        # Axes of each subplot (`plotly.graph_objs.Figure.get_subplot()`)
+        all_traces = list(fig.data)
+        for (subplot_coord, facet_param), traces in zip(facet_list, facet_traces):
+            if subplot_coord is not None:
+                subplot = fig.get_subplot(subplot_coord[0], subplot_coord[1])
+                axis_ref = dict(xaxis=subplot.xaxis.plotly_name.replace("axis", ""),
+                                yaxis=subplot.yaxis.plotly_name.replace("axis", ""))
+                for trace in traces:
+                    trace.update(axis_ref)
+            all_traces.extend(traces)
+        # The traces are already validated by the workers: the Figure is created once, without validation. The
+        # Figure, its layout and its traces validate the next updates, as a Figure created without workers
+        fig = go.Figure(dict(data=all_traces, layout=fig.layout, _grid_ref=fig._grid_ref, _grid_str=None),
+                        _validate=False)
+        for plotly_object in [fig, fig.layout] + list(fig.data):
+            plotly_object._validate = True
+    return fig
+
+
+def decimate_ratio_meta(fig):
+    """ Report the ratio of retained points of a Figure
+
+    Sum the number of retained and input points of the decimated traces of a Figure (traces with a `meta` dictionary
+    containing a "decimate" list: [number of retained points, number of input points], see `decimate_df()`) and
+    store the ratio of retained points in the layout `meta` dictionary, as "decimate_ratio". The Figure is not
+    updated if no trace is decimated.
+
+    :parameter fig: a Figure object to update
+    :type fig: plotly.graph_objs.Figure
+    :return: a plotly.graph_objs.Figure object, with the "decimate_ratio" value in `fig.layout.meta` if at least one
+        trace is decimated
+    """
+    point = [trace.meta["decimate"] for trace in fig.data if isinstance(trace.meta, dict) and
+             "decimate" in trace.meta]
+    if len(point) > 0:
+        n_out = sum(i[0] for i in point)
+        n_in = sum(i[1] for i in point)
+        meta = dict(fig.layout.meta) if isinstance(fig.layout.meta, dict) else dict()
+        meta["decimate_ratio"] = n_out / n_in if n_in > 0 else 1
+        fig.update_layout(meta=meta)
+    return fig
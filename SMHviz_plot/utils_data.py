@@ -1,6 +1,13 @@
+import collections
+import contextlib
+import hashlib
+import os
+
 import numpy as np
 import pandas as pd
 
+SharedFrame = collections.namedtuple("SharedFrame", ["name", "n_row", "column", "index_name"])
+
 
 def calculate_rel_change(row):
     if row["value_ref"] == 0:
@@ -85,36 +92,224 @@ def calculate_relative_change(df, comp, comparison_reference, on_vars):
     df_ref = df_ref.rename(columns={
         "scenario_id": "scen_ref", "end_value": "value_ref"})[["scen_ref", "value_ref"] + on_vars]
     df_rel_change = df_comp.merge(df_ref, on=on_vars)
-    df_rel_change["rel_change"] = df_rel_change.apply(calculate_rel_change, axis=1)
+    # Same output as `calculate_rel_change()` (built-in `round()`), without the row-wise apply
+    rel_change = (df_rel_change["value_comp"] / df_rel_change["value_ref"] - 1).apply(round, args=(3,))
+    df_rel_change["rel_change"] = rel_change.where(df_rel_change["value_ref"] != 0)
     df_rel_change["comparison"] = comp
     return df_rel_change
 
 
-def scen_comparison_data(df, max_week, end_method, comparison_reference, model_exclusion=None, calc_week=False,
-                         on_vars=None):
-    # Model
-    if on_vars is None:
-        on_vars = ["target", "model_name"]
-    model_list = list(df["model_name"].drop_duplicates())
-    if model_exclusion is not None:
-        for j in model_exclusion:
-            if j in model_list:
-                model_list.remove(j)
-    df = df[df["model_name"].isin(model_list)]
-    # Get end_values
-    df_endvalue = df.copy()
+def cum_horizon_index(df, key_col=None):
+    """ Create a horizon index
+
+    Creates a (group x horizon) matrix of the "value" column, with one group per unique combination of the `key_col`
+    columns, and its prefix sum over the horizons. The value (or the cumulative value) of each group at any horizon
+    is then an array lookup (see `horizon_index_value()`), the data is only read once for all the horizons.
+    Multiple rows of the same group and horizon are summed.
+
+    :parameter df: DataFrame containing the `key_col` columns and the columns "horizon" and "value"
+    :type df: pandas.DataFrame
+    :parameter key_col: List of the columns identifying a group, by default
+        `["scenario_id", "target", "model_name"]` (for example add "location" for multiple locations)
+    :type key_col: list
+    :return: a dictionary with the keys: "key" (DataFrame of the groups, in order of appearance), "horizon"
+        (array of the horizons, matrix columns), "value" (group x horizon matrix, NaN if no value) and "cumsum"
+        (group x horizon matrix of the cumulative sum)
+    """
+    if key_col is None:
+        key_col = ["scenario_id", "target", "model_name"]
+    df_group = df.groupby(key_col, sort=False, dropna=False)
+    code = df_group.ngroup().to_numpy()
+    key = df_group.size().index.to_frame(index=False)
+    horizon = df["horizon"].astype(int).to_numpy()
+    horizon_list = np.arange(horizon.min(), horizon.max() + 1)
+    total = np.zeros((len(key), len(horizon_list)))
+    count = np.zeros((len(key), len(horizon_list)), dtype=int)
+    np.add.at(total, (code, horizon - horizon_list[0]), df["value"].to_numpy(dtype=float))
+    np.add.at(count, (code, horizon - horizon_list[0]), 1)
+    return {"key": key, "horizon": horizon_list, "value": np.where(count > 0, total, np.nan),
+            "cumsum": np.cumsum(total, axis=1)}
+
+
+def horizon_index_value(index, max_week, cumulative=False):
+    """ Value of each group of a horizon index at a horizon
+
+    :parameter index: Horizon index, output of `cum_horizon_index()`
+    :type index: dict
+    :parameter max_week: Horizon
+    :type max_week: int | str
+    :parameter cumulative: Boolean to return the sum of the values of the horizons lower or equal to `max_week`
+        (`model_cum_data()`) instead of the value at `max_week` (`end_cum_value()`)
+    :type cumulative: bool
+    :return: an array with one value per group (NaN if a group has no value at `max_week`, and `cumulative` is
+        False)
+    """
+    h = int(max_week) - index["horizon"][0]
+    n_horizon = len(index["horizon"])
+    if cumulative is True:
+        if h < 0:
+            return np.zeros(len(index["key"]))
+        return index["cumsum"][:, min(h, n_horizon - 1)]
+    if h < 0 or h >= n_horizon:
+        return np.full(len(index["key"]), np.nan)
+    return index["value"][:, h]
+
+
+def index_end_value(df, max_week, end_method, calc_week=False, index=None):
+    """ Calculate the end values from a horizon index
+
+    Same output as calling `end_method` (`zeroed_cum_data`, `end_cum_value` or `model_cum_data`) on each scenario,
+    target and model of `df`, calculated from a horizon index (see `cum_horizon_index()`).
+
+    :parameter df: DataFrame containing the columns: "scenario_id", "target", "model_name", "horizon", "value"
+    :type df: pandas.DataFrame
+    :parameter max_week: Horizon of the end value
+    :type max_week: int | str
+    :parameter end_method: `zeroed_cum_data`, `end_cum_value` or `model_cum_data`
+    :type end_method: function
+    :parameter calc_week: For `zeroed_cum_data` only, Boolean to return the value of each week
+    :type calc_week: bool | str
+    :parameter index: Horizon index of `df`, by default `None`, the index is created from `df`
+    :type index: dict | None
+    :return: a DataFrame, see `end_value_table()`
+    """
+    key_col = ["scenario_id", "target", "model_name"]
+    if index is None:
+        index = cum_horizon_index(df, key_col)
+    # Loop order: scenario, target, model (order of appearance)
+    order = [pd.Index(df[col].drop_duplicates()) for col in key_col]
+    shape = tuple(len(i) for i in order)
+    code = tuple(order[i].get_indexer(index["key"][col]) for i, col in enumerate(key_col))
+    present = np.zeros(shape, dtype=bool)
+    present[code] = True
+    end_val = np.full(shape, np.nan)
+    end_val[code] = horizon_index_value(index, max_week, cumulative=end_method == model_cum_data)
+    if end_method == model_cum_data:
+        # Every scenario, target and model, 0 if no data
+        end_val[~present] = 0
+        present[:] = True
+    scen, targ, model = np.unravel_index(np.flatnonzero(present.ravel()), shape)
+    df_end = pd.DataFrame({
+        "scenario_id": order[0][scen],
+        "model_name": order[2][model],
+        "target": [str(i) for i in order[1][targ]],
+        "end_value": end_val[present]
+    })
+    if end_method == zeroed_cum_data:
+        df_end["week"] = 0
+        if (calc_week is True) or calc_week == "True":
+            # Zeroed cumulative curve: maximum value of the group minus value
+            df_mod = pd.DataFrame({
+                "scenario_id": df["scenario_id"],
+                "model_name": df["model_name"],
+                "target": df["target"].astype(str),
+                "end_value": df.groupby(key_col, sort=False)["value"].transform("max") - df["value"],
+                "week": df["horizon"]
+            })
+            group_order = np.ravel_multi_index(tuple(order[i].get_indexer(df[col]) for i, col in enumerate(key_col)),
+                                               shape)
+            df_end = pd.concat([df_end.set_axis(np.zeros(len(df_end), dtype=int)), df_mod])
+            sort_key = np.concatenate([np.ravel_multi_index((scen, targ, model), shape), group_order])
+            df_end = df_end.iloc[np.argsort(sort_key, kind="stable")]
+    return df_end
+
+
+def end_value_key(df, max_week, end_method, calc_week=False):
+    """ Key of an end value table
+
+    Returns a key (SHA-1 digest) identifying the end value table of `df` calculated with the parameters `max_week`,
+    `end_method` and `calc_week`. The DataFrame is hashed on its content (values, index, column names and types) with
+    `pandas.util.hash_pandas_object()`.
+
+    :parameter df: DataFrame containing the columns: "scenario_id", "target", "model_name", "horizon", "value"
+    :type df: pandas.DataFrame
+    :parameter max_week: Horizon of the end value
+    :type max_week: int | str
+    :parameter end_method: Function to calculate the end value
+    :type end_method: function
+    :parameter calc_week: For `zeroed_cum_data` only, Boolean to return the value of each week
+    :type calc_week: bool | str
+    :return: a string key
+    """
+    key = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    key.update(repr([list(df.columns), list(df.dtypes)]).encode())
+    key.update(repr([max_week, end_method.__module__, end_method.__qualname__, calc_week]).encode())
+    return key.hexdigest()
+
+
+def end_value_table(df, max_week, end_method, calc_week=False, path=None, index=None):
+    """ Create the end value table
+
+    Calculates the end value of each scenario, target and model with the function `end_method` (`zeroed_cum_data`,
+    `end_cum_value` or `model_cum_data`). For these three functions, the end values are read from a horizon index
+    (see `cum_horizon_index()`) instead of filtering the data per scenario, target and model. The table does not
+    depend on the comparisons or on the excluded models and can be calculated once per round and used in multiple
+    `scen_comparison_data()` calls (parameter `end_values`).
+
+    If `path` is provided, the table is read from the Parquet file `path` if it exists and was written from the same
+    data and parameters (see `end_value_key()`, stored in the file in a "table_key" column), or calculated and
+    written in `path` if not (requires a Parquet engine, for example `pyarrow`).
+
+    :parameter df: DataFrame containing the columns: "scenario_id", "target", "model_name", "horizon", "value"
+    :type df: pandas.DataFrame
+    :parameter max_week: Horizon of the end value
+    :type max_week: int | str
+    :parameter end_method: Function to calculate the end value: `zeroed_cum_data`, `end_cum_value` or
+        `model_cum_data`
+    :type end_method: function
+    :parameter calc_week: For `zeroed_cum_data` only, Boolean to return the value of each week
+    :type calc_week: bool | str
+    :parameter path: Path of the Parquet file to read or write the table, by default `None` (no file)
+    :type path: str | None
+    :parameter index: Horizon index of `df` (output of `cum_horizon_index()`), to calculate the table for multiple
+        `max_week` from one index. By default, `None`, the index is created from `df`.
+    :type index: dict | None
+    :return: a DataFrame with the columns: "scenario_id", "model_name", "target", "end_value" (and "week" with
+        `zeroed_cum_data`)
+    """
+    if path is not None:
+        table_key = end_value_key(df, max_week, end_method, calc_week=calc_week)
+        if os.path.exists(path):
+            df_end = pd.read_parquet(path)
+            if "table_key" in df_end.columns and list(df_end["table_key"].unique()) == [table_key]:
+                return df_end.drop(columns="table_key")
+    if end_method in [zeroed_cum_data, end_cum_value, model_cum_data]:
+        df_end = index_end_value(df, max_week, end_method, calc_week=calc_week, index=index)
+        if path is not None:
+            df_end.assign(table_key=table_key).to_parquet(path)
+        return df_end
     df_value = []
-    for scen in df_endvalue["scenario_id"].drop_duplicates():
-        df_scen = df_endvalue[df_endvalue["scenario_id"] == scen]
-        for targ in df_endvalue["target"].drop_duplicates():
+    for scen in df["scenario_id"].drop_duplicates():
+        df_scen = df[df["scenario_id"] == scen]
+        for targ in df["target"].drop_duplicates():
             df_targ = df_scen[df_scen["target"] == targ]
-            for model in df_endvalue["model_name"].drop_duplicates():
+            for model in df["model_name"].drop_duplicates():
                 if end_method == zeroed_cum_data:
                     df_end = end_method(df_targ, max_week, scen, model, targ, calc_week)
                 else:
                     df_end = end_method(df_targ, max_week, scen, model, targ)
                 df_value.append(df_end)
-    df = pd.concat(df_value)
+    df_end = pd.concat(df_value)
+    if path is not None:
+        df_end.assign(table_key=table_key).to_parquet(path)
+    return df_end
+
+
+def scen_comparison_data(df, max_week, end_method, comparison_reference, model_exclusion=None, calc_week=False,
+                         on_vars=None, end_values=None):
+    # Model
+    if on_vars is None:
+        on_vars = ["target", "model_name"]
+    # Get end_values
+    if end_values is None:
+        if model_exclusion is not None:
+            df = df[~df["model_name"].isin(model_exclusion)]
+        df = end_value_table(df, max_week, end_method, calc_week=calc_week)
+    else:
+        # Precomputed end values (see `end_value_table()`), `df`, `max_week`, `end_method` and `calc_week` unused
+        df = end_values
+        if model_exclusion is not None:
+            df = df[~df["model_name"].isin(model_exclusion)]
     # Relative change
     df_all = []
     for comparison in comparison_reference:
@@ -180,9 +375,11 @@ def sample_df(df, scenario, pathogen, k=1000):
     :type scenario: list
     :parameter pathogen: name of the pathogen associated with the data
     :type pathogen: str
-    :parameter k: number of samples to draw, by default 1000
-    :type k: int
-    :return: A DataFrame with three columns: date, value_<pathogen name>, sample_id
+    :parameter k: number of samples to draw, by default 1000. If `None`, no sampling: each trajectory is returned
+      once (recoded from 0 to number of trajectories - 1) with its weight (normalized to sum to 1) in a "weight"
+      column, for the `method="exact"` of `prep_multipat_plot_comb()`
+    :type k: int | None
+    :return: A DataFrame with three columns: date, value_<pathogen name>, sample_id (and "weight" if `k` is `None`)
     """
     pathogen = pathogen.lower()
     if len(scenario) > 0:
@@ -202,6 +399,12 @@ def sample_df(df, scenario, pathogen, k=1000):
         list_sample = flatten_list(list_sample)
         weight_sample_fin = flatten_list(weight_sample) / np.array(len(list(df_scen["model_name"].drop_duplicates())))
         weight_sample_fin = weight_sample_fin / np.array(len(scenario))
+        if k is None:
+            weight_dict = dict(zip(list_sample, weight_sample_fin / np.sum(weight_sample_fin)))
+            all_sample = df_scen[["value", "target_end_date"]].copy()
+            all_sample["sample_id_n"] = pd.factorize(df_scen["sample_id"])[0]
+            all_sample["weight"] = df_scen["sample_id"].map(weight_dict).to_numpy()
+            return all_sample.rename(columns={"value": "value" + "_" + pathogen}).reset_index(drop=True)
         all_sample_sel = np.random.choice(list_sample, p=weight_sample_fin, size=k, replace=True)
         all_sample_sel = list(np.random.permutation(all_sample_sel))
         df_sample_sel = df_scen.reset_index().set_index("sample_id").loc[all_sample_sel]
@@ -211,6 +414,8 @@ def sample_df(df, scenario, pathogen, k=1000):
         all_sample = all_sample.rename(columns={"value": "value" + "_" + pathogen})
     else:
         all_sample = pd.DataFrame(columns=["value" + "_" + pathogen, "target_end_date", "sample_id_n"])
+        if k is None:
+            all_sample["weight"] = pd.Series(dtype=float)
     return all_sample
 
 
@@ -334,7 +539,379 @@ def mean(x):
     return x.mean()
 
 
-def prep_multipat_plot_comb(pathogen_information, calc_mean=False):
+def weighted_quantile(value, weight, prob):
+    """Calculate exact weighted quantiles
+
+    Calculate the quantiles of the discrete distribution of `value` with the probabilities `weight` from the sorted
+    cumulative weights: the quantile `p` is the smallest value with a cumulative weight greater or equal to `p`
+    (mean of the two values if the cumulative weight is equal to `p`). NaN values are ignored.
+
+    :parameter value: Array of values
+    :type value: numpy.ndarray
+    :parameter weight: Array of weights, same length as `value` (normalized internally)
+    :type weight: numpy.ndarray
+    :parameter prob: List of probabilities
+    :type prob: list | numpy.ndarray
+    :return: an array of quantiles, one per probability (NaN if no value)
+    """
+    keep = ~np.isnan(value)
+    value = value[keep]
+    if len(value) == 0:
+        return np.full(len(prob), np.nan)
+    order = np.argsort(value, kind="stable")
+    value = value[order]
+    cum_weight = np.cumsum(weight[keep][order])
+    target = np.asarray(prob, dtype=float) * cum_weight[-1]
+    idx = np.minimum(np.searchsorted(cum_weight, target * (1 - 1e-9), side="left"), len(value) - 1)
+    next_idx = np.minimum(idx + 1, len(value) - 1)
+    on_step = np.isclose(cum_weight[idx], target, rtol=1e-9, atol=0)
+    return np.where(on_step, (value[idx] + value[next_idx]) / 2, value[idx])
+
+
+def weighted_mean(value, weight):
+    """Calculate the weighted mean, ignoring NaN values
+
+    :parameter value: Array of values
+    :type value: numpy.ndarray
+    :parameter weight: Array of weights, same length as `value`
+    :type weight: numpy.ndarray
+    :return: float
+    """
+    keep = ~np.isnan(value)
+    if not keep.any():
+        return np.nan
+    return np.average(value[keep], weights=weight[keep])
+
+
+def combination_sum(value_list, weight_list, max_combination=10 ** 6):
+    """Calculate the distribution of the sum of independent discrete distributions
+
+    Returns all the sums of one value per distribution, with the product of the weights as weight. If the number of
+    combinations is higher than `max_combination`, each distribution is first reduced to `m` values (the weighted
+    quantiles at the probabilities `(k + 0.5) / m`, with equal weights), with `m` the highest integer verifying
+    `m ** len(value_list) <= max_combination`.
+
+    :parameter value_list: List of arrays of values (without NaN)
+    :type value_list: list
+    :parameter weight_list: List of arrays of weights, same length as the associated value arrays
+    :type weight_list: list
+    :parameter max_combination: Maximum number of combinations, by default 1,000,000
+    :type max_combination: int
+    :return: a list of 2 arrays: the values and the weights (`[0]` and `[1]` if `value_list` is empty)
+    """
+    if np.prod([len(value) for value in value_list]) > max_combination:
+        n_value = int(max_combination ** (1 / len(value_list)))
+        while (n_value + 1) ** len(value_list) <= max_combination:
+            n_value += 1
+        prob = (np.arange(n_value) + 0.5) / n_value
+        value_list = [weighted_quantile(value, weight, prob) if len(value) > n_value else value
+                      for value, weight in zip(value_list, weight_list)]
+        weight_list = [np.full(n_value, 1 / n_value) if len(weight) > n_value else weight for weight in weight_list]
+    value_sum = np.zeros(1)
+    weight_sum = np.ones(1)
+    for value, weight in zip(value_list, weight_list):
+        value_sum = np.add.outer(value_sum, value).ravel()
+        weight_sum = np.multiply.outer(weight_sum, weight).ravel()
+    return [value_sum, weight_sum]
+
+
+def combination_quantile(value, weight, other_value, other_weight, prob, operation="sum", max_candidate=2 ** 16):
+    """Calculate exact weighted quantiles of the combinations of two independent distributions
+
+    Calculates the weighted quantiles (same definition as `weighted_quantile()`) of `value + other_value`
+    (`operation="sum"`) or `value / (value + other_value)` (`operation="proportion"`, NaN if `0 / 0`, the values
+    should be non-negative) over all the pairs of one value of each distribution, with the product of the weights as
+    weight, without creating all the pairs.
+
+    The pairs form a matrix sorted along each row (one row per value of `value`, the columns sorted by
+    `other_value`): the number of pairs lower or equal to a value is calculated by a binary search in each row. For
+    each probability, the interval containing the quantile is reduced with pivots drawn among the pairs of the
+    interval, until it contains at most `max_candidate` pairs, sorted to return the quantile. The memory used is
+    proportional to `len(value) + len(other_value) + max_candidate`.
+
+    :parameter value: Array of values, NaN values are ignored
+    :type value: numpy.ndarray
+    :parameter weight: Array of weights, same length as `value`
+    :type weight: numpy.ndarray
+    :parameter other_value: Array of values of the second distribution, NaN values are ignored
+    :type other_value: numpy.ndarray
+    :parameter other_weight: Array of weights, same length as `other_value`
+    :type other_weight: numpy.ndarray
+    :parameter prob: List of probabilities
+    :type prob: list | numpy.ndarray
+    :parameter operation: "sum" (default) or "proportion"
+    :type operation: str
+    :parameter max_candidate: Maximum number of pairs sorted per quantile, by default 65,536
+    :type max_candidate: int
+    :return: an array of quantiles, one per probability (NaN if no value)
+    """
+    keep = ~np.isnan(value)
+    row_value = np.asarray(value, dtype=float)[keep]
+    row_weight = np.asarray(weight, dtype=float)[keep]
+    keep = ~np.isnan(other_value)
+    col_value = np.asarray(other_value, dtype=float)[keep]
+    col_weight = np.asarray(other_weight, dtype=float)[keep]
+    n_col = len(col_value)
+    if len(row_value) == 0 or n_col == 0:
+        return np.full(len(prob), np.nan)
+    # Columns sorted by increasing pair value in each row
+    if operation == "sum":
+        order = np.argsort(col_value, kind="stable")
+        col_value = col_value[order]
+        row_end = np.full(len(row_value), n_col)
+
+        def count_estimate(x):
+            return np.searchsorted(col_value, x - row_value, side="right")
+
+        def pair_value(row, col):
+            return row_value[row] + col_value[col]
+    elif operation == "proportion":
+        if (row_value < 0).any() or (col_value < 0).any():
+            raise ValueError("The proportions require non-negative values")
+        order = np.argsort(-col_value, kind="stable")
+        col_value = col_value[order]
+        col_asc = col_value[::-1]
+        # 0 / 0 pairs (last columns of the rows with a value of 0) ignored
+        row_end = np.where(row_value > 0, n_col, np.count_nonzero(col_value > 0))
+
+        def count_estimate(x):
+            if x < 0:
+                return np.zeros(len(row_value), dtype=int)
+            if x >= 1:
+                return row_end.copy()
+            if x == 0:
+                return np.where(row_value > 0, 0, row_end)
+            return np.minimum(n_col - np.searchsorted(col_asc, row_value * (1 - x) / x, side="left"), row_end)
+
+        def pair_value(row, col):
+            return row_value[row] / (row_value[row] + col_value[col])
+    else:
+        raise ValueError("`operation` should be 'sum' or 'proportion'")
+    col_weight = col_weight[order]
+    col_cum_weight = np.concatenate([[0], np.cumsum(col_weight)])
+    # First and last (+ 1) column of each group of equal values
+    tie_start = np.concatenate([[0], np.flatnonzero(col_value[1:] != col_value[:-1]) + 1])
+    tie_size = np.diff(np.concatenate([tie_start, [n_col]]))
+    tie_first = np.repeat(tie_start, tie_size)
+    tie_end = tie_first + np.repeat(tie_size, tie_size)
+
+    def pair_count(x):
+        # Number of pairs lower or equal to `x` in each row, estimate corrected for the rounding errors
+        count = count_estimate(x)
+        while True:
+            row = np.flatnonzero(count < row_end)
+            row = row[pair_value(row, count[row]) <= x]
+            if len(row) == 0:
+                break
+            count[row] = np.minimum(tie_end[count[row]], row_end[row])
+        while True:
+            row = np.flatnonzero(count > 0)
+            row = row[pair_value(row, count[row] - 1) > x]
+            if len(row) == 0:
+                break
+            count[row] = tie_first[count[row] - 1]
+        return count
+
+    def cum_weight(count):
+        return np.dot(row_weight, col_cum_weight[count])
+
+    def next_value(x):
+        # Smallest pair value higher than `x` (or `x` if none)
+        count = pair_count(x)
+        row = np.flatnonzero(count < row_end)
+        return pair_value(row, count[row]).min() if len(row) > 0 else x
+
+    rng = np.random.default_rng(0)
+    total_weight = cum_weight(row_end)
+    quantile = np.full(len(prob), np.nan)
+    if total_weight == 0:
+        return quantile
+    for i, p in enumerate(prob):
+        target = p * total_weight
+        low_count = np.zeros(len(row_value), dtype=int)
+        low_weight = 0
+        high_count = row_end
+        while True:
+            n_candidate = high_count - low_count
+            candidate_end = np.cumsum(n_candidate)
+            if candidate_end[-1] <= max_candidate:
+                # Sort the remaining pairs
+                row = np.repeat(np.arange(len(row_value)), n_candidate)
+                col = np.arange(candidate_end[-1]) - np.repeat(candidate_end - n_candidate, n_candidate) + \
+                    low_count[row]
+                pair = pair_value(row, col)
+                pair_order = np.argsort(pair, kind="stable")
+                pair = pair[pair_order]
+                pair_cum = low_weight + np.cumsum((row_weight[row] * col_weight[col])[pair_order])
+                idx = min(np.searchsorted(pair_cum, target * (1 - 1e-9), side="left"), len(pair) - 1)
+                quantile[i] = pair[idx]
+                if np.isclose(pair_cum[idx], target, rtol=1e-9, atol=0):
+                    following = pair[idx + 1] if idx + 1 < len(pair) else next_value(pair[idx])
+                    quantile[i] = (pair[idx] + following) / 2
+                break
+            # Random pivot among the pairs of the interval
+            k = rng.integers(candidate_end[-1])
+            row = np.searchsorted(candidate_end, k, side="right")
+            pivot = pair_value(row, low_count[row] + k - candidate_end[row] + n_candidate[row])
+            count = pair_count(pivot)
+            weight_pivot = cum_weight(count)
+            if weight_pivot < target * (1 - 1e-9):
+                low_count, low_weight = count, weight_pivot
+            elif (count != high_count).any():
+                high_count = count
+            else:
+                # Pivot equal to the highest value of the interval: check the smallest value
+                row = np.flatnonzero(n_candidate > 0)
+                lowest = pair_value(row, low_count[row]).min()
+                count = pair_count(lowest)
+                weight_lowest = cum_weight(count)
+                if weight_lowest >= target * (1 - 1e-9):
+                    quantile[i] = lowest
+                    if np.isclose(weight_lowest, target, rtol=1e-9, atol=0):
+                        quantile[i] = (lowest + next_value(lowest)) / 2
+                    break
+                low_count, low_weight = count, weight_lowest
+    return quantile
+
+
+def combination_mean_proportion(value, weight, other_value, other_weight, max_candidate=2 ** 16):
+    """Calculate the weighted mean of the proportions of the combinations of two independent distributions
+
+    Same output as `weighted_mean()` on the proportions `value / (value + other_value)` of all the pairs of one value
+    of each distribution (product of the weights as weight, `0 / 0` ignored), calculated by blocks of at most
+    `max_candidate` pairs.
+
+    :parameter value: Array of values, NaN values are ignored
+    :type value: numpy.ndarray
+    :parameter weight: Array of weights, same length as `value`
+    :type weight: numpy.ndarray
+    :parameter other_value: Array of values of the second distribution, NaN values are ignored
+    :type other_value: numpy.ndarray
+    :parameter other_weight: Array of weights, same length as `other_value`
+    :type other_weight: numpy.ndarray
+    :parameter max_candidate: Maximum number of pairs per block, by default 65,536
+    :type max_candidate: int
+    :return: float
+    """
+    keep = ~np.isnan(value)
+    value, weight = value[keep], weight[keep]
+    keep = ~np.isnan(other_value)
+    other_value, other_weight = other_value[keep], other_weight[keep]
+    # Pairs 0 / 0 ignored, the other pairs with a value of 0 have a proportion of 0
+    total_weight = np.sum(weight) * np.sum(other_weight) - np.sum(weight[value == 0]) * \
+        np.sum(other_weight[other_value == 0])
+    if total_weight <= 0:
+        return np.nan
+    keep = value != 0
+    value, weight = value[keep], weight[keep]
+    total = 0
+    n_row = max(1, max_candidate // max(len(other_value), 1))
+    for start in range(0, len(value), n_row):
+        block_value = value[start:start + n_row, None]
+        total += weight[start:start + n_row] @ ((block_value / (block_value + other_value)) @ other_weight)
+    return total / total_weight
+
+
+def exact_multipat_quantile(pathogen_information, calc_mean=False, max_combination=10 ** 6):
+    """Calculate the Combined Multi-pathogen quantiles from the trajectory weights
+
+    Same output as `prep_multipat_plot_comb()`, calculated without resampling. As the resampling pairs the
+    trajectories of each pathogen independently, the combined distribution of each date is the distribution of all
+    the combinations of one trajectory per pathogen, with the product of the weights as probability:
+
+    - "value_<pathogen>" quantiles: weighted quantiles of the pathogen trajectories
+    - "value" and "proportion_<pathogen>" quantiles: weighted quantiles of all the combinations (sum of the values
+      and value of the pathogen / sum), see `combination_quantile()`
+
+    The combinations are not created: the quantiles are calculated from the trajectories of one pathogen and the
+    distribution of the sum of the other pathogens (see `combination_sum()`). The quantiles are exact for two
+    pathogens, or if the product of the number of trajectories of the other pathogens is lower or equal to
+    `max_combination`; otherwise the distributions of the other pathogens are reduced to `max_combination`
+    combinations (weighted quantiles of each pathogen, probability error lower than the number of pathogens divided
+    by the number of values kept per pathogen). The values should be non-negative.
+
+    The input `pathogen_information` should be in the format: `{<pathogenA>: {"dataframe":<DataFrame>}, etc.}` with
+    `<DataFrame>` in the output format of `sample_df(k=None)` (with a "weight" column, equal weights if missing).
+
+    :parameter pathogen_information: A dictionary containing multiple dictionary containing a DataFrame (key:
+     "dataframe") and named with the associated specific pathogen (keys).
+    :type pathogen_information: dict
+    :parameter calc_mean: Boolean indicating if the mean should be calculated too (in addition to the other quantiles)
+    :type calc_mean: bool
+    :parameter max_combination: Maximum number of combinations of the other pathogens trajectories, by default
+      1,000,000
+    :type max_combination: int
+    :return: A dictionary with 2 objects: "all" and "detail", see `prep_multipat_plot_comb()`
+    """
+    quant_name = ["med", "q1", "q2", "q3", "q4", "q5", "q6", "q7", "q8"]
+    prob = [0.5, 0.025, 0.05, 0.1, 0.25, 0.75, 0.9, 0.95, 0.975]
+    # (trajectory x date) matrix and weights of each pathogen
+    traj = dict()
+    for patho in pathogen_information:
+        df = pathogen_information[patho]["dataframe"]
+        pathogen_name = patho.lower()
+        if len(df) > 0:
+            value = df.pivot(index="sample_id_n", columns="target_end_date", values="value_" + pathogen_name)
+            if "weight" in df.columns:
+                weight = df.groupby("sample_id_n")["weight"].first().reindex(value.index).to_numpy(dtype=float)
+            else:
+                weight = np.ones(len(value))
+            traj[pathogen_name] = {"value": value, "weight": weight / np.sum(weight)}
+    date_list = None
+    for pathogen_name in traj:
+        date_patho = traj[pathogen_name]["value"].columns
+        date_list = date_patho if date_list is None else date_list.intersection(date_patho, sort=False)
+    if date_list is None:
+        date_list = pd.Index([])
+    all_quantile = dict()
+    detail_quantile = dict()
+    for date in date_list:
+        # Trajectories of each pathogen (without NaN) and distribution of the sum of the other pathogens
+        date_value = dict()
+        for pathogen_name in traj:
+            value = traj[pathogen_name]["value"][date].to_numpy(dtype=float)
+            keep = ~np.isnan(value)
+            date_value[pathogen_name] = [value[keep], traj[pathogen_name]["weight"][keep]]
+        other = dict()
+        for pathogen_name in traj:
+            other_name = [i for i in traj if i != pathogen_name]
+            other[pathogen_name] = combination_sum([date_value[i][0] for i in other_name],
+                                                   [date_value[i][1] for i in other_name],
+                                                   max_combination=max_combination)
+        # Sum: trajectories of the pathogen with the most trajectories x other pathogens
+        main_name = max(traj, key=lambda i: len(date_value[i][0]))
+        date_all = dict(zip(["value-" + i for i in quant_name],
+                            combination_quantile(*date_value[main_name], *other[main_name], prob)))
+        date_detail = dict()
+        for patho in pathogen_information:
+            pathogen_name = patho.lower()
+            if pathogen_name in traj:
+                value, weight = date_value[pathogen_name]
+                date_all.update(zip(["value_" + pathogen_name + "-" + i for i in quant_name],
+                                    weighted_quantile(value, weight, prob)))
+                quant = combination_quantile(value, weight, *other[pathogen_name], prob, operation="proportion")
+                if calc_mean is True:
+                    mean_value = combination_mean_proportion(value, weight, *other[pathogen_name])
+            else:
+                date_all.update(dict.fromkeys(["value_" + pathogen_name + "-" + i for i in quant_name], np.nan))
+                quant = np.full(len(prob), np.nan)
+                mean_value = np.nan
+            if calc_mean is True:
+                date_detail["proportion_" + pathogen_name + "-med"] = quant[0]
+                date_detail["proportion_" + pathogen_name + "-mean"] = mean_value
+                date_detail.update(zip(["proportion_" + pathogen_name + "-" + i for i in quant_name[1:]], quant[1:]))
+            else:
+                date_detail.update(zip(["proportion_" + pathogen_name + "-" + i for i in quant_name], quant))
+        all_quantile[date] = date_all
+        detail_quantile[date] = date_detail
+    all_quantile = pd.DataFrame.from_dict(all_quantile, orient="index").sort_index()
+    all_quantile.index.name = "target_end_date"
+    detail_quantile = pd.DataFrame.from_dict(detail_quantile, orient="index").sort_index()
+    detail_quantile.index.name = "target_end_date"
+    return {"all": all_quantile, "detail": detail_quantile}
+
+
+def prep_multipat_plot_comb(pathogen_information, calc_mean=False, method="sample"):
     """Process Data for Combined Multi-pathogen plot
 
     From a dictionary containing each DataFrame associated to a specific pathogen:
@@ -360,10 +937,16 @@ def prep_multipat_plot_comb(pathogen_information, calc_mean=False):
     :type pathogen_information: dict
     :parameter calc_mean: Boolean indicating if the mean should be calculated too (in addition to the other quantiles)
     :type calc_mean: bool
+    :parameter method: "sample" (default), quantiles of the sampled trajectories or "exact", exact weighted
+     quantiles calculated from the trajectory weights without resampling (`sample_df(k=None)` output), see
+     `exact_multipat_quantile()`
+    :type method: str
     :return: A dictionary with 2 objects: (1) "all":  median, 95%, 90%, 80%, and 50% quantiles for each "value" and
      "value_<pathogen>-<quantile>"columns and (2) "detail": median, 95%, 90%, 80%, and 50% quantiles for each
      "proportion_<pathogen>-<quantile>" columns.
     """
+    if method == "exact":
+        return exact_multipat_quantile(pathogen_information, calc_mean=calc_mean)
     all_sample = pd.DataFrame()
     f = {'value': [med, q1, q2, q3, q4, q5, q6, q7, q8]}
     f2 = {}
@@ -402,3 +985,1132 @@ def prep_multipat_plot_comb(pathogen_information, calc_mean=False):
     detail_quantile.columns = (detail_quantile.columns.get_level_values(0) + "-" +
                                detail_quantile.columns.get_level_values(1))
     return {"all": all_quantile, "detail": detail_quantile}
+
+
+def prep_heatmap_matrix(df, x_col="target_end_date", y_col="location_name", value_col="value", facet_col=None,
+                        max_x=None):
+    """Pivot long format data into dense heatmap matrices
+
+    From a long format DataFrame (one row per `x_col`, `y_col` and `facet_col` value), create in one pass a dense
+    float32 matrix of dimension (`y_col` x `x_col`) for each `facet_col` value, with missing cells set to NaN. All
+    the matrices share the same axis labels:
+
+    - `y_col` labels ordered by first appearance in the DataFrame
+    - `x_col` labels sorted
+
+    If `max_x` is not None and the number of `x_col` labels is superior to `max_x`, the `x_col` axis is downsampled by
+    grouping consecutive columns into `max_x` (or fewer) bins, keeping the maximum value of each bin and the first
+    label of each bin as label.
+
+    :parameter df: a DataFrame containing the `x_col`, `y_col`, `value_col` (and `facet_col`) columns
+    :type df: pd.DataFrame
+    :parameter x_col: Name of the column to use for x-axis, by default `target_end_date`
+    :type x_col: str
+    :parameter y_col: Name of the column to use for y-axis, by default `location_name`
+    :type y_col: str
+    :parameter value_col: Name of the column containing the value, by default `value`
+    :type value_col: str
+    :parameter facet_col: Name of the column used to create one matrix per value (for example for subplot), by
+        default `None` (one matrix)
+    :type facet_col: str | None
+    :parameter max_x: Maximum number of `x_col` labels, by default `None` (no downsampling)
+    :type max_x: int | None
+    :return: A dictionary with 4 objects: "z": array of dimension (facet x `y_col` x `x_col`), "x": array of the
+     `x_col` labels, "y": array of the `y_col` labels and "facet": list of the `facet_col` value (`[None]` if
+     `facet_col` is None)
+    """
+    y_label = pd.unique(df[y_col])
+    x_label = np.sort(pd.unique(df[x_col]))
+    y_code = pd.Categorical(df[y_col], categories=y_label).codes
+    x_code = pd.Categorical(df[x_col], categories=x_label).codes
+    if facet_col is not None:
+        facet_label = list(pd.unique(df[facet_col]))
+        facet_code = pd.Categorical(df[facet_col], categories=facet_label).codes
+    else:
+        facet_label = [None]
+        facet_code = np.zeros(len(df), dtype=int)
+    z = np.full((len(facet_label), len(y_label), len(x_label)), np.nan, dtype=np.float32)
+    z[facet_code, y_code, x_code] = df[value_col].to_numpy(dtype=np.float32)
+    # Downsampling
+    if max_x is not None and len(x_label) > max_x:
+        step = int(np.ceil(len(x_label) / max_x))
+        bin_start = np.arange(0, len(x_label), step)
+        z_bin = np.where(np.isnan(z), -np.inf, z)
+        z_bin = np.maximum.reduceat(z_bin, bin_start, axis=2)
+        z = np.where(np.isneginf(z_bin), np.nan, z_bin).astype(np.float32)
+        x_label = x_label[bin_start]
+    return {"z": z, "x": x_label, "y": y_label, "facet": facet_label}
+
+
+def lttb_index(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling
+
+    Select `n_out` points of a time series (x, y) with the Largest-Triangle-Three-Buckets (LTTB) algorithm: the first
+    and last points are kept, and the other points are split into `n_out - 2` buckets, in each bucket, the point
+    forming the largest triangle with the previous selected point and the average of the next bucket is kept.
+
+    The points with the minimum and maximum `y` value are always kept (the output can contain up to `n_out + 2`
+    points) and the `y` missing values (NaN) are kept to preserve the gaps.
+
+    :parameter x: Array of numeric x value, sorted
+    :type x: numpy.ndarray
+    :parameter y: Array of y value
+    :type y: numpy.ndarray
+    :parameter n_out: Number of points to keep
+    :type n_out: int
+    :return: a sorted array of the index of the selected points
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    value_index = np.flatnonzero(~np.isnan(y))
+    if len(value_index) <= n_out or n_out < 3:
+        return np.arange(len(y))
+    x_val = x[value_index]
+    y_val = y[value_index]
+    n = len(value_index)
+    every = (n - 2) / (n_out - 2)
+    selected = np.zeros(n_out, dtype=int)
+    a = 0
+    for i in range(n_out - 2):
+        # Average of the next bucket
+        avg_start = int(np.floor((i + 1) * every)) + 1
+        avg_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = x_val[avg_start:avg_end].mean()
+        avg_y = y_val[avg_start:avg_end].mean()
+        # Largest triangle in the current bucket
+        range_start = int(np.floor(i * every)) + 1
+        range_end = int(np.floor((i + 1) * every)) + 1
+        area = np.abs((x_val[a] - avg_x) * (y_val[range_start:range_end] - y_val[a]) -
+                      (x_val[a] - x_val[range_start:range_end]) * (avg_y - y_val[a]))
+        a = range_start + int(np.argmax(area))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    selected = np.union1d(selected, [np.argmin(y_val), np.argmax(y_val)])
+    return np.union1d(value_index[selected], np.flatnonzero(np.isnan(y)))
+
+
+def minmax_index(y, n_out):
+    """Min/Max downsampling
+
+    Select around `n_out` points of a time series by splitting the points in `n_out / 2` buckets and keeping the
+    points with the minimum and maximum `y` value in each bucket, the first and last points are always kept. The `y`
+    missing values (NaN) are kept to preserve the gaps.
+
+    :parameter y: Array of y value
+    :type y: numpy.ndarray
+    :parameter n_out: Number of points to keep
+    :type n_out: int
+    :return: a sorted array of the index of the selected points
+    """
+    y = np.asarray(y, dtype=float)
+    value_index = np.flatnonzero(~np.isnan(y))
+    if len(value_index) <= n_out or n_out < 3:
+        return np.arange(len(y))
+    y_val = y[value_index]
+    selected = [np.array([0, len(y_val) - 1])]
+    for bucket in np.array_split(np.arange(len(y_val)), max(n_out // 2, 1)):
+        selected.append(bucket[[np.argmin(y_val[bucket]), np.argmax(y_val[bucket])]])
+    selected = np.unique(np.concatenate(selected))
+    return np.union1d(value_index[selected], np.flatnonzero(np.isnan(y)))
+
+
+def decimate_df(df, x_col, y_col, max_point, method="lttb", group_col=None, report_ratio=False):
+    """Decimate a time series DataFrame
+
+    Reduce the number of rows of a time series DataFrame to around `max_point` rows (or `max_point` rows per
+    `group_col` value) for plotting, by using the Largest-Triangle-Three-Buckets (`"lttb"`, see `lttb_index()`) or
+    the Min/Max (`"minmax"`, see `minmax_index()`) method. The points with the minimum and maximum value are always
+    kept. The DataFrame is sorted by `x_col` (and `group_col`) if decimated.
+
+    :parameter df: a DataFrame containing the `x_col` and `y_col` columns
+    :type df: pd.DataFrame
+    :parameter x_col: Name of the column used as x-axis (numeric or date)
+    :type x_col: str
+    :parameter y_col: Name of the column used as y-axis
+    :type y_col: str
+    :parameter max_point: Maximum number of points to keep (per `group_col` value)
+    :type max_point: int
+    :parameter method: Decimation method: "lttb" (default) or "minmax"
+    :type method: str
+    :parameter group_col: Name of the column used to decimate each group (for example, each trajectory)
+        independently, by default `None`
+    :type group_col: str | None
+    :parameter report_ratio: Boolean to indicate if the ratio of retained points should be returned; by default
+        `False`
+    :type report_ratio: bool
+    :return: the decimated DataFrame. If `report_ratio` is `True`, a dictionary with 2 objects: "data": the
+        decimated DataFrame and "ratio": the ratio of retained points (number of output rows / number of input rows)
+    """
+    n_row = len(df)
+    if group_col is None:
+        group_size = n_row
+    else:
+        group_size = df.groupby(group_col, sort=False).size().max() if n_row > 0 else 0
+    if max_point is not None and group_size > max_point:
+        if group_col is None:
+            df = df.sort_values(x_col, kind="stable")
+            group_index = [np.arange(n_row)]
+        else:
+            df = df.sort_values([group_col, x_col], kind="stable")
+            group_index = df.groupby(group_col, sort=False).indices.values()
+        if pd.api.types.is_numeric_dtype(df[x_col]):
+            x_value = df[x_col].to_numpy(dtype=float)
+        else:
+            x_value = pd.to_datetime(df[x_col]).to_numpy().astype("int64")
+        y_value = df[y_col].to_numpy(dtype=float)
+        keep = list()
+        for index in group_index:
+            if method == "minmax":
+                keep.append(index[minmax_index(y_value[index], max_point)])
+            else:
+                keep.append(index[lttb_index(x_value[index], y_value[index], max_point)])
+        df = df.iloc[np.sort(np.concatenate(keep))]
+    if report_ratio is True:
+        df = {"data": df, "ratio": len(df) / n_row if n_row > 0 else 1}
+    return df
+
+
+def df_to_shared(df):
+    """Copy a DataFrame into a shared memory block
+
+    Copy all the columns (and the index) of a DataFrame into one `multiprocessing.shared_memory` block:
+
+    - numeric, boolean and datetime columns: raw values
+    - other columns (for example: string key columns like "model_name"): integer codes (`pandas.factorize()`), the
+      associated unique values are stored in the handle
+
+    The output handle is small and can be sent to worker processes to reconstruct the DataFrame with
+    `df_from_shared()`. The block should be released by the creator with `close()` and `unlink()`, see
+    `shared_df()`.
+
+    :parameter df: DataFrame to copy
+    :type df: pandas.DataFrame
+    :return: a list with 2 objects: a SharedFrame handle (name of the block, number of rows, for each column: name,
+        dtype, offset in the block and unique values (`None` for raw values), and name of the index) and the
+        SharedMemory block
+    """
+    from multiprocessing import shared_memory
+    column = list()
+    array_list = list()
+    offset = 0
+    for col_name, col_value in [("__index__", df.index)] + list(df.items()):
+        if (pd.api.types.is_numeric_dtype(col_value.dtype) or pd.api.types.is_bool_dtype(col_value.dtype) or
+                pd.api.types.is_datetime64_dtype(col_value.dtype)) and isinstance(col_value.dtype, np.dtype):
+            array = np.ascontiguousarray(col_value.to_numpy())
+            dtype = array.dtype
+            uniques = None
+        else:
+            codes, uniques = pd.factorize(col_value)
+            array = codes.astype(np.int32)
+            dtype = col_value.dtype
+        # Offsets aligned on 8 bytes
+        offset = -(-offset // 8) * 8
+        column.append([col_name, dtype, offset, uniques])
+        array_list.append([offset, array])
+        offset += array.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for array_offset, array in array_list:
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=array_offset)[:] = array
+    return [SharedFrame(shm.name, len(df), column, df.index.name), shm]
+
+
+def df_from_shared(handle, categorical=False):
+    """Reconstruct a DataFrame from a shared memory block
+
+    Attach the shared memory block created by `df_to_shared()` and reconstruct the DataFrame. The numeric, boolean
+    and datetime columns are views on the shared block (no copy). The coded columns are decoded to their original
+    values and type, or if `categorical` is `True`, returned as Categorical (without creating the original values).
+
+    The returned SharedMemory block should be closed (`close()`, not `unlink()`) after the last use of the
+    DataFrame, the DataFrame cannot be used after.
+
+    :parameter handle: Handle of the block, output of `df_to_shared()`
+    :type handle: SharedFrame
+    :parameter categorical: Boolean to return the coded columns as Categorical, by default `False`
+    :type categorical: bool
+    :return: a list with 2 objects: the DataFrame and the SharedMemory block
+    """
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=handle.name)
+    data = dict()
+    for col_name, dtype, offset, uniques in handle.column:
+        if uniques is None:
+            data[col_name] = np.ndarray((handle.n_row,), dtype=dtype, buffer=shm.buf, offset=offset)
+        else:
+            codes = np.ndarray((handle.n_row,), dtype=np.int32, buffer=shm.buf, offset=offset)
+            data[col_name] = pd.Categorical.from_codes(codes, categories=uniques)
+            if categorical is False:
+                data[col_name] = pd.Series(data[col_name]).astype(dtype).array
+    index = pd.Index(data.pop("__index__"), name=handle.index_name, copy=False)
+    df = pd.DataFrame(data, index=index, copy=False)
+    return [df, shm]
+
+
+@contextlib.contextmanager
+def shared_df(df_dict):
+    """Share DataFrames with worker processes
+
+    Context manager copying each DataFrame of `df_dict` in a shared memory block (see `df_to_shared()`) and returning
+    a dictionary of handles. The blocks are closed and removed when exiting the context, even in case of error:
+    the workers should have finished using the blocks.
+
+    ```
+        with shared_df({"proj": df}) as handle:
+            executor.map(function, [handle["proj"]] * 4)
+    ```
+
+    :parameter df_dict: Dictionary of DataFrames
+    :type df_dict: dict
+    :return: a dictionary of SharedFrame handles (same keys as `df_dict`)
+    """
+    shm_list = list()
+    try:
+        handle = dict()
+        for key in df_dict:
+            handle[key], shm = df_to_shared(df_dict[key])
+            shm_list.append(shm)
+        yield handle
+    finally:
+        for shm in shm_list:
+            shm.close()
+            shm.unlink()
+
+
+def truth_store(truth, x_col="time_idx", location_col="location", target_col="target", value_col="value",
+                w_delay=None):
+    """Create an indexed truth data store
+
+    Read the truth data (for example: "data/US_inc_case.csv", with the columns: "time_idx", "location", "value",
+    "target") once, with explicit types: dates for `x_col`, string for `location_col` (zero-padded FIPS codes kept)
+    and `target_col`, float for `value_col`. The data are sorted by target, location and date (rows without date are
+    removed), and the first and last row of each target and location are stored: each slice (see `truth_slice()`)
+    is then read without filtering the data.
+
+    For each `w_delay` value, the row splitting the last `w_delay` weeks of each target and location is also
+    calculated (other values are calculated and stored at the first call of `truth_slice()`).
+
+    :parameter truth: Path of a CSV file or DataFrame containing the truth data
+    :type truth: str | pandas.DataFrame
+    :parameter x_col: Name of the date column, by default "time_idx"
+    :type x_col: str
+    :parameter location_col: Name of the location column, by default "location"
+    :type location_col: str
+    :parameter target_col: Name of the target column, by default "target"
+    :type target_col: str
+    :parameter value_col: Name of the value column, by default "value"
+    :type value_col: str
+    :parameter w_delay: List of number of weeks to split at the end of each slice, by default `None`
+    :type w_delay: list | None
+    :return: a dictionary with the keys: "data" (sorted DataFrame), "index" (dictionary with (target, location) as
+        key and the first and last + 1 row number as value), "date" (array of dates) and "split" (dictionary with
+        (target, location, w_delay) as key and the split row number as value)
+    """
+    if isinstance(truth, pd.DataFrame):
+        df = truth.copy()
+        df[x_col] = pd.to_datetime(df[x_col])
+        df = df.astype({location_col: str, target_col: str, value_col: float})
+    else:
+        df = pd.read_csv(truth, dtype={location_col: str, target_col: str, value_col: float}, parse_dates=[x_col])
+    df = df[~df[x_col].isna()]
+    df = df.sort_values([target_col, location_col, x_col], kind="stable").reset_index(drop=True)
+    target = df[target_col].to_numpy()
+    location = df[location_col].to_numpy()
+    start = np.flatnonzero(np.r_[True, (target[1:] != target[:-1]) | (location[1:] != location[:-1])])
+    stop = np.r_[start[1:], len(df)]
+    store = {"data": df, "index": dict(zip(zip(target[start], location[start]), zip(start, stop))),
+             "date": df[x_col].to_numpy(), "split": dict()}
+    if w_delay is not None:
+        for key in store["index"]:
+            for week in w_delay:
+                truth_slice(store, key[0], key[1], w_delay=week)
+    return store
+
+
+def truth_slice(store, target, location, w_delay=None):
+    """Slice of the truth data store
+
+    Returns the truth data of one target and location (sorted by date) from a truth data store, see `truth_store()`.
+    If `w_delay` is not `None`, returns the data split before and in the last `w_delay` weeks (same split as the
+    `w_delay` parameter of `make_scatter_plot()`).
+
+    :parameter store: Truth data store, output of `truth_store()`
+    :type store: dict
+    :parameter target: Target value
+    :type target: str
+    :parameter location: Location value
+    :type location: str
+    :parameter w_delay: Number of weeks to split at the end of the data, by default `None`
+    :type w_delay: int | None
+    :return: a DataFrame (empty if no data), or if `w_delay` is not `None`, a list of 2 DataFrames: the data until
+        the last `w_delay` weeks and the data in the last `w_delay` weeks
+    """
+    start, stop = store["index"].get((target, location), (0, 0))
+    if w_delay is None:
+        return store["data"].iloc[start:stop]
+    split_key = (target, location, w_delay)
+    if split_key not in store["split"]:
+        if stop > start:
+            limit = store["date"][stop - 1] - np.timedelta64(7 * int(w_delay), "D")
+            store["split"][split_key] = start + int(np.searchsorted(store["date"][start:stop], limit, side="right"))
+        else:
+            store["split"][split_key] = start
+    split = store["split"][split_key]
+    return [store["data"].iloc[start:split], store["data"].iloc[split:stop]]
+
+
+def truth_epiweek(df, x_col="time_idx", location_col="location", target_col="target", value_col="value",
+                  rolling=None, x_output="time_value"):
+    """Aggregate truth data per epiweek
+
+    Aggregate daily (or weekly) truth data per epiweek (MMWR week, from Sunday to Saturday) for all the targets and
+    locations at once:
+
+    - "value": sum of the values of the week (NaN if no values)
+    - "min" and "max": minimum and maximum value of the week, for example for the `truth_data_type="bar"` option of
+      `make_scatter_plot()` (see `add_bar_trace()`)
+    - "n_day": number of values in the week
+    - "rolling": if `rolling` is not `None`, average of the "value" of the last `rolling` weeks (NaN if any of the
+      weeks is missing)
+
+    The output is sorted by target, location and date and can be used directly as `truth_data` in the plotting
+    functions (by default, `x_truth_col="time_value"` and `y_truth_col="value"`).
+
+    :parameter df: DataFrame containing the truth data
+    :type df: pandas.DataFrame
+    :parameter x_col: Name of the date column, by default "time_idx"
+    :type x_col: str
+    :parameter location_col: Name of the location column, by default "location"
+    :type location_col: str
+    :parameter target_col: Name of the target column, by default "target"
+    :type target_col: str
+    :parameter value_col: Name of the value column, by default "value"
+    :type value_col: str
+    :parameter rolling: Number of weeks of the rolling average, by default `None` (no rolling average)
+    :type rolling: int | None
+    :parameter x_output: Name of the output date column (end date of the epiweek, Saturday), by default "time_value"
+    :type x_output: str
+    :return: a DataFrame with the columns: `target_col`, `location_col`, `x_output`, "value", "min", "max", "n_day"
+        (and "rolling")
+    """
+    date = pd.to_datetime(df[x_col]).dt.normalize()
+    # Epiweek end date: next Saturday (weekday 5)
+    week_end = date + pd.to_timedelta((5 - date.dt.weekday) % 7, unit="D")
+    df_group = df.assign(**{x_output: week_end}).groupby([target_col, location_col, x_output], sort=True)[value_col]
+    df_week = pd.DataFrame({"value": df_group.sum(min_count=1), "min": df_group.min(), "max": df_group.max(),
+                            "n_day": df_group.count()}).reset_index()
+    if rolling is not None:
+        # Rolling average per target and location: window of `rolling` weeks from cumulative sums, on a sorted
+        # (target, location, day) key
+        group = df_week.groupby([target_col, location_col], sort=False).ngroup().to_numpy()
+        day = (df_week[x_output].to_numpy().astype("datetime64[D]") - np.datetime64("1970-01-01", "D")).astype(int)
+        key = group.astype(np.int64) * 10 ** 7 + day
+        start = np.searchsorted(key, key - 7 * rolling, side="right")
+        value = df_week["value"].to_numpy(dtype=float)
+        cum_value = np.r_[0, np.cumsum(np.nan_to_num(value))]
+        cum_count = np.r_[0, np.cumsum(~np.isnan(value))]
+        end = np.arange(1, len(value) + 1)
+        n_week = cum_count[end] - cum_count[start]
+        df_week["rolling"] = np.where(n_week == rolling, (cum_value[end] - cum_value[start]) / rolling, np.nan)
+    return df_week
+
+
+def state_deviation_data(df, population, reference=None, truth_data=None, ensemble_name=None, point_value="median",
+                         metric=None, location_exclusion=None, x_col="target_end_date", x_truth_col="time_value",
+                         per_capita=100000):
+    """Prepare the State Deviation data
+
+    Calculate for all the scenarios, targets, locations, models and dates at once, the rate of the projection:
+    `(Projection{x,t} * 100,000) / Population size{x}`, with "Projection" the "point" or 0.5 quantile value of the
+    projection at a time t for a state x (see "State Deviation" in `docs/plot_description.md`).
+
+    If `reference` is not `None`, the rate is compared with the rate of a reference, joined on each location and
+    date:
+
+    - "truth": the observed data (`truth_data`), same target
+    - "ensemble": the projection of the `ensemble_name` model, same scenario and target
+
+    with:
+
+    - "deviation": rate - reference rate
+    - "relative_deviation": (rate - reference rate) / reference rate (NaN if reference rate is 0 or missing)
+
+    The output is in the long format of `make_heatmap_plot()` (for example: for one scenario, target and model,
+    x: `x_col`, y: "location_name" or "location", z: "value") with the metric selected by `metric` as "value".
+
+    :parameter df: DataFrame containing the projections in the SMH standard format, with the columns:
+        "scenario_id", "target", "location", "model_name", `x_col`, "type_id", "value"
+    :type df: pandas.DataFrame
+    :parameter population: DataFrame containing the columns: "location", "population" (and optionally
+        "location_name")
+    :type population: pandas.DataFrame
+    :parameter reference: Reference of the deviation: "truth", "ensemble" or `None` (default, rate only)
+    :type reference: str | None
+    :parameter truth_data: For `reference="truth"`, DataFrame containing the columns: "target", "location",
+        `x_truth_col`, "value"
+    :type truth_data: pandas.DataFrame | None
+    :parameter ensemble_name: For `reference="ensemble"`, name of the ensemble model
+    :type ensemble_name: str | None
+    :parameter point_value: Projection value: "median" (type_id = 0.5, default) or "point" (type_id = NaN)
+    :type point_value: str
+    :parameter metric: Column used as "value" in the output: "rate", "deviation" or "relative_deviation". By default,
+        `None`: "rate" if `reference` is `None`, "deviation" if not
+    :type metric: str | None
+    :parameter location_exclusion: List of locations to exclude, by default `None`: US and territories ("US", "60",
+        "66", "69", "72", "74", "78")
+    :type location_exclusion: list | None
+    :parameter x_col: Name of the date column of `df`, by default "target_end_date"
+    :type x_col: str
+    :parameter x_truth_col: Name of the date column of `truth_data`, by default "time_value"
+    :type x_truth_col: str
+    :parameter per_capita: Population size of the rate, by default `100000`
+    :type per_capita: int
+    :return: a DataFrame with the columns: "scenario_id", "target", "location", ("location_name"), "model_name",
+        `x_col`, ("horizon"), "projection", "rate" (and "reference_rate", "deviation" and "relative_deviation" if
+        `reference` is not `None`) and "value"
+    """
+    if location_exclusion is None:
+        location_exclusion = ["US", "60", "66", "69", "72", "74", "78"]
+    if metric is None:
+        metric = "rate" if reference is None else "deviation"
+    # Projection value
+    if point_value == "point":
+        sel = df["type_id"].isna()
+    else:
+        sel = df["type_id"] == 0.5
+    sel = sel & ~df["location"].isin(location_exclusion)
+    key_col = [i for i in ["scenario_id", "target", "location", "model_name", x_col, "horizon"] if i in df.columns]
+    df_dev = df.loc[sel, key_col + ["value"]].rename(columns={"value": "projection"}).reset_index(drop=True)
+    df_dev[x_col] = pd.to_datetime(df_dev[x_col])
+    location_pop = population.drop_duplicates("location").set_index("location")
+    pop = df_dev["location"].map(location_pop["population"])
+    if "location_name" in location_pop.columns:
+        df_dev.insert(df_dev.columns.get_loc("location") + 1, "location_name",
+                      df_dev["location"].map(location_pop["location_name"]))
+    df_dev["rate"] = df_dev["projection"] * per_capita / pop
+    # Reference
+    if reference is not None:
+        if reference == "truth":
+            on_col = ["target", "location", x_col]
+            df_ref = truth_data[["target", "location", x_truth_col, "value"]].rename(columns={x_truth_col: x_col})
+            df_ref[x_col] = pd.to_datetime(df_ref[x_col])
+        elif reference == "ensemble":
+            on_col = ["scenario_id", "target", "location", x_col]
+            df_ref = df_dev.loc[df_dev["model_name"] == ensemble_name, on_col + ["projection"]]
+            df_ref = df_ref.rename(columns={"projection": "value"})
+        else:
+            raise ValueError("`reference` should be 'truth', 'ensemble' or None")
+        df_ref = df_ref.drop_duplicates(on_col).rename(columns={"value": "reference_value"})
+        df_dev = df_dev.merge(df_ref, on=on_col, how="left")
+        df_dev["reference_rate"] = df_dev.pop("reference_value") * per_capita / pop
+        df_dev["deviation"] = df_dev["rate"] - df_dev["reference_rate"]
+        df_dev["relative_deviation"] = (df_dev["deviation"] /
+                                        df_dev["reference_rate"].where(df_dev["reference_rate"] != 0))
+    df_dev["value"] = df_dev[metric]
+    return df_dev
+
+
+def quantile_exceedance(value, prob, threshold):
+    """Probability of exceeding thresholds from quantiles
+
+    For each row of a (group x quantile) matrix, calculate the probability of exceeding each threshold:
+    `P(X > threshold) = 1 - F(threshold)` with F the cumulative distribution function linearly interpolated between
+    the quantiles (as `numpy.interp()` for each row). Outside the quantiles range, F is the lowest or highest
+    quantile probability. All the rows are interpolated at once.
+
+    :parameter value: Matrix (group x quantile) of the quantile values, ordered by quantile probability
+    :type value: numpy.ndarray
+    :parameter prob: Array of the quantile probabilities (sorted), matrix columns
+    :type prob: numpy.ndarray | list
+    :parameter threshold: List of threshold(s)
+    :type threshold: numpy.ndarray | list
+    :return: a (group x threshold) matrix of probabilities (NaN if the row contains missing values)
+    """
+    value = np.maximum.accumulate(np.asarray(value, dtype=float), axis=1)
+    prob = np.asarray(prob, dtype=float)
+    row = np.arange(value.shape[0])
+    exceedance = np.empty((value.shape[0], len(threshold)))
+    for i, thres in enumerate(threshold):
+        n_below = (value <= thres).sum(axis=1)
+        low = np.clip(n_below - 1, 0, len(prob) - 1)
+        up = np.clip(n_below, 0, len(prob) - 1)
+        value_low = value[row, low]
+        value_up = value[row, up]
+        step = value_up - value_low
+        frac = np.divide(thres - value_low, step, out=np.zeros(len(row)), where=step > 0)
+        exceedance[:, i] = 1 - (prob[low] + frac * (prob[up] - prob[low]))
+    exceedance[np.isnan(value).any(axis=1)] = np.nan
+    return exceedance
+
+
+def trend_map_data(df, population, output_type="quantile", point_value="median", quantile=(0.025, 0.975),
+                   threshold=None, lag=1, cumulative=False, metric="rate", location_exclusion=None,
+                   x_col="target_end_date", per_capita=100000):
+    """Prepare the Trend Map data
+
+    Calculate for all the scenarios, targets, locations, models and dates at once, the rate of the projection:
+    `(Projection{q,x,t} * 100,000) / Population size{x}`, with "Projection" the "point" or 0.5 quantile value, or the
+    quantile q (`quantile`, by default: 0.025 and 0.975) of the projection at a time t for a state x (see "Trend Map"
+    in `docs/plot_description.md`), with:
+
+    - "percent_change": percent change of the rate compared to the rate `lag` week(s) before (same scenario,
+      target, location and model; NaN if missing or 0)
+    - "prob_<threshold>": for each `threshold` (rate), the probability of the rate exceeding the threshold
+
+    The projections can be:
+
+    - `output_type="quantile"`: quantiles ("type_id": quantile probability, NaN for "point"), the exceedance
+      probabilities are interpolated across all the quantiles of each projection (see `quantile_exceedance()`)
+    - `output_type="sample"`: samples ("type_id": sample identifier), the quantiles and exceedance probabilities are
+      calculated from the samples
+
+    If `cumulative` is `True`, the values are first cumulated over the dates for each scenario, target, location,
+    model and "type_id" (quantile or sample).
+
+    The output is in the long format of `make_heatmap_plot()` and `map_frame_matrix()` with the metric selected
+    by `metric` as "value".
+
+    :parameter df: DataFrame containing the projections in the SMH standard format, with the columns:
+        "scenario_id", "target", "location", "model_name", `x_col`, "type_id", "value"
+    :type df: pandas.DataFrame
+    :parameter population: DataFrame containing the columns: "location", "population" (and optionally
+        "location_name")
+    :type population: pandas.DataFrame
+    :parameter output_type: Type of projections: "quantile" (default) or "sample"
+    :type output_type: str
+    :parameter point_value: For `output_type="quantile"`, projection value: "median" (type_id = 0.5, default) or
+        "point" (type_id = NaN). The median of the samples for `output_type="sample"`
+    :type point_value: str
+    :parameter quantile: List of quantiles to output as "rate_<quantile>" column, by default `(0.025, 0.975)`
+    :type quantile: tuple | list
+    :parameter threshold: List of rates thresholds, by default `None` (no exceedance probabilities)
+    :type threshold: list | None
+    :parameter lag: Number of weeks of the percent change period, by default `1`
+    :type lag: int
+    :parameter cumulative: Boolean to cumulate the values over the dates, by default `False`
+    :type cumulative: bool
+    :parameter metric: Column used as "value" in the output, by default "rate"
+    :type metric: str
+    :parameter location_exclusion: List of locations to exclude, by default `None`: US and territories ("US", "60",
+        "66", "69", "72", "74", "78")
+    :type location_exclusion: list | None
+    :parameter x_col: Name of the date column of `df`, by default "target_end_date"
+    :type x_col: str
+    :parameter per_capita: Population size of the rate, by default `100000`
+    :type per_capita: int
+    :return: a DataFrame with the columns: "scenario_id", "target", "location", ("location_name"), "model_name",
+        `x_col`, ("horizon"), "rate", "rate_<quantile>", "percent_change", ("prob_<threshold>") and "value"
+    """
+    if location_exclusion is None:
+        location_exclusion = ["US", "60", "66", "69", "72", "74", "78"]
+    if threshold is None:
+        threshold = []
+    key_col = ["scenario_id", "target", "location", "model_name", x_col]
+    extra_col = [i for i in ["horizon"] if i in df.columns]
+    df_map = df.loc[~df["location"].isin(location_exclusion), key_col + extra_col + ["type_id", "value"]]
+    df_map = df_map.reset_index(drop=True)
+    df_map[x_col] = pd.to_datetime(df_map[x_col])
+    location_pop = population.drop_duplicates("location").set_index("location")
+    # Rate
+    if cumulative is True:
+        df_map = df_map.sort_values(x_col, kind="stable").reset_index(drop=True)
+        df_map["value"] = df_map.groupby(key_col[:-1] + ["type_id"], sort=False, dropna=False)["value"].cumsum()
+    df_map["value"] = df_map["value"] * per_capita / df_map["location"].map(location_pop["population"])
+    code = df_map.groupby(key_col, sort=False, dropna=False).ngroup().to_numpy()
+    first_row = np.unique(code, return_index=True)[1]
+    df_trend = df_map.loc[first_row, key_col + extra_col].reset_index(drop=True)
+    if "location_name" in location_pop.columns:
+        df_trend.insert(df_trend.columns.get_loc("location") + 1, "location_name",
+                        df_trend["location"].map(location_pop["location_name"]))
+    if output_type == "quantile":
+        quant_row = df_map["type_id"].notna().to_numpy()
+        prob = np.sort(df_map.loc[quant_row, "type_id"].unique())
+        value = np.full((len(first_row), len(prob)), np.nan)
+        value[code[quant_row], np.searchsorted(prob, df_map.loc[quant_row, "type_id"])] = \
+            df_map.loc[quant_row, "value"].to_numpy()
+        if point_value == "point":
+            df_trend["rate"] = np.nan
+            df_trend.loc[code[~quant_row], "rate"] = df_map.loc[~quant_row, "value"].to_numpy()
+        else:
+            df_trend["rate"] = value[:, prob == 0.5][:, 0] if 0.5 in prob else np.nan
+        for quant in quantile:
+            df_trend["rate_" + str(quant)] = value[:, prob == quant][:, 0] if quant in prob else np.nan
+        exceedance = quantile_exceedance(value, prob, threshold)
+    elif output_type == "sample":
+        df_group = df_map["value"].groupby(code)
+        df_trend["rate"] = df_group.median().to_numpy()
+        for quant in quantile:
+            df_trend["rate_" + str(quant)] = df_group.quantile(quant).to_numpy()
+        exceedance = np.empty((len(first_row), len(threshold)))
+        for i, thres in enumerate(threshold):
+            exceedance[:, i] = (df_map["value"] > thres).groupby(code).mean().to_numpy()
+    else:
+        raise ValueError("`output_type` should be 'quantile' or 'sample'")
+    # Percent change
+    df_prev = df_trend[key_col + ["rate"]].rename(columns={"rate": "previous_rate"})
+    df_prev[x_col] = df_prev[x_col] + pd.Timedelta(weeks=lag)
+    previous_rate = df_trend[key_col].merge(df_prev, on=key_col, how="left")["previous_rate"].to_numpy()
+    previous_rate = np.where(previous_rate != 0, previous_rate, np.nan)
+    df_trend["percent_change"] = (df_trend["rate"].to_numpy() / previous_rate - 1) * 100
+    # Exceedance
+    for i, thres in enumerate(threshold):
+        df_trend["prob_" + str(thres)] = exceedance[:, i]
+    df_trend["value"] = df_trend[metric]
+    return df_trend
+
+
+def risk_map_data(df, population, ensemble_name=None, cumulative=True, threshold=None, output_type="quantile",
+                  point_value="median", metric="rate", location_exclusion=None, x_col="target_end_date",
+                  per_capita=100000):
+    """Prepare the Risk Map data
+
+    Calculate for all the scenarios, targets, locations and dates at once, the rate of the projection of the
+    `ensemble_name` model: `(Projection{x,t} * 100,000) / Population size{x}`, with "Projection" the "point" or 0.5
+    quantile value of the projection at a time t for a state x (see "Risk Map" in `docs/plot_description.md`).
+    By default, the rates are cumulated over the dates (for rounds using incident targets as input), and
+    optionally the probability of exceeding each rate `threshold` is calculated ("prob_<threshold>" columns).
+
+    See `trend_map_data()` for more information on the parameters and output.
+
+    :parameter df: DataFrame containing the projections in the SMH standard format, with the columns:
+        "scenario_id", "target", "location", "model_name", `x_col`, "type_id", "value"
+    :type df: pandas.DataFrame
+    :parameter population: DataFrame containing the columns: "location", "population" (and optionally
+        "location_name")
+    :type population: pandas.DataFrame
+    :parameter ensemble_name: Name of the ensemble model, by default `None` (all models)
+    :type ensemble_name: str | None
+    :parameter cumulative: Boolean to cumulate the values over the dates, by default `True`
+    :type cumulative: bool
+    :parameter threshold: List of rates thresholds, by default `None` (no exceedance probabilities)
+    :type threshold: list | None
+    :parameter output_type: Type of projections: "quantile" (default) or "sample"
+    :type output_type: str
+    :parameter point_value: Projection value: "median" (default) or "point"
+    :type point_value: str
+    :parameter metric: Column used as "value" in the output, by default "rate"
+    :type metric: str
+    :parameter location_exclusion: List of locations to exclude, by default `None`: US and territories
+    :type location_exclusion: list | None
+    :parameter x_col: Name of the date column of `df`, by default "target_end_date"
+    :type x_col: str
+    :parameter per_capita: Population size of the rate, by default `100000`
+    :type per_capita: int
+    :return: a DataFrame, see `trend_map_data()`
+    """
+    if ensemble_name is not None:
+        df = df[df["model_name"] == ensemble_name]
+    return trend_map_data(df, population, output_type=output_type, point_value=point_value, quantile=[],
+                          threshold=threshold, cumulative=cumulative, metric=metric,
+                          location_exclusion=location_exclusion, x_col=x_col, per_capita=per_capita)
+
+
+def map_frame_matrix(df, value_col="value", location_col="location", x_col="target_end_date", facet_col=None):
+    """Create the animation matrices of a map
+
+    From a long format DataFrame (for example the output of `trend_map_data()` or `risk_map_data()` filtered for one
+    model), create dense (location x date) matrices with the locations sorted, one for each `facet_col` value (for
+    example: "scenario_id"). Each column of a matrix is the `z` array of one frame of the map animation (see
+    `matrix_frame_generator()` and `add_animation_frames()`), and the locations array is the `locations` property
+    of the base trace.
+
+    :parameter df: a DataFrame containing the `location_col`, `x_col`, `value_col` (and `facet_col`) columns
+    :type df: pandas.DataFrame
+    :parameter value_col: Name of the column containing the value, by default "value"
+    :type value_col: str
+    :parameter location_col: Name of the column containing the location, by default "location"
+    :type location_col: str
+    :parameter x_col: Name of the column containing the date (one frame per date), by default "target_end_date"
+    :type x_col: str
+    :parameter facet_col: Name of the column used to create one matrix per value, by default `None` (one matrix)
+    :type facet_col: str | None
+    :return: A dictionary with 4 objects: "z": array of dimension (facet x location x date), "x": array of the
+     dates, "y": array of the locations and "facet": list of the `facet_col` value (`[None]` if `facet_col` is None)
+    """
+    df = df.sort_values(location_col, kind="stable")
+    return prep_heatmap_matrix(df, x_col=x_col, y_col=location_col, value_col=value_col, facet_col=facet_col)
+
+
+def weighted_group_quantile(value, weight, group, prob, n_group=None):
+    """Calculate exact weighted quantiles of multiple groups at once
+
+    Vectorized version of `weighted_quantile()`: calculate the quantiles of each group, from one sort of all the
+    values by group and value and the cumulative weights (normalized to sum to 1 in each group). The quantile `p`
+    of a group is the smallest value with a cumulative weight greater or equal to `p` (mean of the two values if the
+    cumulative weight is equal to `p`). NaN values are ignored.
+
+    :parameter value: Array of values
+    :type value: numpy.ndarray
+    :parameter weight: Array of weights, same length as `value`
+    :type weight: numpy.ndarray
+    :parameter group: Array of the group codes (integers from 0 to number of groups - 1), same length as `value`
+    :type group: numpy.ndarray
+    :parameter prob: List of probabilities
+    :type prob: list | numpy.ndarray
+    :parameter n_group: Number of groups, by default `None` (maximum group code + 1)
+    :type n_group: int | None
+    :return: a (group x probability) matrix of quantiles (NaN if no value in the group)
+    """
+    value = np.asarray(value, dtype=float)
+    weight = np.asarray(weight, dtype=float)
+    group = np.asarray(group)
+    if n_group is None:
+        n_group = int(group.max()) + 1 if len(group) > 0 else 0
+    prob = np.asarray(prob, dtype=float)
+    keep = ~np.isnan(value) & (weight > 0)
+    value, weight, group = value[keep], weight[keep], group[keep]
+    order = np.lexsort((value, group))
+    value, weight, group = value[order], weight[order], group[order]
+    group_start = np.searchsorted(group, np.arange(n_group), side="left")
+    group_end = np.searchsorted(group, np.arange(n_group), side="right")
+    cum_weight = np.cumsum(weight)
+    before = np.concatenate([[0], cum_weight])[group_start]
+    total = cum_weight[np.maximum(group_end - 1, 0)] - before if len(value) > 0 else np.zeros(n_group)
+    # Cumulative weight (0, 1] in each group, shifted by the group code: one search for all the groups
+    cum_prob = group + (cum_weight - before[group]) / total[group]
+    target = np.arange(n_group)[:, None] + prob[None, :]
+    last = np.maximum(group_end - 1, 0)[:, None]
+    # Search limited to the group: the last cumulative weight of the previous group is equal to the group code
+    idx = np.clip(np.searchsorted(cum_prob, target - 1e-9, side="left"), group_start[:, None], last)
+    next_idx = np.minimum(idx + 1, last)
+    quant = np.full((n_group, len(prob)), np.nan)
+    valid = group_end > group_start
+    if valid.any():
+        on_step = np.abs(cum_prob[idx[valid]] - target[valid]) <= 1e-9
+        quant[valid] = np.where(on_step, (value[idx[valid]] + value[next_idx[valid]]) / 2, value[idx[valid]])
+    return quant
+
+
+def projection_peak_data(df, key_col=None, traj_col="type_id", weight_col=None, x_col="target_end_date",
+                         prob=(0.01, 0.25, 0.5, 0.75, 0.99), size_bins=None, max_cell=5 * 10 ** 7):
+    """Prepare the Projection Peaks data
+
+    From sample trajectories, calculate for all the groups (by default: scenario, target, location and model) at once
+    the distribution of the peak week and peak size of the trajectories:
+
+    - the values are stored in a dense (trajectory x date) array (built by blocks of `max_cell` cells), the peak of
+      each trajectory is the maximum along the date axis (first date in case of ties, trajectories without value are
+      ignored)
+    - "peak_week": weighted histogram of the peak dates of each group, the value is the probability of peaking on
+      each date (NaN for dates without projection)
+    - "peak_size": weighted quantiles (`prob`) of the peak size of each group (see `weighted_group_quantile()`)
+    - "peak_size_hist": if `size_bins` is not `None`, weighted histogram of the peak size of each group in the bins
+      `[size_bins[i], size_bins[i + 1])`
+
+    Each trajectory has the weight `weight_col` (normalized in each group) or, by default, the same weight.
+
+    The "peak_week" output is in the long format of `make_heatmap_plot()` (for example: for one scenario, target and
+    location: x: `x_col`, y: "model_name", z: "value") and the "peak_size" output in the format of
+    `make_boxplot_plot()` (for example: for one scenario, target and location: x: "model_name", y: "type_id" (default
+    `prob` are the default boxplot values)).
+
+    :parameter df: DataFrame containing the trajectories in the SMH standard format, with the columns: `key_col`,
+        `traj_col`, `x_col` and "value" (and `weight_col`)
+    :type df: pandas.DataFrame
+    :parameter key_col: List of the columns identifying a group, by default
+        `["scenario_id", "target", "location", "model_name"]`
+    :type key_col: list | None
+    :parameter traj_col: Name of the column containing the trajectory identifier (in each group), by default
+        "type_id"
+    :type traj_col: str
+    :parameter weight_col: Name of the column containing the trajectory weight, by default `None` (same weight)
+    :type weight_col: str | None
+    :parameter x_col: Name of the date column, by default "target_end_date"
+    :type x_col: str
+    :parameter prob: List of probabilities of the peak size quantiles, by default `(0.01, 0.25, 0.5, 0.75, 0.99)`
+    :type prob: tuple | list
+    :parameter size_bins: List of the peak size histogram bins edges, by default `None` (no histogram)
+    :type size_bins: list | None
+    :parameter max_cell: Maximum number of cells of the dense array blocks, by default `5 * 10 ** 7`
+    :type max_cell: int
+    :return: a dictionary with the objects: "peak_week" (DataFrame: `key_col`, `x_col`, "value"), "peak_size"
+        (DataFrame: `key_col`, "type_id", "value"), "trajectory" (DataFrame: `key_col`, `traj_col`, `x_col` (peak
+        date), "peak_size", "weight") and "peak_size_hist" (DataFrame: `key_col`, "bin_start", "bin_end", "value"; or
+        `None`)
+    """
+    if key_col is None:
+        key_col = ["scenario_id", "target", "location", "model_name"]
+    df = df.reset_index(drop=True)
+    x_value = pd.to_datetime(df[x_col])
+    x_label = np.sort(x_value.unique())
+    x_code = np.searchsorted(x_label, x_value)
+    group_code = df.groupby(key_col, sort=False, dropna=False).ngroup().to_numpy()
+    traj_id, traj_label = pd.factorize(df[traj_col])
+    traj_code = pd.factorize(group_code.astype(np.int64) * len(traj_label) + traj_id)[0]
+    group_first = np.unique(group_code, return_index=True)[1]
+    traj_first = np.unique(traj_code, return_index=True)[1]
+    n_group, n_traj, n_x = len(group_first), len(traj_first), len(x_label)
+    traj_group = group_code[traj_first]
+    # Dense (trajectory x date) array, by blocks
+    value = df["value"].to_numpy(dtype=float)
+    order = np.argsort(traj_code, kind="stable")
+    sorted_traj = traj_code[order]
+    peak_index = np.zeros(n_traj, dtype=int)
+    peak_size = np.full(n_traj, np.nan)
+    block_size = max(max_cell // n_x, 1)
+    for start in range(0, n_traj, block_size):
+        stop = min(start + block_size, n_traj)
+        row = order[np.searchsorted(sorted_traj, start):np.searchsorted(sorted_traj, stop)]
+        dense = np.full((stop - start, n_x), -np.inf)
+        dense[traj_code[row] - start, x_code[row]] = np.where(np.isnan(value[row]), -np.inf, value[row])
+        peak_index[start:stop] = dense.argmax(axis=1)
+        peak_size[start:stop] = dense[np.arange(stop - start), peak_index[start:stop]]
+    valid = np.isfinite(peak_size)
+    peak_size[~valid] = np.nan
+    # Trajectories weights
+    if weight_col is not None:
+        weight = df[weight_col].to_numpy(dtype=float)[traj_first]
+    else:
+        weight = np.ones(n_traj)
+    weight = np.where(valid, weight, 0)
+    group_weight = np.bincount(traj_group, weights=weight, minlength=n_group)
+    weight = np.divide(weight, group_weight[traj_group], out=np.zeros(n_traj), where=group_weight[traj_group] > 0)
+    df_key = df.loc[group_first, key_col].reset_index(drop=True)
+    # Peak week
+    peak_week = np.zeros((n_group, n_x))
+    np.add.at(peak_week, (traj_group, peak_index), weight)
+    projected = np.zeros((n_group, n_x), dtype=bool)
+    projected[group_code, x_code] = True
+    row_group, row_x = np.nonzero(projected)
+    df_week = df_key.loc[row_group].reset_index(drop=True)
+    df_week[x_col] = x_label[row_x]
+    df_week["value"] = peak_week[row_group, row_x]
+    # Peak size
+    size_quant = weighted_group_quantile(peak_size, weight, traj_group, prob, n_group=n_group)
+    df_size = df_key.loc[np.repeat(np.arange(n_group), len(prob))].reset_index(drop=True)
+    df_size["type_id"] = np.tile(np.asarray(prob, dtype=float), n_group)
+    df_size["value"] = size_quant.ravel()
+    if size_bins is not None:
+        size_bins = np.asarray(size_bins, dtype=float)
+        bin_code = np.searchsorted(size_bins, peak_size, side="right") - 1
+        in_bin = valid & (bin_code >= 0) & (bin_code < len(size_bins) - 1)
+        size_hist = np.zeros((n_group, len(size_bins) - 1))
+        np.add.at(size_hist, (traj_group[in_bin], bin_code[in_bin]), weight[in_bin])
+        df_hist = df_key.loc[np.repeat(np.arange(n_group), len(size_bins) - 1)].reset_index(drop=True)
+        df_hist["bin_start"] = np.tile(size_bins[:-1], n_group)
+        df_hist["bin_end"] = np.tile(size_bins[1:], n_group)
+        df_hist["value"] = size_hist.ravel()
+    else:
+        df_hist = None
+    df_traj = df.loc[traj_first, key_col + [traj_col]].reset_index(drop=True)
+    df_traj[x_col] = x_label[peak_index]
+    df_traj.loc[~valid, x_col] = pd.NaT
+    df_traj["peak_size"] = peak_size
+    df_traj["weight"] = weight
+    return {"peak_week": df_week, "peak_size": df_size, "trajectory": df_traj, "peak_size_hist": df_hist}
+
+
+def spatiotemporal_wave_data(df, population=None, threshold=None, relative_threshold=0.5, point_value="median",
+                             normalize=False, sort_scenario=None, location_exclusion=None, x_col="target_end_date",
+                             per_capita=100000):
+    """Prepare the Spatiotemporal Waves data
+
+    For all the scenarios, targets, locations and models at once, store the projection ("point" or 0.5 quantile
+    value, or the rate `(Projection{x,t} * 100,000) / Population size{x}` if `population` is not `None`) in a dense
+    (location x date) array and calculate for each location the wave dates:
+
+    - "onset": first date with a value greater or equal to the threshold
+    - "peak": date of the maximum value (first date in case of ties)
+    - "decline": first date after the peak with a value lower than the threshold
+
+    with the threshold: `threshold` (same unit as the value) or, if `threshold` is `None`, `relative_threshold` times
+    the peak value of each location. Locations never reaching the threshold have no onset and decline (NaT).
+
+    The locations are ordered for each scenario, target and model by onset, peak date and location (the locations
+    without onset last). If `sort_scenario` is not `None`, the order of this scenario is used for all the scenarios.
+    The orders are calculated once and returned in the output ("order") to be reused for each scenario.
+
+    The "data" output is in the long format of `make_heatmap_plot()`, sorted by location order and date (for example:
+    for one scenario, target and model: x: `x_col`, y: "location_name" or "location", z: "value").
+
+    :parameter df: DataFrame containing the projections in the SMH standard format, with the columns:
+        "scenario_id", "target", "location", "model_name", `x_col`, "type_id", "value"
+    :type df: pandas.DataFrame
+    :parameter population: DataFrame containing the columns: "location", "population" (and optionally
+        "location_name"), by default `None` (projection value, no rate)
+    :type population: pandas.DataFrame | None
+    :parameter threshold: Onset and decline threshold, by default `None` (relative threshold)
+    :type threshold: float | None
+    :parameter relative_threshold: If `threshold` is `None`, onset and decline threshold as a fraction of the peak
+        value of each location, by default `0.5`
+    :type relative_threshold: float
+    :parameter point_value: Projection value: "median" (type_id = 0.5, default) or "point" (type_id = NaN)
+    :type point_value: str
+    :parameter normalize: Boolean to divide the "value" of each location by its peak value, by default `False`
+    :type normalize: bool
+    :parameter sort_scenario: Scenario used to order the locations of all the scenarios, by default `None` (each
+        scenario ordered by its own waves)
+    :type sort_scenario: str | None
+    :parameter location_exclusion: List of locations to exclude, by default `None`: US and territories ("US", "60",
+        "66", "69", "72", "74", "78")
+    :type location_exclusion: list | None
+    :parameter x_col: Name of the date column of `df`, by default "target_end_date"
+    :type x_col: str
+    :parameter per_capita: Population size of the rate, by default `100000`
+    :type per_capita: int
+    :return: a dictionary with 3 objects: "data" (DataFrame: "scenario_id", "target", "location",
+        ("location_name"), "model_name", `x_col`, "value"), "wave" (DataFrame: "scenario_id", "target", "location",
+        ("location_name"), "model_name", "onset", "peak", "decline", "peak_value", "order") and "order" (dictionary
+        with the tuple (scenario_id, target, model_name) as key and the list of ordered locations as value)
+    """
+    if location_exclusion is None:
+        location_exclusion = ["US", "60", "66", "69", "72", "74", "78"]
+    key_col = ["scenario_id", "target", "location", "model_name"]
+    # Projection value
+    if point_value == "point":
+        sel = df["type_id"].isna()
+    else:
+        sel = df["type_id"] == 0.5
+    sel = sel & ~df["location"].isin(location_exclusion)
+    df_wave = df.loc[sel, key_col + [x_col, "value"]].reset_index(drop=True)
+    x_value = pd.to_datetime(df_wave[x_col])
+    x_label = np.sort(x_value.unique())
+    x_code = np.searchsorted(x_label, x_value)
+    code = df_wave.groupby(key_col, sort=False, dropna=False).ngroup().to_numpy()
+    first_row = np.unique(code, return_index=True)[1]
+    df_loc = df_wave.loc[first_row, key_col].reset_index(drop=True)
+    value = np.full((len(first_row), len(x_label)), np.nan)
+    value[code, x_code] = df_wave["value"].to_numpy(dtype=float)
+    if population is not None:
+        location_pop = population.drop_duplicates("location").set_index("location")
+        value = value * per_capita / df_loc["location"].map(location_pop["population"]).to_numpy()[:, None]
+        if "location_name" in location_pop.columns:
+            df_loc.insert(3, "location_name", df_loc["location"].map(location_pop["location_name"]))
+    # Wave dates: threshold crossing
+    column = np.arange(len(x_label))[None, :]
+    peak = np.where(np.isnan(value), -np.inf, value).argmax(axis=1)
+    peak_value = value[np.arange(len(first_row)), peak]
+    if threshold is None:
+        location_threshold = relative_threshold * peak_value
+    else:
+        location_threshold = np.full(len(first_row), float(threshold))
+    above = value >= location_threshold[:, None]
+    has_onset = above.any(axis=1)
+    after_peak = ~above & ~np.isnan(value) & (column > peak[:, None])
+    has_decline = has_onset & after_peak.any(axis=1)
+    df_loc["onset"] = np.where(has_onset, x_label[above.argmax(axis=1)], np.datetime64("NaT"))
+    df_loc["peak"] = np.where(np.isnan(peak_value), np.datetime64("NaT"), x_label[peak])
+    df_loc["decline"] = np.where(has_decline, x_label[after_peak.argmax(axis=1)], np.datetime64("NaT"))
+    df_loc["peak_value"] = peak_value
+    # Location order
+    df_sort = df_loc[key_col + ["onset", "peak"]]
+    if sort_scenario is not None:
+        df_sort = df_sort[key_col].merge(
+            df_sort.loc[df_sort["scenario_id"] == sort_scenario, key_col[1:] + ["onset", "peak"]],
+            on=key_col[1:], how="left")
+    panel_code = df_loc.groupby(["scenario_id", "target", "model_name"], sort=False,
+                                dropna=False).ngroup().to_numpy()
+    order = np.lexsort((df_loc["location"].to_numpy(), df_sort["peak"].to_numpy(), df_sort["onset"].to_numpy(),
+                        panel_code))
+    rank = np.empty(len(order), dtype=int)
+    rank[order] = np.arange(len(order)) - np.searchsorted(panel_code[order], panel_code[order])
+    df_loc["order"] = rank
+    location_order = dict()
+    for panel, df_panel in df_loc.iloc[order].groupby(["scenario_id", "target", "model_name"], sort=False,
+                                                      dropna=False):
+        location_order[panel] = list(df_panel["location"])
+    # Sorted (location x date) long format
+    if normalize is True:
+        value = value / np.where(peak_value > 0, peak_value, np.nan)[:, None]
+    row_loc, row_x = np.nonzero(~np.isnan(value[order]))
+    row_loc = order[row_loc]
+    df_data = df_loc.loc[row_loc, [i for i in df_loc.columns if i in key_col + ["location_name"]]]
+    df_data = df_data.reset_index(drop=True)
+    df_data[x_col] = x_label[row_x]
+    df_data["value"] = value[row_loc, row_x]
+    return {"data": df_data, "wave": df_loc, "order": location_order}
+
+
+def ensemble_data(df, method="median", ensemble_name="Ensemble", key_col=None, model_col="model_name",
+                  model_exclusion=None, trim=0.1, quantile=None, x_col="target_end_date", append=True):
+    """Calculate an ensemble of the projections
+
+    Calculate the ensemble of all the models, for all the scenarios, targets, locations and dates at once, with the
+    method:
+
+    - "median": median of the models values of each quantile (and "point") of the quantile projections
+    - "trimmed_mean": mean of the models values of each quantile (and "point") of the quantile projections,
+      excluding the `trim` proportion of lowest and highest values (as `scipy.stats.trim_mean()`)
+    - "lop": Linear Opinion Pool of the sample projections, quantiles `quantile` of all the trajectories, with the
+      same total weight for each model (each trajectory weight: 1 / (number of models x number of trajectories of
+      the model)), see `weighted_group_quantile()`
+
+    The values are stored in one dense (group x model) array ("median", "trimmed_mean") or sorted once
+    ("lop"). The ensemble is returned as the model `ensemble_name` in the input format with "type_id": quantile
+    probability (NaN for "point") and, if present, "type": "quantile" for "lop".
+
+    :parameter df: DataFrame containing the projections in the SMH standard format, with the columns `key_col`,
+        `model_col`, "type_id" (quantile probability or sample identifier) and "value"
+    :type df: pandas.DataFrame
+    :parameter method: Ensemble method: "median" (default), "trimmed_mean" or "lop"
+    :type method: str
+    :parameter ensemble_name: Model name of the ensemble, by default "Ensemble"
+    :type ensemble_name: str
+    :parameter key_col: List of the columns identifying a projection, by default `None`: "scenario_id", "target",
+        "location", "origin_date", "horizon", `x_col` and "type" (if present)
+    :type key_col: list | None
+    :parameter model_col: Name of the column containing the model name, by default "model_name"
+    :type model_col: str
+    :parameter model_exclusion: List of models to exclude from the ensemble, by default `None`: `[ensemble_name]`
+    :type model_exclusion: list | None
+    :parameter trim: For "trimmed_mean", proportion of the models values cut off at each end, by default `0.1`
+    :type trim: float
+    :parameter quantile: For "lop", list of the quantiles to calculate, by default `None`: 0.01, 0.025, 0.05,
+        0.1 to 0.9 (by 0.05), 0.95, 0.975, 0.99
+    :type quantile: list | None
+    :parameter x_col: Name of the date column, by default "target_end_date"
+    :type x_col: str
+    :parameter append: Boolean to return the input DataFrame with the ensemble rows appended (`True`, default) or
+        only the ensemble rows (`False`)
+    :type append: bool
+    :return: a DataFrame
+    """
+    if key_col is None:
+        key_col = [i for i in ["scenario_id", "target", "location", "origin_date", "horizon", x_col, "type"]
+                   if i in df.columns]
+    if model_exclusion is None:
+        model_exclusion = [ensemble_name]
+    df_model = df.loc[~df[model_col].isin(model_exclusion), key_col + [model_col, "type_id", "value"]]
+    df_model = df_model.reset_index(drop=True)
+    if method == "lop":
+        if quantile is None:
+            quantile = [0.01, 0.025, 0.05] + [round(i * 0.05, 2) for i in range(2, 19)] + [0.95, 0.975, 0.99]
+        group_code = df_model.groupby(key_col, sort=False, dropna=False).ngroup().to_numpy()
+        model_code, model_label = pd.factorize(df_model[model_col])
+        model_group = pd.factorize(group_code.astype(np.int64) * len(model_label) + model_code)[0]
+        n_traj = np.bincount(model_group)
+        model_first = np.unique(model_group, return_index=True)[1]
+        n_model = np.bincount(group_code[model_first])
+        weight = 1 / (n_model[group_code] * n_traj[model_group])
+        value = weighted_group_quantile(df_model["value"].to_numpy(dtype=float), weight, group_code, quantile)
+        group_first = np.unique(group_code, return_index=True)[1]
+        df_ens = df_model.loc[np.repeat(group_first, len(quantile)), key_col].reset_index(drop=True)
+        df_ens["type_id"] = np.tile(np.asarray(quantile, dtype=float), len(group_first))
+        if "type" in df_ens.columns:
+            df_ens["type"] = "quantile"
+    elif method in ["median", "trimmed_mean"]:
+        cell_code = df_model.groupby(key_col + ["type_id"], sort=False, dropna=False).ngroup().to_numpy()
+        model_code, model_label = pd.factorize(df_model[model_col])
+        cell_first = np.unique(cell_code, return_index=True)[1]
+        value = np.full((len(cell_first), len(model_label)), np.nan)
+        value[cell_code, model_code] = df_model["value"].to_numpy(dtype=float)
+        if method == "median":
+            value = np.nanmedian(value, axis=1)
+        else:
+            # Sorted (NaN last) values, sum of the values between the trimmed ends
+            value = np.sort(value, axis=1)
+            n_value = (~np.isnan(value)).sum(axis=1)
+            n_cut = np.floor(trim * n_value).astype(int)
+            cum_value = np.concatenate([np.zeros((len(value), 1)), np.nancumsum(value, axis=1)], axis=1)
+            row = np.arange(len(value))
+            n_kept = n_value - 2 * n_cut
+            value = np.divide(cum_value[row, n_value - n_cut] - cum_value[row, n_cut], n_kept,
+                              out=np.full(len(value), np.nan), where=n_kept > 0)
+        df_ens = df_model.loc[cell_first, key_col + ["type_id"]].reset_index(drop=True)
+    else:
+        raise ValueError("`method` should be 'median', 'trimmed_mean' or 'lop'")
+    df_ens.insert(len(key_col), model_col, ensemble_name)
+    df_ens["value"] = value.ravel()
+    df_ens = df_ens[[i for i in df.columns if i in df_ens.columns]]
+    if append is True:
+        df_ens = pd.concat([df, df_ens], ignore_index=True)
+    return df_ens
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+QUANTILES = [0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.975]
+
+
+@pytest.fixture
+def proj_data():
+    rng = np.random.default_rng(0)
+    df = pd.MultiIndex.from_product([["A", "B"], ["US", "01"], ["team1-model", "team2-model", "Ensemble"],
+                                     range(1, 9), QUANTILES],
+                                    names=["scenario_id", "location", "model_name", "horizon",
+                                           "type_id"]).to_frame(index=False)
+    df["type"] = "quantile"
+    df["target"] = "inc hosp"
+    df["target_end_date"] = pd.Timestamp("2023-09-09") + pd.to_timedelta(7 * (df["horizon"] - 1), unit="D")
+    df["value"] = np.sort(rng.gamma(3, 100, (len(df) // len(QUANTILES), len(QUANTILES))), axis=1).ravel()
+    return df
+
+
+@pytest.fixture
+def truth_data():
+    df = pd.MultiIndex.from_product([["US", "01"], pd.date_range("2023-06-03", periods=20, freq="W-SAT")],
+                                    names=["location", "time_value"]).to_frame(index=False)
+    df["target"] = "inc hosp"
+    df["value"] = np.arange(len(df)) * 10.0
+    return df
@@ -0,0 +1,46 @@
+import copy
+
+from SMHviz_plot.service import build_figure, build_figure_batch
+
+
+def make_requests(proj_data, truth_data):
+    # Parameters shared by all the requests
+    intervals = [0.5, 0.95]
+    intervals_dict = {0.95: [0.025, 0.975], 0.5: [0.25, 0.75]}
+    subplot_title = ["Scenario A", "Scenario B"]
+    color_dict = {"team1-model": "rgb(31, 119, 180)", "team2-model": "rgb(255, 127, 14)",
+                  "Ensemble": "rgb(0, 0, 0)"}
+    request = list()
+    for location in ["US", "01"]:
+        proj_loc = proj_data[proj_data["location"] == location]
+        truth_loc = truth_data[truth_data["location"] == location]
+        request.append(("make_scatter_plot", (proj_loc, truth_loc),
+                        dict(intervals=intervals, intervals_dict=intervals_dict, subplot_var="scenario_id",
+                             subplot_title=subplot_title, ensemble_name="Ensemble", color_dict=color_dict)))
+        request.append(("make_scatter_plot", (proj_data, truth_data),
+                        dict(intervals=intervals, intervals_dict=intervals_dict, color_dict=color_dict)))
+        request.append(("make_spaghetti_plot", (proj_loc,),
+                        dict(subplot=True, subplot_col="scenario_id", subplot_titles=subplot_title,
+                             color_dict=color_dict)))
+    return request * 2
+
+
+def test_batch_same_as_serial(proj_data, truth_data):
+    request = make_requests(proj_data, truth_data)
+    request_copy = copy.deepcopy(request)
+    serial = [build_figure(*i).to_json() for i in request]
+    batch = dict(build_figure_batch(request, max_workers=4, serialize=True, ordered=False))
+    assert [batch[i] for i in range(len(request))] == serial
+    # The shared inputs are not modified
+    for (function, args, kwargs), (_, args_copy, kwargs_copy) in zip(request, request_copy):
+        for value, value_copy in zip(args, args_copy):
+            assert value.equals(value_copy)
+        assert kwargs == kwargs_copy
+
+
+def test_batch_order_and_close(proj_data, truth_data):
+    request = make_requests(proj_data, truth_data)
+    assert [i for i, _ in build_figure_batch(request[:4], max_workers=2)] == [0, 1, 2, 3]
+    batch = build_figure_batch(request, max_workers=2)
+    next(batch)
+    batch.close()
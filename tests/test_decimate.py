@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from SMHviz_plot.figures import make_bar_plot, make_scatter_plot, make_spaghetti_plot
+from SMHviz_plot.utils_data import decimate_df, lttb_index, minmax_index
+
+
+def noisy_series(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    y = np.cumsum(rng.normal(0, 1, n))
+    y[[n // 10, n // 10 + 1, n // 10 + 2, n // 2, n - n // 4]] = np.nan
+    return np.arange(n, dtype=float), y
+
+
+@pytest.mark.parametrize("n_out", [3, 10, 100])
+def test_decimate_index(n_out):
+    x, y = noisy_series()
+    for index in [lttb_index(x, y, n_out), minmax_index(y, n_out)]:
+        assert np.all(np.diff(index) > 0)
+        # Global minimum and maximum, first and last points and the gaps are kept
+        assert np.nanargmin(y) in index and np.nanargmax(y) in index
+        assert 0 in index and len(y) - 1 in index
+        assert set(np.flatnonzero(np.isnan(y))) <= set(index)
+        # Point budget: `n_out` points, plus the minimum and maximum and the gaps
+        assert len(index) - np.isnan(y).sum() <= n_out + 2
+
+
+def test_decimate_df_group():
+    x, y = noisy_series()
+    df = pd.concat([pd.DataFrame({"type_id": i, "time_value": pd.Timestamp("2020-01-04") +
+                                  pd.to_timedelta(7 * x, unit="D"), "value": y * (i + 1)}) for i in range(3)])
+    for method in ["lttb", "minmax"]:
+        out = decimate_df(df.sample(frac=1, random_state=0), "time_value", "value", 50, method=method,
+                          group_col="type_id", report_ratio=True)
+        assert out["ratio"] == len(out["data"]) / len(df)
+        for i, df_traj in out["data"].groupby("type_id"):
+            assert df_traj["time_value"].is_monotonic_increasing
+            assert df_traj["value"].max() == np.nanmax(y * (i + 1))
+            assert df_traj["value"].min() == np.nanmin(y * (i + 1))
+            assert df_traj["value"].isna().sum() == np.isnan(y).sum()
+            assert len(df_traj) <= 50 + 2 + np.isnan(y).sum()
+
+
+def test_decimate_ratio_meta(proj_data):
+    x, y = noisy_series(500)
+    truth = pd.DataFrame({"time_value": pd.Timestamp("2014-01-04") + pd.to_timedelta(7 * x, unit="D"),
+                          "value": y + 100, "location": "US"})
+    fig = make_scatter_plot(proj_data[proj_data["location"] == "US"], truth, subplot_var="scenario_id",
+                            max_point=50)
+    point = [len(trace.x) for trace in fig.data if trace.name == "Truth Data"]
+    assert np.isclose(fig.layout.meta["decimate_ratio"], sum(point) / (2 * len(truth)))
+    assert make_scatter_plot(proj_data, truth, max_point=None).layout.meta is None
+    # Trajectories grouped by `spag_col`, with `x_col` as x-axis
+    df_traj = pd.concat([pd.DataFrame({"sample": i, "date": truth["time_value"], "value": y * (i + 1),
+                                       "model_name": "team1-model", "scenario_id": "A"}) for i in range(4)])
+    for subplot in [False, True]:
+        fig = make_spaghetti_plot(df_traj, spag_col="sample", x_col="date", max_point=100, subplot=subplot,
+                                  subplot_col="scenario_id")
+        n_point = len(fig.data[0].x) - 4
+        assert n_point < len(df_traj)
+        assert np.isclose(fig.layout.meta["decimate_ratio"], n_point / len(df_traj))
+        assert np.nanmax(fig.data[0].y) == np.nanmax(y * 4)
+    df_bar = pd.DataFrame({"target_end_date": truth["time_value"], "value": 1, "pathogen": "COVID"})
+    fig = make_bar_plot(df_bar, df_other=df_bar.assign(pathogen="Flu"), subplot=True, subplot_col="pathogen",
+                        truth_data=truth.assign(total_value=truth["value"] * 2), max_point=40)
+    assert np.isclose(fig.layout.meta["decimate_ratio"],
+                      (len(fig.data[0].x) + len(fig.data[1].x)) / (2 * len(truth)))
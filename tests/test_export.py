@@ -0,0 +1,48 @@
+import concurrent.futures
+import os
+
+import pytest
+
+from SMHviz_plot.export import ImageExporter
+
+
+def write_render(fig_json, file, format=None, width=None, height=None, scale=None):
+    with open(file, "w") as output:
+        output.write(fig_json)
+
+
+def test_export_broken_pool(tmp_path):
+    file = [str(tmp_path / f"fig_{i}.json") for i in range(6)]
+    with ImageExporter(n_worker=2, retry=1, render_function=write_render) as exporter:
+        # Crashed worker: the pool is restarted at the first submission
+        with pytest.raises(concurrent.futures.process.BrokenProcessPool):
+            exporter.executor.submit(os._exit, 1).result()
+        report = exporter.export(["{}"] * 6, file)
+    assert [r["index"] for r in report] == list(range(6))
+    assert all(r["error"] is None and r["attempt"] == 1 for r in report)
+    assert all(os.path.exists(i) for i in file)
+
+
+def test_export_length(tmp_path):
+    file = [str(tmp_path / f"fig_{i}.json") for i in range(3)]
+    with ImageExporter(n_worker=1, render_function=write_render) as exporter:
+        with pytest.raises(ValueError):
+            exporter.export(["{}"] * 2, file)
+        with pytest.raises(ValueError):
+            exporter.export(iter(["{}"] * 4), iter(file))
+
+
+def fail_start():
+    raise RuntimeError("renderer start failure")
+
+
+def test_export_failed_start(tmp_path):
+    file = [str(tmp_path / f"fig_{i}.json") for i in range(4)]
+    with ImageExporter(n_worker=2, retry=1, render_function=write_render) as exporter:
+        # Each new pool is broken at start: all the attempts fail
+        exporter.initializer = fail_start
+        exporter.executor.shutdown()
+        exporter.executor = exporter.start_pool()
+        report = exporter.export(["{}"] * 4, file)
+    assert all(r["error"] is not None and r["attempt"] == 2 for r in report)
+    assert not any(os.path.exists(i) for i in file)
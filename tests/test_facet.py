@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+import plotly.graph_objects as go
+import pytest
+
+from SMHviz_plot.figures import make_scatter_plot, make_spaghetti_plot
+from SMHviz_plot.utils import prep_subplot, subplot_row_col
+
+
+def test_facet_worker_same_json(proj_data, truth_data):
+    df_traj = proj_data[proj_data["location"] == "US"]
+    for max_point in [None, 4]:
+        fig = {n_worker: make_scatter_plot(proj_data, truth_data, subplot_var="location", ensemble_name="Ensemble",
+                                           max_point=max_point, n_worker=n_worker)
+               for n_worker in [None, 2]}
+        assert json.loads(fig[2].to_json()) == json.loads(fig[None].to_json())
+        fig = {n_worker: make_spaghetti_plot(df_traj, subplot=True, subplot_col="scenario_id", max_point=max_point,
+                                             n_worker=n_worker)
+               for n_worker in [None, 2]}
+        assert json.loads(fig[2].to_json()) == json.loads(fig[None].to_json())
+    # The next updates are validated
+    with pytest.raises(ValueError):
+        fig[2].data[0].update(mode="not a mode")
+    with pytest.raises(ValueError):
+        fig[2].update_layout(height="not a height")
+
+
+def test_subplot_layout_axes():
+    # Same subplot axes with `make_subplot_layout()` as with `plotly.subplots.make_subplots()`
+    sub_var = ["A", "B", "C", "D", "E"]
+    for row_num in [None, 3]:
+        fig = {lazy: prep_subplot(sub_var, sub_var, "Horizon", "N", row_num=row_num, lazy=lazy)
+               for lazy in [False, True]}
+        for var in sub_var:
+            row, col = subplot_row_col(sub_var, var, row_num=row_num)
+            for lazy in fig:
+                fig[lazy].add_trace(go.Scatter(x=[0], y=[0], name=var), row=row, col=col)
+        for trace, trace_lazy in zip(fig[False].data, fig[True].data):
+            assert (trace.xaxis, trace.yaxis) == (trace_lazy.xaxis, trace_lazy.yaxis)
+            axis = trace.xaxis.replace("x", "xaxis")
+            assert np.allclose(fig[False].layout[axis].domain, fig[True].layout[axis].domain, atol=0.05)
@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+
+from SMHviz_plot.figures import make_boxplot_plot, make_scatter_plot, make_scatter_plot_batch
+from SMHviz_plot.utils import make_palette_sequential
+
+BOX_VALUE = [0.025, 0.25, 0.5, 0.75, 0.975]
+
+
+def test_box_plot_one_label_per_box(proj_data):
+    df = proj_data[(proj_data["scenario_id"] == "A") & (proj_data["location"] == "US") &
+                   (proj_data["horizon"] == 1)]
+    color_dict = {"team1-model": "red", "team2-model": "red", "Ensemble": "black"}
+    for group_color in [False, True]:
+        fig = make_boxplot_plot(df, box_value=BOX_VALUE, color_dict=color_dict, group_color=group_color)
+        assert len(fig.data) == (2 if group_color else 3)
+        for trace in fig.data:
+            assert len(trace.y) == len(trace.q1) == len(trace.median) == len(trace.upperfence)
+            # Each box at its model label, with the model quantiles
+            for model, q1, median in zip(trace.y, trace.q1, trace.median):
+                df_model = df[df["model_name"] == model].set_index("type_id")["value"]
+                assert np.isclose(q1, df_model[0.25]) and np.isclose(median, df_model[0.5])
+    fig = make_boxplot_plot(df, box_value=BOX_VALUE, color_dict=color_dict, group_color=True)
+    assert list(fig.data[0].y) == ["team1-model", "team2-model"]
+
+
+def test_scatter_plot_connect_gaps(proj_data, truth_data):
+    # Same value for the truth data, the median lines and the ribbons of all the models
+    for connect_gaps in [True, False]:
+        fig = make_scatter_plot(proj_data, truth_data, subplot_var="scenario_id", connect_gaps=connect_gaps)
+        assert len(fig.data) == 2 * (1 + 3 * (1 + 2 * 4))
+        assert all(trace.connectgaps is connect_gaps for trace in fig.data)
+
+
+def test_scatter_plot_batch(proj_data, truth_data):
+    keys = [("US", "inc hosp"), ("02", "inc hosp"), ("01", "inc hosp")]
+    param = dict(subplot_var="scenario_id", ensemble_name="Ensemble", title="Projection")
+    color_dict = make_palette_sequential(proj_data, "model_name")
+    batch = make_scatter_plot_batch(proj_data.sample(frac=1, random_state=0), truth_data, keys,
+                                    plot_param={("01", "inc hosp"): {"title": "Alabama"}}, **param)
+    output = list(batch)
+    assert [key for key, fig in output] == keys
+    # Missing key: error message
+    assert len(output[1][1].data) == 0 and len(output[1][1].layout.annotations) == 1
+    for key, fig in [output[0], output[2]]:
+        df_key = proj_data[(proj_data["location"] == key[0]) & (proj_data["target"] == key[1])]
+        truth_key = truth_data[(truth_data["location"] == key[0]) & (truth_data["target"] == key[1])]
+        fig_key = make_scatter_plot(df_key, truth_key, color_dict=color_dict,
+                                    **dict(param, title="Alabama" if key[0] == "01" else "Projection"))
+        assert json.loads(fig.to_json()) == json.loads(fig_key.to_json())
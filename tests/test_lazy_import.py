@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+
+# Modules imported only when needed, not at the import of SMHviz_plot.figures (and SMHviz_plot.utils,
+# SMHviz_plot.utils_data)
+LAZY_MODULES = ["plotly.express", "plotly.subplots", "concurrent.futures.process", "multiprocessing.shared_memory"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_import(code):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]))
+    return subprocess.run([sys.executable, "-W", "ignore", "-c", code], capture_output=True, text=True, env=env,
+                          check=True)
+
+
+def test_lazy_import():
+    code = f"import sys, SMHviz_plot.figures; print([m for m in {LAZY_MODULES!r} if m in sys.modules])"
+    assert run_import(code).stdout.strip() == "[]"
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from SMHviz_plot.utils_data import quantile_exceedance, risk_map_data, state_deviation_data, trend_map_data
+
+LOCATION = ["01", "02", "06", "72", "US"]
+POPULATION = pd.DataFrame({"location": LOCATION, "location_name": ["Alabama", "Alaska", "California",
+                                                                   "Puerto Rico", "US"],
+                           "population": [5e6, 7e5, 4e7, 3e6, 3.3e8]})
+
+
+def location_proj(seed=0, quantile=(0.025, 0.25, 0.5, 0.75, 0.975)):
+    rng = np.random.default_rng(seed)
+    df = pd.MultiIndex.from_product([["A", "B"], ["inc hosp"], LOCATION, ["team1-model", "Ensemble"], range(1, 7),
+                                     quantile],
+                                    names=["scenario_id", "target", "location", "model_name", "horizon",
+                                           "type_id"]).to_frame(index=False)
+    df["target_end_date"] = pd.Timestamp("2023-09-09") + pd.to_timedelta(7 * (df["horizon"] - 1), unit="D")
+    df["value"] = np.sort(rng.gamma(2, 100, (len(df) // len(quantile), len(quantile))), axis=1).ravel()
+    return df
+
+
+def location_truth(seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.MultiIndex.from_product([["inc hosp"], LOCATION, pd.date_range("2023-09-09", periods=4, freq="7D")],
+                                    names=["target", "location", "time_value"]).to_frame(index=False)
+    df["value"] = rng.poisson(100, len(df)).astype(float)
+    df.loc[0, "value"] = 0
+    return df
+
+
+@pytest.mark.parametrize("reference", [None, "truth", "ensemble"])
+def test_state_deviation_same_as_loop(reference):
+    df = location_proj()
+    truth = location_truth()
+    df_dev = state_deviation_data(df, POPULATION, reference=reference, truth_data=truth, ensemble_name="Ensemble")
+    # Reference: one location at a time
+    output = list()
+    for location in LOCATION:
+        if location in ["US", "72"]:
+            continue
+        pop = POPULATION[POPULATION["location"] == location]["population"].iloc[0]
+        df_loc = df[(df["location"] == location) & (df["type_id"] == 0.5)]
+        for row in df_loc.itertuples():
+            rate = row.value * 100000 / pop
+            if reference == "truth":
+                ref = truth[(truth["location"] == location) & (truth["time_value"] == row.target_end_date)]
+            elif reference == "ensemble":
+                ref = df_loc[(df_loc["model_name"] == "Ensemble") & (df_loc["scenario_id"] == row.scenario_id) &
+                             (df_loc["target_end_date"] == row.target_end_date)]
+            else:
+                ref = None
+            if ref is None:
+                output.append([row.scenario_id, location, row.model_name, row.target_end_date, rate])
+            else:
+                ref_rate = ref["value"].iloc[0] * 100000 / pop if len(ref) > 0 else np.nan
+                relative = (rate - ref_rate) / ref_rate if ref_rate != 0 else np.nan
+                output.append([row.scenario_id, location, row.model_name, row.target_end_date, rate, ref_rate,
+                               rate - ref_rate, relative])
+    col = ["scenario_id", "location", "model_name", "target_end_date", "rate"]
+    if reference is not None:
+        col = col + ["reference_rate", "deviation", "relative_deviation"]
+    df_ref = pd.DataFrame(output, columns=col)
+    df_dev = df_dev.sort_values(col[:4]).reset_index(drop=True)
+    df_ref = df_ref.sort_values(col[:4]).reset_index(drop=True)
+    assert df_dev[col[:4]].values.tolist() == df_ref[col[:4]].values.tolist()
+    for i in col[4:]:
+        np.testing.assert_allclose(df_dev[i].to_numpy(float), df_ref[i].to_numpy(float))
+    np.testing.assert_allclose(df_dev["value"].to_numpy(float),
+                               df_ref["rate" if reference is None else "deviation"].to_numpy(float))
+    assert (df_dev["location_name"] == df_dev["location"].map(POPULATION.set_index("location")["location_name"])).all()
+
+
+def test_quantile_exceedance_same_as_interp():
+    rng = np.random.default_rng(1)
+    prob = np.array([0.025, 0.1, 0.25, 0.5, 0.75, 0.9, 0.975])
+    value = np.sort(rng.gamma(2, 50, (200, len(prob))), axis=1)
+    value[3, 2] = np.nan
+    threshold = [0, 25.5, 100, value[0, 3], 1e6]
+    exceedance = quantile_exceedance(value, prob, threshold)
+    for i in range(len(value)):
+        if np.isnan(value[i]).any():
+            assert np.isnan(exceedance[i]).all()
+        else:
+            # Reference: `numpy.interp()` on each row
+            np.testing.assert_allclose(exceedance[i], 1 - np.interp(threshold, value[i], prob))
+
+
+def trend_loop(df, lag, cumulative, threshold, output_type):
+    # Reference: one location, scenario and model at a time
+    output = list()
+    for location in ["01", "02", "06"]:
+        pop = POPULATION[POPULATION["location"] == location]["population"].iloc[0]
+        for (scenario, model), df_loc in df[df["location"] == location].groupby(["scenario_id", "model_name"]):
+            df_loc = df_loc.sort_values("target_end_date")
+            if cumulative:
+                df_loc = df_loc.assign(value=df_loc.groupby("type_id")["value"].cumsum())
+            rate = dict()
+            for date, df_date in df_loc.groupby("target_end_date"):
+                value = df_date.sort_values("type_id")["value"].to_numpy() * 100000 / pop
+                row = {"scenario_id": scenario, "location": location, "model_name": model,
+                       "target_end_date": date}
+                if output_type == "quantile":
+                    prob = df_date.sort_values("type_id")["type_id"].to_numpy()
+                    row["rate"] = value[prob == 0.5][0]
+                    row["rate_0.025"] = value[prob == 0.025][0]
+                    for thres in threshold:
+                        row["prob_" + str(thres)] = 1 - np.interp(thres, value, prob)
+                else:
+                    row["rate"] = np.median(value)
+                    row["rate_0.025"] = np.quantile(value, 0.025)
+                    for thres in threshold:
+                        row["prob_" + str(thres)] = np.mean(value > thres)
+                previous = rate.get(date - pd.Timedelta(weeks=lag), np.nan)
+                row["percent_change"] = (row["rate"] / previous - 1) * 100 if previous != 0 else np.nan
+                rate[date] = row["rate"]
+                output.append(row)
+    return pd.DataFrame(output)
+
+
+@pytest.mark.parametrize("output_type", ["quantile", "sample"])
+@pytest.mark.parametrize("cumulative", [False, True])
+def test_trend_map_same_as_loop(output_type, cumulative):
+    threshold = [1, 5]
+    if output_type == "quantile":
+        df = location_proj()
+    else:
+        df = location_proj(quantile=range(1, 31))
+    df = df.sample(frac=1, random_state=0)
+    df_trend = trend_map_data(df, POPULATION, output_type=output_type, quantile=[0.025], threshold=threshold,
+                              lag=2, cumulative=cumulative)
+    df_ref = trend_loop(df, 2, cumulative, threshold, output_type)
+    key_col = ["scenario_id", "location", "model_name", "target_end_date"]
+    df_trend = df_trend.sort_values(key_col).reset_index(drop=True)
+    df_ref = df_ref.sort_values(key_col).reset_index(drop=True)
+    assert df_trend[key_col].values.tolist() == df_ref[key_col].values.tolist()
+    for col in df_ref.columns[4:]:
+        np.testing.assert_allclose(df_trend[col].to_numpy(float), df_ref[col].to_numpy(float), err_msg=col)
+    # Risk map: same as the trend map of the ensemble
+    df_risk = risk_map_data(df, POPULATION, ensemble_name="Ensemble", threshold=threshold, output_type=output_type,
+                            cumulative=cumulative).sort_values(key_col).reset_index(drop=True)
+    df_ens = df_ref[df_ref["model_name"] == "Ensemble"].reset_index(drop=True)
+    assert df_risk[key_col].values.tolist() == df_ens[key_col].values.tolist()
+    for col in ["rate", "prob_1", "prob_5"]:
+        np.testing.assert_allclose(df_risk[col].to_numpy(float), df_ens[col].to_numpy(float))
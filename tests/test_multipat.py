@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from SMHviz_plot.utils_data import (combination_mean_proportion, combination_quantile, prep_multipat_plot_comb,
+                                    sample_df, weighted_mean, weighted_quantile)
+
+PROB = [0, 0.025, 0.1, 1 / 3, 0.5, 0.75, 0.975, 1]
+
+
+def pair_distribution(value, weight, other_value, other_weight):
+    total = np.add.outer(value, other_value).ravel()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        proportion = (value[:, None] / np.add.outer(value, other_value)).ravel()
+    proportion[np.isinf(proportion)] = np.nan
+    return total, proportion, np.multiply.outer(weight, other_weight).ravel()
+
+
+@pytest.mark.parametrize("max_candidate", [3, 2 ** 16])
+def test_combination_quantile(max_candidate):
+    rng = np.random.default_rng(0)
+    for trial in range(100):
+        n_value, n_other = rng.integers(1, 30, 2)
+        if trial % 2 == 0:
+            # Ties and zeros
+            value = rng.integers(0, 5, n_value).astype(float)
+            other_value = rng.integers(0, 5, n_other).astype(float)
+        else:
+            value = rng.gamma(2, 10, n_value)
+            other_value = rng.gamma(2, 10, n_other)
+        value[rng.random(n_value) < 0.1] = np.nan
+        weight = rng.choice([0.5, 1, 2], n_value)
+        other_weight = rng.choice([1, 3], n_other)
+        total, proportion, pair_weight = pair_distribution(value, weight, other_value, other_weight)
+        assert np.allclose(combination_quantile(value, weight, other_value, other_weight, PROB,
+                                                max_candidate=max_candidate),
+                           weighted_quantile(total, pair_weight, PROB), equal_nan=True)
+        assert np.allclose(combination_quantile(value, weight, other_value, other_weight, PROB,
+                                                operation="proportion", max_candidate=max_candidate),
+                           weighted_quantile(proportion, pair_weight, PROB), equal_nan=True)
+        assert np.isclose(combination_mean_proportion(value, weight, other_value, other_weight,
+                                                      max_candidate=max_candidate),
+                          weighted_mean(proportion, pair_weight), equal_nan=True)
+
+
+def test_exact_hand_built():
+    date = pd.Timestamp("2023-10-07")
+    covid = pd.DataFrame({"value_covid": [0.0, 10.0, 30.0], "target_end_date": date, "sample_id_n": [0, 1, 2],
+                          "weight": [0.5, 0.25, 0.25]})
+    flu = pd.DataFrame({"value_flu": [0.0, 20.0], "target_end_date": date, "sample_id_n": [0, 1],
+                        "weight": [0.5, 0.5]})
+    pathogen_information = {"COVID": {"dataframe": covid}, "Flu": {"dataframe": flu}}
+    out = prep_multipat_plot_comb(pathogen_information, calc_mean=True, method="exact")
+    # Pairs (sum, COVID proportion, weight): (0, NaN, .25), (20, 0, .25), (10, 1, .125), (30, 1/3, .125),
+    # (30, 1, .125), (50, .6, .125); on a step of the cumulative weight, mean of the two values
+    assert out["all"].loc[date, "value-med"] == 20
+    assert out["all"].loc[date, "value-q4"] == 5
+    assert out["all"].loc[date, "value-q8"] == 50
+    assert out["all"].loc[date, "value_covid-med"] == 5
+    assert out["detail"].loc[date, "proportion_covid-med"] == pytest.approx((1 / 3 + 0.6) / 2)
+    assert out["detail"].loc[date, "proportion_covid-q1"] == 0
+    assert out["detail"].loc[date, "proportion_covid-mean"] == pytest.approx((1 + 1 / 3 + 1 + 0.6) * 0.125 / 0.75)
+    assert out["detail"].loc[date, "proportion_flu-q8"] == 1
+
+
+def smh_trajectory(n_model, n_traj, scale, seed):
+    rng = np.random.default_rng(seed)
+    date = pd.date_range("2023-10-07", periods=3, freq="W-SAT")
+    df = pd.MultiIndex.from_product([["A"], [f"team{i}-model" for i in range(n_model)], range(1, n_traj + 1),
+                                     range(1, 4)],
+                                    names=["scenario_id", "model_name", "type_id", "horizon"]).to_frame(index=False)
+    df["target_end_date"] = date[df["horizon"] - 1]
+    df["value"] = np.repeat(rng.gamma(2, scale, len(df) // 3), 3) * df["horizon"]
+    return df
+
+
+def test_exact_same_as_large_sample():
+    df = {"COVID": smh_trajectory(3, 300, 100, 1), "Flu": smh_trajectory(2, 400, 50, 2)}
+    exact = prep_multipat_plot_comb({i: {"dataframe": sample_df(df[i], ["A"], i, k=None)} for i in df},
+                                    method="exact")
+    np.random.seed(0)
+    sample = prep_multipat_plot_comb({i: {"dataframe": sample_df(df[i], ["A"], i, k=50000)} for i in df})
+    assert list(exact["all"].columns) == list(sample["all"].columns)
+    assert list(exact["detail"].columns) == list(sample["detail"].columns)
+    assert np.allclose(exact["all"].to_numpy(dtype=float), sample["all"].to_numpy(dtype=float), rtol=0.05)
+    assert np.allclose(exact["detail"].to_numpy(dtype=float), sample["detail"].to_numpy(dtype=float), atol=0.02)
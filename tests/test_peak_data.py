@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from SMHviz_plot.utils_data import projection_peak_data, weighted_group_quantile, weighted_quantile
+
+PROB = [0, 0.01, 0.25, 0.5, 0.75, 0.99, 1]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_weighted_group_quantile_same_as_weighted_quantile(seed):
+    rng = np.random.default_rng(seed)
+    n_group = 30
+    group = rng.integers(0, n_group, 2000)
+    group[group == 7] = 8
+    # Ties, missing values and integer weights (cumulative weight on the probabilities)
+    value = rng.integers(0, 20, len(group)).astype(float)
+    value[rng.choice(len(value), 50, replace=False)] = np.nan
+    value[group == 11] = np.nan
+    weight = rng.integers(1, 4, len(group)).astype(float)
+    quant = weighted_group_quantile(value, weight, group, PROB, n_group=n_group)
+    for i in range(n_group):
+        # Reference: one group at a time
+        np.testing.assert_array_equal(quant[i], weighted_quantile(value[group == i], weight[group == i], PROB))
+    assert np.isnan(quant[[7, 11]]).all()
+
+
+def trajectory(seed=0, n_traj=40):
+    rng = np.random.default_rng(seed)
+    df = pd.MultiIndex.from_product([["A", "B"], ["inc hosp"], ["01", "US"], ["team1-model", "team2-model"],
+                                     range(1, n_traj + 1), range(1, 11)],
+                                    names=["scenario_id", "target", "location", "model_name", "type_id",
+                                           "horizon"]).to_frame(index=False)
+    df["target_end_date"] = pd.Timestamp("2023-09-09") + pd.to_timedelta(7 * (df["horizon"] - 1), unit="D")
+    # Integer values: ties on the peak size and date
+    df["value"] = rng.integers(0, 30, len(df)).astype(float)
+    df.loc[rng.choice(len(df), 100, replace=False), "value"] = np.nan
+    df.loc[(df["type_id"] == 3) & (df["location"] == "01"), "value"] = np.nan
+    weight = pd.Series(rng.integers(1, 4, n_traj + 1).astype(float))
+    df["weight"] = df["type_id"].map(weight)
+    # Missing dates for one model
+    df = df[~((df["model_name"] == "team2-model") & (df["horizon"] > 8))]
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("weight_col", [None, "weight"])
+def test_projection_peak_same_as_idxmax(weight_col):
+    df = trajectory()
+    key_col = ["scenario_id", "target", "location", "model_name"]
+    size_bins = [0, 10, 20, 25, 30]
+    peak = projection_peak_data(df, weight_col=weight_col, prob=PROB, size_bins=size_bins, max_cell=100)
+    # Reference: pandas idxmax on each trajectory (first date in case of ties)
+    df_sort = df.sort_values("target_end_date", kind="stable").dropna(subset=["value"])
+    df_ref = df_sort.loc[df_sort.groupby(key_col + ["type_id"])["value"].idxmax()]
+    df_ref = df_ref.rename(columns={"value": "peak_size"}).reset_index(drop=True)
+    df_ref["weight"] = df_ref["weight"] if weight_col is not None else 1.0
+    df_ref["weight"] = df_ref["weight"] / df_ref.groupby(key_col)["weight"].transform("sum")
+    df_traj = peak["trajectory"].dropna(subset=["peak_size"]).sort_values(key_col + ["type_id"])
+    assert df_traj[key_col + ["type_id", "target_end_date"]].values.tolist() == \
+        df_ref[key_col + ["type_id", "target_end_date"]].values.tolist()
+    np.testing.assert_allclose(df_traj["peak_size"], df_ref["peak_size"])
+    np.testing.assert_allclose(df_traj["weight"], df_ref["weight"])
+    # Peak week probability
+    week_ref = df_ref.groupby(key_col + ["target_end_date"])["weight"].sum()
+    df_week = peak["peak_week"].set_index(key_col + ["target_end_date"])["value"]
+    np.testing.assert_allclose(df_week.reindex(week_ref.index), week_ref)
+    assert df_week.drop(week_ref.index).eq(0).all()
+    assert len(df_week) == len(df.groupby(key_col + ["target_end_date"]))
+    # Peak size quantiles and histogram
+    for key, df_key in df_ref.groupby(key_col):
+        size = peak["peak_size"].set_index(key_col).loc[key]
+        np.testing.assert_array_equal(size["value"], weighted_quantile(df_key["peak_size"].to_numpy(),
+                                                                       df_key["weight"].to_numpy(), PROB))
+        hist = peak["peak_size_hist"].set_index(key_col).loc[key]
+        hist_ref = np.histogram(df_key["peak_size"], bins=size_bins, weights=df_key["weight"])[0]
+        # `numpy.histogram()` last bin is closed
+        hist_ref[-1] -= df_key.loc[df_key["peak_size"] == size_bins[-1], "weight"].sum()
+        np.testing.assert_allclose(hist["value"], hist_ref)
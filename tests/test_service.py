@@ -0,0 +1,27 @@
+import asyncio
+
+from SMHviz_plot.service import FigureService, figure_request_key
+
+
+def test_request_key(proj_data, truth_data):
+    key = figure_request_key("make_scatter_plot", (proj_data, truth_data), {"intervals": [0.95]})
+    assert key == figure_request_key("make_scatter_plot", (proj_data.copy(), truth_data), {"intervals": [0.95]})
+    proj_data.loc[0, "value"] += 1
+    assert key != figure_request_key("make_scatter_plot", (proj_data, truth_data), {"intervals": [0.95]})
+
+
+def test_render_coalesced_and_cached(proj_data, truth_data):
+    async def render_all(service):
+        request = [service.render("make_scatter_plot", proj_data, truth_data, intervals=[0.95],
+                                  subplot_var="scenario_id") for _ in range(4)]
+        fig_json = await asyncio.gather(*request)
+        assert service.stats == {"hits": 0, "misses": 1, "coalesced": 3}
+        fig_json.append(await service.render("make_scatter_plot", proj_data, truth_data, intervals=[0.95],
+                                             subplot_var="scenario_id"))
+        assert service.stats == {"hits": 1, "misses": 1, "coalesced": 3}
+        return fig_json
+
+    with FigureService(max_workers=2, executor="thread") as service:
+        fig_json = asyncio.run(render_all(service))
+    assert len(set(fig_json)) == 1
+    assert len(service.cache) == 1
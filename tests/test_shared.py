@@ -0,0 +1,67 @@
+import concurrent.futures
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from SMHviz_plot.utils_data import df_from_shared, df_to_shared, shared_df
+
+
+def sample_frame():
+    df = pd.DataFrame({"value": np.linspace(0, 1, 6), "horizon": np.arange(6, dtype=np.int64),
+                       "is_ens": [True, False] * 3,
+                       "target_end_date": pd.date_range("2023-09-09", periods=6, freq="W-SAT"),
+                       "model_name": ["team1-model", "Ensemble", None, "team1-model", "a", "b"],
+                       "type": pd.Categorical(["quantile", "sample"] * 3, categories=["quantile", "sample", "mean"])},
+                      index=pd.Index(["01", "02", "04", "05", "06", "US"], name="location"))
+    return df
+
+
+def read_shared(handle):
+    df, shm = df_from_shared(handle)
+    try:
+        return df.copy()
+    finally:
+        del df
+        shm.close()
+
+
+def fail_shared(handle):
+    df, shm = df_from_shared(handle)
+    shm.close()
+    raise RuntimeError("worker failure")
+
+
+def test_shared_round_trip():
+    df = sample_frame()
+    handle, shm = df_to_shared(df)
+    try:
+        df_shared, shm_read = df_from_shared(handle)
+        pd.testing.assert_frame_equal(df_shared, df)
+        df_cat, shm_cat = df_from_shared(handle, categorical=True)
+        assert isinstance(df_cat["model_name"].dtype, pd.CategoricalDtype)
+        pd.testing.assert_series_equal(df_cat["model_name"].astype(df["model_name"].dtype).reset_index(drop=True),
+                                       df["model_name"].reset_index(drop=True))
+        del df_shared, df_cat
+        shm_read.close()
+        shm_cat.close()
+    finally:
+        shm.close()
+        shm.unlink()
+    # In a worker process
+    with shared_df({"df": df}) as shared_handle:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            df_worker = executor.submit(read_shared, shared_handle["df"]).result()
+    pd.testing.assert_frame_equal(df_worker, df)
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="POSIX shared memory directory required")
+def test_shared_removed_after_error():
+    with pytest.raises(RuntimeError):
+        with shared_df({"df": sample_frame(), "df2": sample_frame()}) as handle:
+            name = [i.name.lstrip("/") for i in handle.values()]
+            assert all(os.path.exists(os.path.join("/dev/shm", i)) for i in name)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                executor.submit(fail_shared, handle["df"]).result()
+    assert not any(os.path.exists(os.path.join("/dev/shm", i)) for i in name)
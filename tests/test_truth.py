@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from SMHviz_plot.utils_data import truth_epiweek, truth_slice, truth_store
+
+TRUTH_FILE = "data/US_inc_case.csv"
+
+
+def daily_truth(seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.MultiIndex.from_product([["inc case", "inc death"], ["01", "02", "06", "US"],
+                                     pd.date_range("2023-01-01", periods=60, freq="D")],
+                                    names=["target", "location", "time_idx"]).to_frame(index=False)
+    df["value"] = rng.poisson(50, len(df)).astype(float)
+    df.loc[rng.choice(len(df), 20, replace=False), "value"] = np.nan
+    # Missing days, unsorted rows and dates as strings
+    df = df.drop(rng.choice(len(df), 40, replace=False)).sample(frac=1, random_state=seed)
+    df["time_idx"] = df["time_idx"].dt.strftime("%Y-%m-%d")
+    return df.reset_index(drop=True)
+
+
+@pytest.mark.parametrize("source", ["csv", "frame"])
+def test_truth_store_same_as_filter(source):
+    truth = pd.read_csv(TRUTH_FILE, dtype={"location": str}) if source == "csv" else daily_truth()
+    store = truth_store(TRUTH_FILE if source == "csv" else truth, w_delay=[2])
+    truth["time_idx"] = pd.to_datetime(truth["time_idx"])
+    for target in truth["target"].unique():
+        for location in list(truth["location"].unique()) + ["99"]:
+            # Reference: filter and sort the full data at each call
+            df_ref = truth[(truth["target"] == target) & (truth["location"] == location)]
+            df_ref = df_ref.sort_values("time_idx", kind="stable")
+            df_slice = truth_slice(store, target, location)
+            assert df_slice["location"].tolist() == [location] * len(df_ref)
+            assert df_slice["time_idx"].tolist() == df_ref["time_idx"].tolist()
+            np.testing.assert_array_equal(df_slice["value"].to_numpy(float), df_ref["value"].to_numpy(float))
+            # Reference `w_delay` split of `make_scatter_plot()`
+            for w_delay in [2, 5]:
+                before, after = truth_slice(store, target, location, w_delay=w_delay)
+                if len(df_ref) > 0:
+                    limit = df_ref["time_idx"].max() - timedelta(weeks=w_delay)
+                    assert before["time_idx"].tolist() == df_ref[df_ref["time_idx"] <= limit]["time_idx"].tolist()
+                    assert after["time_idx"].tolist() == df_ref[df_ref["time_idx"] > limit]["time_idx"].tolist()
+                else:
+                    assert len(before) == len(after) == 0
+
+
+def epiweek_loop(df, rolling):
+    # Reference: one location at a time, one row at a time
+    output = list()
+    for (target, location), df_loc in df.groupby(["target", "location"]):
+        week = dict()
+        for date, value in zip(pd.to_datetime(df_loc["time_idx"]), df_loc["value"]):
+            week_end = date + timedelta(days=(5 - date.weekday()) % 7)
+            week.setdefault(week_end, list()).append(value)
+        for week_end in sorted(week):
+            value = [i for i in week[week_end] if not np.isnan(i)]
+            row = {"target": target, "location": location, "time_value": week_end,
+                   "value": sum(value) if value else np.nan, "min": min(value) if value else np.nan,
+                   "max": max(value) if value else np.nan, "n_day": len(value)}
+            window = [week_end - timedelta(weeks=i) for i in range(rolling)]
+            window = [sum(j for j in week.get(i, [np.nan]) if not np.isnan(j))
+                      if any(not np.isnan(j) for j in week.get(i, [np.nan])) else np.nan for i in window]
+            row["rolling"] = np.nan if np.isnan(window).any() else np.mean(window)
+            output.append(row)
+    return pd.DataFrame(output)
+
+
+@pytest.mark.parametrize("rolling", [1, 3])
+def test_truth_epiweek_same_as_loop(rolling):
+    df = daily_truth()
+    # One week without value
+    df.loc[(df["location"] == "06") & df["time_idx"].between("2023-01-15", "2023-01-21"), "value"] = np.nan
+    df_week = truth_epiweek(df, rolling=rolling)
+    df_ref = epiweek_loop(df, rolling)
+    assert df_week[["target", "location"]].values.tolist() == df_ref[["target", "location"]].values.tolist()
+    assert df_week["time_value"].tolist() == df_ref["time_value"].tolist()
+    assert (df_week["time_value"].dt.weekday == 5).all()
+    for col in ["value", "min", "max", "n_day", "rolling"]:
+        np.testing.assert_allclose(df_week[col].to_numpy(float), df_ref[col].to_numpy(float))
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from SMHviz_plot.utils_data import spatiotemporal_wave_data
+
+LOCATION = ["01", "02", "04", "05", "06", "08", "09", "10", "US"]
+
+
+def wave_proj(seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.MultiIndex.from_product([["A", "B"], ["inc hosp"], LOCATION, ["Ensemble"], range(1, 13), [0.25, 0.5]],
+                                    names=["scenario_id", "target", "location", "model_name", "horizon",
+                                           "type_id"]).to_frame(index=False)
+    df["target_end_date"] = pd.Timestamp("2023-09-09") + pd.to_timedelta(7 * (df["horizon"] - 1), unit="D")
+    peak_week = dict(zip(LOCATION, rng.integers(2, 11, len(LOCATION))))
+    size = dict(zip(LOCATION, rng.integers(5, 100, len(LOCATION))))
+    # Integer values: ties on the peak
+    df["value"] = np.round(df["location"].map(size) * np.exp(-(df["horizon"] - df["location"].map(peak_week)) ** 2 /
+                                                             8) + rng.normal(0, 2, len(df)))
+    df.loc[rng.choice(len(df), 20, replace=False), "value"] = np.nan
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("threshold", [None, 30])
+@pytest.mark.parametrize("sort_scenario", [None, "B"])
+def test_wave_same_as_loop(threshold, sort_scenario):
+    df = wave_proj()
+    population = pd.DataFrame({"location": LOCATION, "population": np.linspace(1e6, 9e6, len(LOCATION))})
+    wave = spatiotemporal_wave_data(df, population=population, threshold=threshold, per_capita=1e6,
+                                    normalize=True, sort_scenario=sort_scenario)
+    # Reference: one location at a time
+    output = list()
+    data = dict()
+    for (scenario, location), df_loc in df[(df["type_id"] == 0.5) & (df["location"] != "US")].groupby(
+            ["scenario_id", "location"]):
+        df_loc = df_loc.sort_values("target_end_date")
+        pop = population.set_index("location").loc[location, "population"]
+        date = df_loc["target_end_date"].to_numpy()
+        value = df_loc["value"].to_numpy() * 1e6 / pop
+        peak = int(np.nanargmax(value))
+        thres = threshold if threshold is not None else 0.5 * value[peak]
+        onset = [i for i in range(len(value)) if value[i] >= thres]
+        decline = [i for i in range(peak + 1, len(value)) if value[i] < thres]
+        output.append({"scenario_id": scenario, "location": location, "onset": date[onset[0]] if onset else pd.NaT,
+                       "peak": date[peak], "decline": date[decline[0]] if onset and decline else pd.NaT,
+                       "peak_value": value[peak]})
+        data[(scenario, location)] = [date[~np.isnan(value)], value[~np.isnan(value)] / value[peak]]
+    df_ref = pd.DataFrame(output)
+    df_wave = wave["wave"].sort_values(["scenario_id", "location"]).reset_index(drop=True)
+    for col in ["scenario_id", "location", "onset", "peak", "decline"]:
+        assert df_wave[col].tolist() == df_ref[col].tolist(), col
+    np.testing.assert_allclose(df_wave["peak_value"], df_ref["peak_value"])
+    # Location order: onset (missing last), peak and location, of `sort_scenario` if not None
+    for scenario in ["A", "B"]:
+        df_order = df_ref[df_ref["scenario_id"] == (scenario if sort_scenario is None else sort_scenario)]
+        order = df_order.sort_values(["onset", "peak", "location"], na_position="last")["location"].tolist()
+        assert wave["order"][(scenario, "inc hosp", "Ensemble")] == order
+        df_data = wave["data"][wave["data"]["scenario_id"] == scenario]
+        assert list(dict.fromkeys(df_data["location"])) == order
+        for location in order:
+            df_data_loc = df_data[df_data["location"] == location]
+            assert df_data_loc["target_end_date"].tolist() == list(data[(scenario, location)][0])
+            np.testing.assert_allclose(df_data_loc["value"], data[(scenario, location)][1])